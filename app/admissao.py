@@ -0,0 +1,125 @@
+"""Controle de admissão da API: recusa notificações quando o pipeline não acompanha.
+
+As verificações usam apenas valores já em memória (a última amostragem de
+profundidade das filas, o total de notificações em andamento lido com cache e
+o estado de bloqueio das conexões de publicação), então não custam uma ida ao
+broker por requisição. Limites iguais a 0 ficam desligados.
+"""
+import math
+import threading
+import time
+from . import metricas
+
+
+class AdmissaoRecusada(Exception):
+    """A notificação não foi admitida; o cliente deve tentar de novo após retry_after segundos"""
+
+    def __init__(self, motivo, mensagem, retry_after, codigo=429):
+        super().__init__(mensagem)
+        self.motivo = motivo
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.codigo = codigo
+
+
+class BaldeTokens:
+    """Token bucket: repõe taxa tokens por segundo, acumulando até capacidade"""
+
+    def __init__(self, taxa, capacidade=None, relogio=time.monotonic):
+        self.taxa = taxa
+        # Com taxa abaixo de 1/s e sem rajada, um balde menor que 1 token nunca atenderia
+        self.capacidade = max(1, capacidade or taxa)
+        self._relogio = relogio
+        self._tokens = self.capacidade
+        self._atualizado_em = relogio()
+        self._lock = threading.Lock()
+
+    def retirar(self, quantidade=1):
+        """Retira os tokens e devolve 0; sem saldo, não retira nada e devolve a espera (s)"""
+        with self._lock:
+            agora = self._relogio()
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado_em) * self.taxa)
+            self._atualizado_em = agora
+            if self._tokens >= quantidade:
+                self._tokens -= quantidade
+                return 0
+            return (quantidade - self._tokens) / self.taxa
+
+
+class ControleAdmissao:
+    """Decide se a API aceita novas notificações.
+
+    - bloqueado: callable que indica se o broker bloqueou as conexões de
+      publicação (connection.blocked, alarme de memória ou disco); responde 503
+    - amostrador: AmostradorFilas cujas profundidades são somadas e comparadas
+      a max_fila; amostras mais velhas que validade_amostra são ignoradas
+    - em_andamento: callable com o total de notificações sem status final,
+      relido no máximo a cada intervalo_em_andamento segundos
+    - taxas: limite de notificações por segundo por tipoNotificacao, com
+      rajada opcional (capacidade do balde)
+    """
+
+    def __init__(self, amostrador=None, filas=(), max_fila=0, em_andamento=None, max_em_andamento=0,
+                 taxas=None, rajadas=None, bloqueado=None, retry_after=5, validade_amostra=60,
+                 intervalo_em_andamento=1, relogio=time.monotonic):
+        self.amostrador = amostrador
+        self.filas = list(filas)
+        self.max_fila = max_fila
+        self.em_andamento = em_andamento
+        self.max_em_andamento = max_em_andamento
+        self.bloqueado = bloqueado
+        self.retry_after = retry_after
+        self.validade_amostra = validade_amostra
+        self.intervalo_em_andamento = intervalo_em_andamento
+        self._relogio = relogio
+        self._em_andamento = (0, None)
+        rajadas = rajadas or {}
+        self.baldes = {
+            tipo: BaldeTokens(taxa, rajadas.get(tipo), relogio)
+            for tipo, taxa in (taxas or {}).items() if taxa > 0
+        }
+
+    def backlog(self):
+        """Mensagens nas filas monitoradas segundo a última amostra, ou None se não há amostra recente"""
+        if self.amostrador is None or self.amostrador.amostrado_em is None:
+            return None
+        if self._relogio() - self.amostrador.amostrado_em > self.validade_amostra:
+            return None
+        profundidades = self.amostrador.profundidades
+        return sum(profundidades.get(fila, 0) for fila in self.filas)
+
+    def _contar_em_andamento(self):
+        agora = self._relogio()
+        total, lido_em = self._em_andamento
+        if lido_em is None or agora - lido_em >= self.intervalo_em_andamento:
+            total = self.em_andamento()
+            self._em_andamento = (total, agora)
+        return total
+
+    def verificar_pipeline(self):
+        """Levanta AdmissaoRecusada se o broker está bloqueado ou o pipeline acima das marcas"""
+        if self.bloqueado is not None and self.bloqueado():
+            self._recusar("broker_bloqueado", "Broker bloqueou a publicação (recursos esgotados)",
+                          self.retry_after, codigo=503)
+
+        if self.max_fila:
+            backlog = self.backlog()
+            if backlog is not None and backlog >= self.max_fila:
+                self._recusar("fila", f"Pipeline com {backlog} mensagens na fila", self.retry_after)
+
+        if self.max_em_andamento and self.em_andamento is not None:
+            total = self._contar_em_andamento()
+            if total >= self.max_em_andamento:
+                self._recusar("em_andamento", f"{total} notificações em andamento", self.retry_after)
+
+    def verificar_taxa(self, tipo, quantidade=1):
+        """Consome quantidade tokens do tipo ou levanta AdmissaoRecusada com a espera necessária"""
+        balde = self.baldes.get(tipo)
+        if balde is None:
+            return
+        espera = balde.retirar(quantidade)
+        if espera:
+            self._recusar("taxa", f"Limite de taxa de {tipo} excedido", espera)
+
+    def _recusar(self, motivo, mensagem, retry_after, codigo=429):
+        metricas.RECUSADAS_ADMISSAO.labels(motivo).inc()
+        raise AdmissaoRecusada(motivo, mensagem, retry_after, codigo)
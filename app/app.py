@@ -1,113 +1,653 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from functools import wraps
 from uuid import UUID, uuid4
 import json
-import threading
 import time
 from pika import BasicProperties
-from .rabbitmq import RabbitMQConnection
-from .consumers import notificacoes_status, iniciar_consumidores
+from pika.exceptions import ConnectionBlockedTimeout
+from pydantic import ValidationError
+from .models import NotificacaoRequest
+from .rabbitmq import RabbitMQConnection, PoolPublicacao, PublicadorAssincrono, ConfirmacaoTimeout
+from .nos_broker import DistribuidorNos
+from .consumers import notificacoes_status, FILAS_ATRASO
+from .consumers import consultar_status as buscar_status, acompanhar_status
+from .consumers import consultar_status_lote, buscar_por_mensagem
+from .consumers import reservar_mensagem, liberar_mensagem, arquivo_dlq
+from .reenvio_dlq import ReenviadorDLQ
+from .supervisor import SupervisorConsumidores
+from .admissao import ControleAdmissao, AdmissaoRecusada
+from .status_store import NOMES_STATUS_FINAIS
+from .codec import obter_codec
+from . import config, metricas, rastreio
 
 app = Flask(__name__)
 
-consumidores_iniciados = False
-consumidores_lock = threading.Lock()
+codec_publicacao = obter_codec(config.CODEC)
 
-def start_consumers():
-    print("Iniciando consumidores RabbitMQ...")
-    iniciar_consumidores()
+# Os dois publicadores compartilham o anel e o registro de nós que falharam
+distribuidor_nos = DistribuidorNos(config.BROKER_NOS, espera_falha=config.BROKER_FALHA_ESPERA)
 
-@app.before_request
-def before_request():
-    global consumidores_iniciados
-    with consumidores_lock:
-        if not consumidores_iniciados:
-            consumer_thread = threading.Thread(target=start_consumers, daemon=True)
-            consumer_thread.start()
-            consumidores_iniciados = True
-            print("Consumidores RabbitMQ agendados para iniciar")
+pool_publicacao = PoolPublicacao(
+    tamanho=config.PUBLICADOR_POOL_TAMANHO,
+    timeout=config.PUBLICADOR_POOL_TIMEOUT,
+    verificar_apos=config.PUBLICADOR_VERIFICAR_APOS,
+    confirmacoes=config.PUBLICADOR_CONFIRMACOES,
+    distribuidor=distribuidor_nos
+)
+
+# Publicação do front end ASGI (app/asgi.py); a thread só sobe na primeira publicação
+publicador_assincrono = PublicadorAssincrono(
+    confirmacoes=config.PUBLICADOR_CONFIRMACOES,
+    distribuidor=distribuidor_nos
+)
+
+amostrador_filas = metricas.AmostradorFilas(
+    lambda no=0: RabbitMQConnection.get_connection("metricas", no).channel(),
+    [config.FILA_ENTRADA, config.FILA_RETRY, *config.FILAS_VALIDACAO.values(), config.FILA_DLQ] + FILAS_ATRASO
+    + [config.FILA_DLQ_ESTACIONAMENTO] + ([config.FILA_VALIDACAO] if config.VALIDACAO_LEGADO_DRENAR else []),
+    intervalo=config.METRICAS_INTERVALO_FILAS,
+    nos=len(config.BROKER_NOS)
+)
+
+controle_admissao = ControleAdmissao(
+    amostrador=amostrador_filas,
+    filas=[config.FILA_ENTRADA, config.FILA_RETRY, *config.FILAS_VALIDACAO.values()],
+    max_fila=config.ADMISSAO_MAX_FILA,
+    em_andamento=notificacoes_status.em_andamento,
+    max_em_andamento=config.ADMISSAO_MAX_EM_ANDAMENTO,
+    taxas=config.ADMISSAO_TAXAS,
+    rajadas=config.ADMISSAO_RAJADAS,
+    bloqueado=lambda: pool_publicacao.bloqueado() or publicador_assincrono.bloqueado,
+    retry_after=config.ADMISSAO_RETRY_AFTER,
+    validade_amostra=3 * config.METRICAS_INTERVALO_FILAS
+)
+
+reenviador_dlq = ReenviadorDLQ(
+    pool_publicacao,
+    taxa_maxima=config.DLQ_REENVIO_TAXA,
+    max_itens=config.DLQ_REENVIO_MAX_ITENS,
+    timeout=config.PUBLICADOR_TIMEOUT_CONFIRMACAO
+)
+
+supervisor = SupervisorConsumidores()
+
+def iniciar_supervisor():
+    """Sobe os consumidores e a amostragem de filas no boot do processo (ver wsgi.py).
+
+    Com API_CONSUMIDORES=0 os estágios rodam em python -m app.worker e aqui só
+    sobe a amostragem de filas.
+    """
+    amostrador_filas.iniciar()
+    if not config.API_CONSUMIDORES:
+        print("Consumidores desativados na API (API_CONSUMIDORES=0)")
+        return
+    print(f"Iniciando consumidores RabbitMQ (motor: {config.MOTOR_CONSUMIDORES})...")
+    supervisor.iniciar()
+
+def medir_duracao(endpoint):
+    """Registra a duração da view no histograma da API, por código de resposta"""
+    def decorador(view):
+        @wraps(view)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            resposta = view(*args, **kwargs)
+            codigo = resposta[1] if isinstance(resposta, tuple) else 200
+            metricas.API_DURACAO.labels(endpoint, str(codigo)).observe(time.perf_counter() - inicio)
+            return resposta
+        return medida
+    return decorador
+
+def _resposta_recusa(erro):
+    """429/503 com Retry-After para recusas do controle de admissão"""
+    return {'error': str(erro), 'motivo': erro.motivo, 'retryAfter': erro.retry_after}, \
+        erro.codigo, {'Retry-After': str(erro.retry_after)}
+
+def _json(resposta):
+    """(corpo, código, headers) dos helpers compartilhados com o front end ASGI como resposta Flask"""
+    corpo, codigo, headers = resposta
+    return jsonify(corpo), codigo, headers
+
+def preparar_notificacao(data):
+    """Valida, admite e registra como RECEBIDO uma notificação de POST /api/notificar.
+
+    Devolve (resposta, None) quando a requisição termina aqui (dados inválidos,
+    recusa da admissão ou mensagemId repetido) ou (None, publicacao), com
+    publicacao = (mensagem_id, trace_id, corpo, properties) a publicar na
+    entrada. Compartilhado entre a view Flask e o front end ASGI.
+    """
+    if not data or 'conteudoMensagem' not in data or 'tipoNotificacao' not in data:
+        return ({'error': 'Dados inválidos'}, 400, {}), None
+
+    conteudo_mensagem = data['conteudoMensagem']
+    tipo_notificacao = data['tipoNotificacao']
+    mensagem_id = UUID(data.get('mensagemId', str(uuid4())))
+
+    if tipo_notificacao not in ['EMAIL', 'SMS', 'PUSH']:
+        return ({'error': 'Tipo de notificação inválido'}, 400, {}), None
+
+    prioridade = data.get('prioridade')
+    if prioridade is not None and (not isinstance(prioridade, int) or not 0 <= prioridade <= 255):
+        return ({'error': 'Prioridade inválida'}, 400, {}), None
+
+    destinatario = data.get('destinatario')
+    if destinatario is not None and not isinstance(destinatario, str):
+        return ({'error': 'Destinatário inválido'}, 400, {}), None
+
+    trace_id = uuid4()
+
+    # Reenvio do mesmo mensagemId (ex.: retry do cliente após timeout) não publica de
+    # novo e recebe o traceId original mesmo com a admissão recusando novas notificações
+    if 'mensagemId' in data:
+        trace_original = reservar_mensagem(mensagem_id, trace_id)
+        if trace_original is not None:
+            metricas.DUPLICADAS.labels("api").inc()
+            return ({
+                'mensagemId': str(mensagem_id),
+                'traceId': str(trace_original)
+            }, 202, {}), None
+
+    try:
+        controle_admissao.verificar_pipeline()
+        controle_admissao.verificar_taxa(tipo_notificacao)
+    except AdmissaoRecusada as e:
+        if 'mensagemId' in data:
+            liberar_mensagem(mensagem_id, trace_id)
+        return _resposta_recusa(e), None
+
+    from .consumers import atualizar_status
+    atualizar_status(trace_id, "RECEBIDO", {
+        "mensagemId": str(mensagem_id),
+        "conteudoMensagem": conteudo_mensagem,
+        "tipoNotificacao": tipo_notificacao
+    })
+
+    dados = {
+        "traceId": str(trace_id),
+        "mensagemId": str(mensagem_id),
+        "conteudoMensagem": conteudo_mensagem,
+        "tipoNotificacao": tipo_notificacao
+    }
+    if destinatario:
+        dados["destinatario"] = destinatario
+
+    properties = BasicProperties(delivery_mode=2, content_type=codec_publicacao.content_type, priority=prioridade,
+                                 headers=rastreio.carimbar(span=rastreio.novo_span()))
+    return None, (mensagem_id, trace_id, codec_publicacao.codificar(dados), properties)
+
+def resposta_publicacao(mensagem_id, trace_id, confirmado=None, erro=None):
+    """Resposta de POST /api/notificar após a publicação; em falha libera o mensagemId para novo envio"""
+    if erro is None and confirmado is not False:
+        return {
+            'mensagemId': str(mensagem_id),
+            'traceId': str(trace_id)
+        }, 202, {}
+
+    liberar_mensagem(mensagem_id, trace_id)
+    if isinstance(erro, ConfirmacaoTimeout):
+        return {'error': 'Broker não confirmou a notificação a tempo'}, 504, {}
+    if isinstance(erro, ConnectionBlockedTimeout):
+        return _resposta_recusa(AdmissaoRecusada(
+            "broker_bloqueado", "Broker bloqueou a publicação (recursos esgotados)",
+            config.ADMISSAO_RETRY_AFTER, codigo=503
+        ))
+    if erro is not None:
+        return {'error': 'Erro interno ao processar notificação'}, 500, {}
+    return {'error': 'Notificação recusada pelo broker'}, 503, {}
 
 @app.route('/api/notificar', methods=['POST'])
+@medir_duracao("notificar")
 def enviar_notificacao():
     try:
-        data = request.get_json()
-        if not data or 'conteudoMensagem' not in data or 'tipoNotificacao' not in data:
-            return jsonify({'error': 'Dados inválidos'}), 400
-        
-        conteudo_mensagem = data['conteudoMensagem']
-        tipo_notificacao = data['tipoNotificacao']
-        mensagem_id = UUID(data.get('mensagemId', str(uuid4())))
-        
-        if tipo_notificacao not in ['EMAIL', 'SMS', 'PUSH']:
-            return jsonify({'error': 'Tipo de notificação inválido'}), 400
-        
-        trace_id = uuid4()
-        
-        from .consumers import atualizar_status
-        atualizar_status(trace_id, "RECEBIDO", {
-            "mensagemId": str(mensagem_id),
-            "conteudoMensagem": conteudo_mensagem,
-            "tipoNotificacao": tipo_notificacao
-        })
-        
-        dados = {
-            "traceId": str(trace_id),
-            "mensagemId": str(mensagem_id),
-            "conteudoMensagem": conteudo_mensagem,
-            "tipoNotificacao": tipo_notificacao
-        }
+        resposta, publicacao = preparar_notificacao(request.get_json())
+        if resposta is not None:
+            return _json(resposta)
 
+        mensagem_id, trace_id, corpo, properties = publicacao
+        aguardar_confirmacao = request.args.get('aguardarConfirmacao', '').lower() in ('1', 'true')
         try:
-            connection = RabbitMQConnection.get_connection("publisher")
-            channel = connection.channel()
-            channel.queue_declare(queue='fila.notificacao.entrada.NATHAN', durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key='fila.notificacao.entrada.NATHAN',
-                body=json.dumps(dados),
-                properties=BasicProperties(delivery_mode=2)
+            confirmado = pool_publicacao.publicar(
+                config.FILA_ENTRADA,
+                corpo,
+                properties,
+                aguardar_confirmacao=aguardar_confirmacao,
+                timeout=config.PUBLICADOR_TIMEOUT_CONFIRMACAO,
+                chave=str(trace_id)
             )
-            
-            connection.close()
-            
         except Exception as e:
-            return jsonify({'error': 'Erro interno ao processar notificação'}), 500
-        
-        
-        return jsonify({
-            'mensagemId': str(mensagem_id),
-            'traceId': str(trace_id)
-        }), 202
-        
+            return _json(resposta_publicacao(mensagem_id, trace_id, erro=e))
+
+        return _json(resposta_publicacao(mensagem_id, trace_id, confirmado))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/notificar/lote', methods=['POST'])
+@medir_duracao("notificar_lote")
+def enviar_notificacoes_lote():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'Envie uma lista de notificações'}), 400
+        if len(data) > config.LOTE_MAX_ITENS:
+            return jsonify({'error': f'Lote excede o limite de {config.LOTE_MAX_ITENS} notificações'}), 413
+
+        # A recusa do pipeline vale só para notificações novas: mensagemIds já aceitos
+        # ainda devolvem o traceId original
+        try:
+            controle_admissao.verificar_pipeline()
+            recusa_pipeline = None
+        except AdmissaoRecusada as e:
+            recusa_pipeline = e
+
+        resultados = [None] * len(data)
+        aceitos = []
+        limitados = []
+        for indice, item in enumerate(data):
+            try:
+                notificacao = NotificacaoRequest(**item)
+            except (ValidationError, TypeError) as e:
+                resultados[indice] = {'indice': indice, 'error': _descrever_erro_validacao(e)}
+                continue
+
+            trace_id = uuid4()
+            # Como no envio individual, só reserva o mensagemId enviado pelo cliente
+            reservado = 'mensagemId' in notificacao.model_fields_set
+            if reservado:
+                trace_original = reservar_mensagem(notificacao.mensagemId, trace_id)
+                if trace_original is not None:
+                    metricas.DUPLICADAS.labels("api").inc()
+                    resultados[indice] = {
+                        'mensagemId': str(notificacao.mensagemId),
+                        'traceId': str(trace_original)
+                    }
+                    continue
+
+            try:
+                if recusa_pipeline is not None:
+                    raise recusa_pipeline
+                controle_admissao.verificar_taxa(notificacao.tipoNotificacao)
+            except AdmissaoRecusada as e:
+                if reservado:
+                    liberar_mensagem(notificacao.mensagemId, trace_id)
+                resultados[indice] = {'indice': indice, 'error': str(e), 'retryAfter': e.retry_after}
+                limitados.append(e)
+                continue
+
+            mensagem_id = notificacao.mensagemId or uuid4()
+            dados = {
+                "mensagemId": str(mensagem_id),
+                "conteudoMensagem": notificacao.conteudoMensagem,
+                "tipoNotificacao": notificacao.tipoNotificacao
+            }
+            if notificacao.destinatario:
+                dados["destinatario"] = notificacao.destinatario
+            aceitos.append((indice, trace_id, notificacao.prioridade, dados))
+
+        if not aceitos:
+            if any('traceId' in resultado for resultado in resultados):
+                return jsonify({'resultados': resultados}), 202
+            if recusa_pipeline is not None:
+                return _json(_resposta_recusa(recusa_pipeline))
+            if limitados:
+                retry_after = min(erro.retry_after for erro in limitados)
+                return jsonify({'resultados': resultados}), 429, {'Retry-After': str(retry_after)}
+            return jsonify({'resultados': resultados}), 400
+
+        from .consumers import atualizar_status_lote
+        atualizar_status_lote([(trace_id, "RECEBIDO", dados) for _, trace_id, _, dados in aceitos])
+
+        corpos = [
+            codec_publicacao.codificar({"traceId": str(trace_id), **dados})
+            for _, trace_id, _, dados in aceitos
+        ]
+        propriedades = [
+            BasicProperties(delivery_mode=2, content_type=codec_publicacao.content_type, priority=prioridade,
+                            headers=rastreio.carimbar(span=rastreio.novo_span()))
+            for _, _, prioridade, _ in aceitos
+        ]
+        erro_publicacao = 'Erro interno ao processar notificação'
+        try:
+            confirmacoes = pool_publicacao.publicar_lote(
+                config.FILA_ENTRADA,
+                corpos,
+                propriedades,
+                timeout=config.LOTE_TIMEOUT_CONFIRMACAO,
+                chaves=[str(trace_id) for _, trace_id, _, _ in aceitos]
+            )
+        except ConnectionBlockedTimeout:
+            confirmacoes = [None] * len(aceitos)
+            erro_publicacao = 'Broker bloqueou a publicação (recursos esgotados)'
+        except Exception:
+            confirmacoes = [None] * len(aceitos)
+
+        for (indice, trace_id, _, dados), confirmado in zip(aceitos, confirmacoes):
+            if confirmado:
+                resultados[indice] = {'mensagemId': dados['mensagemId'], 'traceId': str(trace_id)}
+                continue
+            liberar_mensagem(UUID(dados['mensagemId']), trace_id)
+            if confirmado is False:
+                resultados[indice] = {'indice': indice, 'error': 'Notificação recusada pelo broker'}
+            else:
+                resultados[indice] = {'indice': indice, 'error': erro_publicacao}
+
+        return jsonify({'resultados': resultados}), 202
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _descrever_erro_validacao(erro):
+    if isinstance(erro, ValidationError):
+        return '; '.join(
+            f"{'.'.join(str(parte) for parte in detalhe['loc'])}: {detalhe['msg']}"
+            for detalhe in erro.errors()
+        )
+    return 'Dados inválidos'
+
+@app.route('/api/notificacao/status', methods=['GET'])
+def consultar_status_por_mensagem():
+    """Todas as notificações geradas com ?mensagemId=, com projeção opcional por ?campos="""
+    try:
+        mensagem_id = UUID(request.args.get('mensagemId', ''))
+    except ValueError:
+        return jsonify({'error': 'mensagemId inválido'}), 400
+    try:
+        campos = _campos_status(request.args.get('campos'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    encontrados = buscar_por_mensagem(mensagem_id)
+    if not encontrados:
+        return jsonify({'error': 'Notificação não encontrada'}), 404
+    return jsonify({'resultados': [_formatar_status(dados, campos) for dados in encontrados]})
+
+@app.route('/api/notificacao/status/lote', methods=['POST'])
+@medir_duracao("status_lote")
+def consultar_status_em_lote():
+    """Resolve muitos traceIds e/ou mensagemIds numa requisição.
+
+    Corpo: {"traceIds": [...], "mensagemIds": [...], "campos": [...]}. Os
+    identificadores sem notificação voltam em naoEncontrados e os malformados
+    em invalidos; campos limita os campos de cada resultado.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Envie um objeto com traceIds e/ou mensagemIds'}), 400
+    trace_ids = data.get('traceIds') or []
+    mensagem_ids = data.get('mensagemIds') or []
+    if not isinstance(trace_ids, list) or not isinstance(mensagem_ids, list) or not (trace_ids or mensagem_ids):
+        return jsonify({'error': 'Envie um objeto com traceIds e/ou mensagemIds'}), 400
+    if len(trace_ids) + len(mensagem_ids) > config.STATUS_LOTE_MAX_ITENS:
+        return jsonify({'error': f'Consulta excede o limite de {config.STATUS_LOTE_MAX_ITENS} identificadores'}), 413
+    try:
+        campos = _campos_status(data.get('campos'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    invalidos = []
+
+    def validar(identificadores):
+        uuids = []
+        for identificador in identificadores:
+            try:
+                uuids.append(UUID(str(identificador)))
+            except ValueError:
+                invalidos.append(identificador)
+        return uuids
+
+    trace_uuids = validar(trace_ids)
+    encontrados = consultar_status_lote(trace_uuids)
+    vistos = {dados['traceId'] for dados in encontrados}
+    nao_encontrados = [str(trace_id) for trace_id in trace_uuids if trace_id not in vistos]
+    for mensagem_id in validar(mensagem_ids):
+        da_mensagem = [dados for dados in buscar_por_mensagem(mensagem_id) if dados['traceId'] not in vistos]
+        if not da_mensagem:
+            nao_encontrados.append(str(mensagem_id))
+        vistos.update(dados['traceId'] for dados in da_mensagem)
+        encontrados.extend(da_mensagem)
+
+    return jsonify({
+        'resultados': [_formatar_status(dados, campos) for dados in encontrados],
+        'naoEncontrados': nao_encontrados,
+        'invalidos': invalidos
+    })
+
+def resposta_status(trace_id, args):
+    """(corpo, código) de GET /api/notificacao/status/<trace_id>; com ?wait= bloqueia no long-poll.
+
+    args é o MultiDict da query string. Compartilhado com o front end ASGI.
+    """
+    try:
+        campos = _campos_status(args.get('campos'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    try:
+        trace_uuid = UUID(trace_id)
+        dados = buscar_status(trace_uuid)
+        if dados is None:
+            return {'error': 'Notificação não encontrada'}, 404
+
+        espera = args.get('wait', type=float)
+        if espera and espera > 0:
+            # Long-poll: responde na primeira mudança após a versão conhecida pelo cliente
+            versao = args.get('versao', len(dados['historico']), type=int)
+            espera = min(espera, config.STATUS_ESPERA_MAX)
+            dados = next(acompanhar_status(trace_uuid, versao, espera), dados)
+
+        return _formatar_status(dados, campos), 200
+
+    except ValueError:
+        return {'error': 'TraceId inválido'}, 400
+    except Exception as e:
+        return {'error': str(e)}, 500
+
 @app.route('/api/notificacao/status/<trace_id>', methods=['GET'])
 def consultar_status(trace_id):
+    corpo, codigo = resposta_status(trace_id, request.args)
+    return jsonify(corpo), codigo
+
+@app.route('/api/notificacao/status/<trace_id>/stream', methods=['GET'])
+def acompanhar_status_stream(trace_id):
+    """Server-Sent Events: um evento por transição do historico, até um status final.
+
+    O id de cada evento é a posição no historico; ao reconectar, Last-Event-ID
+    (ou ?versao=) retoma a partir da transição seguinte.
+    """
     try:
         trace_uuid = UUID(trace_id)
-        if trace_uuid not in notificacoes_status:
-            return jsonify({'error': 'Notificação não encontrada'}), 404
-        
-        dados = notificacoes_status[trace_uuid]
-        return jsonify({
-            'traceId': str(dados.get('traceId')),
-            'mensagemId': str(dados.get('mensagemId')),
-            'conteudoMensagem': dados.get('conteudoMensagem'),
-            'tipoNotificacao': dados.get('tipoNotificacao'),
-            'status': dados.get('status'),
-            'historico': dados.get('historico')
-        })
-        
     except ValueError:
         return jsonify({'error': 'TraceId inválido'}), 400
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    if buscar_status(trace_uuid) is None:
+        return jsonify({'error': 'Notificação não encontrada'}), 404
+
+    versao = request.headers.get('Last-Event-ID', request.args.get('versao', 0, type=int), type=int)
+
+    def eventos():
+        enviados = versao
+        for dados in acompanhar_status(trace_uuid, versao, config.STATUS_STREAM_MAX,
+                                       pulso=config.STATUS_STREAM_KEEPALIVE):
+            if dados is None:
+                yield ": keepalive\n\n"
+                continue
+            for indice in range(enviados, len(dados['historico'])):
+                evento = json.dumps({
+                    'traceId': str(trace_uuid),
+                    'status': dados['historico'][indice],
+                    'final': indice == len(dados['historico']) - 1 and dados['status'] in NOMES_STATUS_FINAIS
+                })
+                yield f"id: {indice + 1}\nevent: status\ndata: {evento}\n\n"
+            enviados = len(dados['historico'])
+
+    return Response(eventos(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+CAMPOS_STATUS = ('traceId', 'mensagemId', 'conteudoMensagem', 'tipoNotificacao', 'status', 'historico', 'etapas')
+
+def _campos_status(valor):
+    """Projeção pedida (lista ou texto separado por vírgulas); None devolve todos os campos"""
+    if not valor:
+        return None
+    campos = valor.split(',') if isinstance(valor, str) else valor
+    desconhecidos = [campo for campo in campos if campo not in CAMPOS_STATUS]
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos: {', '.join(map(str, desconhecidos))}")
+    return campos
+
+def _formatar_status(dados, campos=None):
+    formatado = {
+        'traceId': str(dados.get('traceId')),
+        'mensagemId': str(dados.get('mensagemId')),
+        'conteudoMensagem': dados.get('conteudoMensagem'),
+        'tipoNotificacao': dados.get('tipoNotificacao'),
+        'status': dados.get('status'),
+        'historico': dados.get('historico'),
+        'etapas': dados.get('etapas', [])
+    }
+    if campos is None:
+        return formatado
+    return {campo: formatado[campo] for campo in campos}
+
+def _filtros_dlq(origem):
+    """Filtros de consulta do arquivo da DLQ (query string ou corpo JSON); ValueError se inválidos"""
+    filtros = {}
+    for campo, chave in (('tipo', 'tipoNotificacao'), ('motivo', 'motivo'), ('estagio', 'estagio')):
+        if origem.get(chave) is not None:
+            filtros[campo] = str(origem[chave])
+    for campo in ('desde', 'ate'):
+        if origem.get(campo) is not None:
+            filtros[campo] = float(origem[campo])
+    return filtros
+
+def _formatar_dlq(registro):
+    return {
+        'traceId': registro['trace_id'],
+        'mensagemId': registro['mensagem_id'],
+        'tipoNotificacao': registro['tipo'],
+        'motivo': registro['motivo'],
+        'estagio': registro['estagio'],
+        'tentativas': registro['tentativas'],
+        'falhas': registro['falhas'],
+        'reenvios': registro['reenvios'],
+        'arquivadoEm': registro['arquivado_em'],
+        'reenviadoEm': registro['reenviado_em'],
+        'dados': registro['dados']
+    }
+
+@app.route('/api/dlq', methods=['GET'])
+def listar_dlq():
+    """Notificações arquivadas pela DLQ, em ordem de arquivamento.
+
+    Filtros: tipoNotificacao, motivo, estagio, desde/ate (epoch em segundos) e
+    pendentes (true: ainda não reenviadas); paginação por limite e deslocamento.
+    """
+    try:
+        filtros = _filtros_dlq(request.args)
+        pendentes = request.args.get('pendentes')
+        if pendentes is not None:
+            filtros['pendentes'] = pendentes.lower() in ('1', 'true')
+        limite = min(request.args.get('limite', 100, type=int), 1000)
+        deslocamento = request.args.get('deslocamento', 0, type=int)
+    except ValueError:
+        return jsonify({'error': 'Filtros inválidos'}), 400
+    registros = arquivo_dlq.consultar(limite=limite, deslocamento=deslocamento, **filtros)
+    return jsonify({
+        'total': arquivo_dlq.contar(**filtros),
+        'itens': [_formatar_dlq(registro) for registro in registros]
+    })
+
+@app.route('/api/dlq/resumo', methods=['GET'])
+def resumir_dlq():
+    """Notificações ainda não reenviadas, agrupadas por tipo, motivo e estágio"""
+    return jsonify({'grupos': [
+        {'tipoNotificacao': grupo['tipo'], 'motivo': grupo['motivo'], 'estagio': grupo['estagio'],
+         'quantidade': grupo['quantidade']}
+        for grupo in arquivo_dlq.resumo()
+    ]})
+
+@app.route('/api/dlq/<trace_id>', methods=['GET'])
+def obter_dlq(trace_id):
+    try:
+        registro = arquivo_dlq.obter(UUID(trace_id))
+    except ValueError:
+        return jsonify({'error': 'TraceId inválido'}), 400
+    if registro is None:
+        return jsonify({'error': 'Notificação não encontrada na DLQ'}), 404
+    return jsonify(_formatar_dlq(registro))
+
+@app.route('/api/dlq/reenvio', methods=['POST'])
+def reenviar_dlq():
+    """Agenda o reenvio das notificações pendentes selecionadas de volta à validação.
+
+    Aceita os filtros de GET /api/dlq ou uma lista de traceIds, além de limite e
+    taxa (notificações/s, até DLQ_REENVIO_TAXA). Responde 202 com o pedido, cujo
+    progresso fica em GET /api/dlq/reenvio/<id>.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        filtros = _filtros_dlq(data)
+        if data.get('traceIds') is not None:
+            if not isinstance(data['traceIds'], list):
+                raise TypeError()
+            if len(data['traceIds']) > config.DLQ_REENVIO_MAX_ITENS:
+                return jsonify({'error': f'Envie no máximo {config.DLQ_REENVIO_MAX_ITENS} traceIds'}), 400
+            filtros['trace_ids'] = [str(UUID(str(trace_id))) for trace_id in data['traceIds']]
+        limite = int(data['limite']) if data.get('limite') is not None else None
+        taxa = float(data['taxa']) if data.get('taxa') is not None else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Filtros inválidos'}), 400
+    if (limite is not None and limite <= 0) or (taxa is not None and taxa <= 0):
+        return jsonify({'error': 'limite e taxa devem ser positivos'}), 400
+    reenvio = reenviador_dlq.agendar(limite=limite, taxa=taxa, **filtros)
+    return jsonify(reenvio.como_dict()), 202
+
+@app.route('/api/dlq/reenvio/<reenvio_id>', methods=['GET', 'DELETE'])
+def acompanhar_reenvio_dlq(reenvio_id):
+    """Progresso do reenvio; DELETE cancela antes do próximo lote"""
+    if request.method == 'DELETE':
+        reenvio = reenviador_dlq.cancelar(reenvio_id)
+    else:
+        reenvio = reenviador_dlq.obter(reenvio_id)
+    if reenvio is None:
+        return jsonify({'error': 'Reenvio não encontrado'}), 404
+    return jsonify(reenvio.como_dict())
+
+@app.route('/api/metricas/estagios', methods=['GET'])
+def latencias_estagios():
+    """Percentis de espera na fila e de processamento por estágio, nas últimas amostras deste processo.
+
+    gargalo é o estágio com o maior p90 de espera mais processamento.
+    """
+    estagios = metricas.LATENCIAS_ESTAGIOS.resumo()
+
+    def p90_total(resumo):
+        return sum((resumo[medida] or {}).get('p90', 0) for medida in ('esperaFila', 'processamento'))
+
+    gargalo = max(estagios, key=lambda nome: p90_total(estagios[nome]), default=None)
+    return jsonify({'estagios': estagios, 'gargalo': gargalo})
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    return Response(metricas.registro.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'})
+    """Readiness: 200 quando todos os estágios deste processo estão consumindo.
+
+    Um processo só de API (supervisor não iniciado) não tem estágios a esperar.
+    """
+    if not supervisor.iniciado:
+        return jsonify({'status': 'healthy'})
+
+    estagios = supervisor.saude()
+    if supervisor.pronto:
+        status = 'healthy'
+    elif any(estagio['reinicios'] for estagio in estagios.values()):
+        status = 'degraded'
+    else:
+        status = 'starting'
+    return jsonify({'status': status, 'pronto': supervisor.pronto, 'estagios': estagios}), \
+        200 if supervisor.pronto else 503
 
 if __name__ == '__main__':
-    consumer_thread = threading.Thread(target=start_consumers, daemon=True)
-    consumer_thread.start()
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    iniciar_supervisor()
+    app.run(host='0.0.0.0', port=8000, debug=True, use_reloader=False)
\ No newline at end of file
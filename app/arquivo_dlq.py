@@ -0,0 +1,138 @@
+"""Arquivo indexado das notificações que chegaram à DLQ.
+
+Cada notificação ocupa uma linha por traceId, com o motivo da falha, o estágio
+que a enviou para a DLQ e o número de tentativas; se voltar à DLQ depois de um
+reenvio, a linha é atualizada e falhas incrementado. Os dados originais ficam
+em JSON para o reenvio. Uma única conexão por processo, protegida por lock
+(o volume da DLQ é baixo), aberta no primeiro uso; ":memory:" serve para testes.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class ArquivoDLQ:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexao = None
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        if self._conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+            conexao.row_factory = sqlite3.Row
+            if self.caminho != ":memory:":
+                conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS dlq (
+                    trace_id TEXT PRIMARY KEY,
+                    mensagem_id TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    motivo TEXT,
+                    estagio TEXT,
+                    tentativas INTEGER NOT NULL,
+                    dados TEXT NOT NULL,
+                    arquivado_em REAL NOT NULL,
+                    falhas INTEGER NOT NULL DEFAULT 1,
+                    reenvios INTEGER NOT NULL DEFAULT 0,
+                    reenviado_em REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_dlq_arquivado ON dlq (arquivado_em);
+                CREATE INDEX IF NOT EXISTS idx_dlq_tipo ON dlq (tipo, arquivado_em);
+                CREATE INDEX IF NOT EXISTS idx_dlq_motivo ON dlq (motivo, arquivado_em);
+                CREATE INDEX IF NOT EXISTS idx_dlq_mensagem ON dlq (mensagem_id);
+                CREATE INDEX IF NOT EXISTS idx_dlq_pendentes ON dlq (arquivado_em) WHERE reenviado_em IS NULL;
+            """)
+            self._conexao = conexao
+        return self._conexao
+
+    def arquivar(self, dados, motivo, estagio, tentativas):
+        with self._lock:
+            conexao = self._abrir()
+            with conexao:
+                conexao.execute("""
+                    INSERT INTO dlq (trace_id, mensagem_id, tipo, motivo, estagio, tentativas, dados, arquivado_em)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (trace_id) DO UPDATE SET
+                        motivo = excluded.motivo,
+                        estagio = excluded.estagio,
+                        tentativas = excluded.tentativas,
+                        arquivado_em = excluded.arquivado_em,
+                        falhas = falhas + 1,
+                        reenviado_em = NULL
+                """, (
+                    dados["traceId"], dados["mensagemId"], dados["tipoNotificacao"], motivo, estagio,
+                    tentativas, json.dumps(dados), time.time()
+                ))
+
+    @staticmethod
+    def _filtros(tipo=None, motivo=None, estagio=None, desde=None, ate=None, pendentes=None, trace_ids=None):
+        condicoes, parametros = [], []
+        for coluna, valor in (("tipo", tipo), ("motivo", motivo), ("estagio", estagio)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        if desde is not None:
+            condicoes.append("arquivado_em >= ?")
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append("arquivado_em < ?")
+            parametros.append(ate)
+        if pendentes is not None:
+            condicoes.append("reenviado_em IS NULL" if pendentes else "reenviado_em IS NOT NULL")
+        if trace_ids is not None:
+            # Um único parâmetro JSON: um "?" por traceId esbarraria no limite de variáveis do SQLite
+            condicoes.append("trace_id IN (SELECT value FROM json_each(?))")
+            parametros.append(json.dumps([str(trace_id) for trace_id in trace_ids]))
+        return (" WHERE " + " AND ".join(condicoes)) if condicoes else "", parametros
+
+    @staticmethod
+    def _registro(linha):
+        registro = dict(linha)
+        registro["dados"] = json.loads(registro["dados"])
+        return registro
+
+    def consultar(self, limite=100, deslocamento=0, **filtros):
+        """Registros em ordem de arquivamento, filtrados por tipo, motivo, estágio, período e pendência"""
+        where, parametros = self._filtros(**filtros)
+        with self._lock:
+            linhas = self._abrir().execute(
+                f"SELECT * FROM dlq{where} ORDER BY arquivado_em, trace_id LIMIT ? OFFSET ?",
+                parametros + [limite, deslocamento]
+            ).fetchall()
+        return [self._registro(linha) for linha in linhas]
+
+    def contar(self, **filtros):
+        where, parametros = self._filtros(**filtros)
+        with self._lock:
+            return self._abrir().execute(f"SELECT COUNT(*) FROM dlq{where}", parametros).fetchone()[0]
+
+    def obter(self, trace_id):
+        with self._lock:
+            linha = self._abrir().execute("SELECT * FROM dlq WHERE trace_id = ?", (str(trace_id),)).fetchone()
+        return self._registro(linha) if linha is not None else None
+
+    def resumo(self):
+        """Contagem por tipo, motivo e estágio das notificações ainda não reenviadas"""
+        with self._lock:
+            linhas = self._abrir().execute("""
+                SELECT tipo, motivo, estagio, COUNT(*) AS quantidade FROM dlq
+                WHERE reenviado_em IS NULL GROUP BY tipo, motivo, estagio ORDER BY quantidade DESC
+            """).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def marcar_reenviadas(self, trace_ids):
+        with self._lock:
+            conexao = self._abrir()
+            with conexao:
+                conexao.executemany(
+                    "UPDATE dlq SET reenviado_em = ?, reenvios = reenvios + 1 WHERE trace_id = ?",
+                    [(time.time(), str(trace_id)) for trace_id in trace_ids]
+                )
+
+    def fechar(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
@@ -0,0 +1,208 @@
+"""Ponto de entrada ASGI (ex.: uvicorn app.asgi:app --workers 4).
+
+POST /api/notificar e GET /api/notificacao/status/<trace_id> rodam no event
+loop: a publicação vai para o PublicadorAssincrono, cuja thread mantém muitas
+publicações em voo num só canal, então uma requisição esperando o broker não
+ocupa uma thread. Validação, admissão e formato das respostas são os mesmos da
+API Flask (ver preparar_notificacao e resposta_status em app.py). Com o status
+em SQLite, as chamadas ao store (idempotência, status) rodam no pool de threads
+para não parar o event loop; o store em memória é consultado direto.
+
+As demais rotas passam para o app Flask, executado no pool de threads padrão
+do loop. Esperas longas (long-poll com ?wait= e a iteração do SSE) usam um pool
+próprio, limitado por ASGI_ESPERAS_THREADS: clientes aguardando uma transição
+não ocupam as threads das demais requisições. Consumidores e amostragem de
+filas sobem no lifespan startup.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+from . import config, metricas
+from .app import app as app_flask, iniciar_supervisor, publicador_assincrono
+from .app import preparar_notificacao, resposta_publicacao, resposta_status
+from .rabbitmq import ConfirmacaoTimeout
+
+ROTA_NOTIFICAR = "/api/notificar"
+PREFIXO_STATUS = "/api/notificacao/status/"
+
+_esperas = ThreadPoolExecutor(max_workers=config.ASGI_ESPERAS_THREADS, thread_name_prefix="asgi-espera")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _ciclo_de_vida(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    caminho, metodo = scope["path"], scope["method"]
+    if caminho == ROTA_NOTIFICAR and metodo == "POST":
+        inicio = time.perf_counter()
+        corpo, codigo, headers = await notificar(scope, await _ler_corpo(receive))
+        metricas.API_DURACAO.labels("notificar", str(codigo)).observe(time.perf_counter() - inicio)
+        await _responder(send, corpo, codigo, headers)
+    elif caminho.startswith(PREFIXO_STATUS) and "/" not in caminho[len(PREFIXO_STATUS):] and metodo == "GET":
+        corpo, codigo = await consultar_status(scope, caminho[len(PREFIXO_STATUS):])
+        await _responder(send, corpo, codigo)
+    else:
+        await _encaminhar_wsgi(scope, receive, send)
+
+
+async def notificar(scope, corpo_requisicao):
+    """Versão assíncrona de enviar_notificacao: (corpo, código, headers)"""
+    try:
+        resposta, publicacao = await _no_store(preparar_notificacao, _ler_json(scope, corpo_requisicao))
+        if resposta is not None:
+            return resposta
+
+        mensagem_id, trace_id, corpo, properties = publicacao
+        aguardar_confirmacao = _argumentos(scope).get('aguardarConfirmacao', '').lower() in ('1', 'true')
+        futuro = asyncio.wrap_future(publicador_assincrono.publicar(
+            config.FILA_ENTRADA, corpo, properties, aguardar_confirmacao=aguardar_confirmacao, chave=str(trace_id)
+        ))
+        try:
+            confirmado = await asyncio.wait_for(futuro, config.PUBLICADOR_TIMEOUT_CONFIRMACAO)
+        except asyncio.TimeoutError:
+            erro = ConfirmacaoTimeout(f"Broker não respondeu em {config.PUBLICADOR_TIMEOUT_CONFIRMACAO}s")
+            return await _no_store(resposta_publicacao, mensagem_id, trace_id, None, erro)
+        except Exception as e:
+            return await _no_store(resposta_publicacao, mensagem_id, trace_id, None, e)
+        # Um nack também libera o mensagemId no store
+        return await _no_store(resposta_publicacao, mensagem_id, trace_id, confirmado)
+
+    except Exception as e:
+        return {'error': str(e)}, 500, {}
+
+
+async def consultar_status(scope, trace_id):
+    args = _argumentos(scope)
+    if args.get('wait'):
+        # O long-poll bloqueia até a próxima transição: fica fora do event loop e do pool padrão
+        return await asyncio.get_running_loop().run_in_executor(_esperas, resposta_status, trace_id, args)
+    return await _no_store(resposta_status, trace_id, args)
+
+
+async def _no_store(funcao, *args):
+    """Executa funcao, que acessa o store de status, no pool de threads quando o store faz I/O (sqlite)"""
+    if config.STATUS_BACKEND != "sqlite":
+        return funcao(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, funcao, *args)
+
+
+def _argumentos(scope):
+    return MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+
+
+def _header(scope, nome):
+    for chave, valor in scope["headers"]:
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+
+def _ler_json(scope, corpo):
+    """Como request.get_json() do Flask: exige Content-Type JSON e levanta BadRequest se inválido"""
+    tipo = (_header(scope, b"content-type") or "").split(";")[0].strip()
+    if tipo != "application/json" and not (tipo.startswith("application/") and tipo.endswith("+json")):
+        raise UnsupportedMediaType(
+            "Did not attempt to load JSON data because the request Content-Type was not 'application/json'."
+        )
+    try:
+        return app_flask.json.loads(corpo)
+    except ValueError:
+        raise BadRequest()
+
+
+async def _ler_corpo(receive):
+    partes = []
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            break
+        partes.append(mensagem.get("body", b""))
+        if not mensagem.get("more_body", False):
+            break
+    return b"".join(partes)
+
+
+async def _responder(send, corpo, codigo, headers=None):
+    dados = (app_flask.json.dumps(corpo, separators=(",", ":")) + "\n").encode()
+    cabecalhos = [(b"content-type", b"application/json"), (b"content-length", str(len(dados)).encode())]
+    cabecalhos.extend(
+        (nome.lower().encode("latin-1"), valor.encode("latin-1")) for nome, valor in (headers or {}).items()
+    )
+    await send({"type": "http.response.start", "status": codigo, "headers": cabecalhos})
+    await send({"type": "http.response.body", "body": dados})
+
+
+def _environ(scope, corpo):
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": cliente[0],
+        "CONTENT_LENGTH": str(len(corpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(corpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for nome, valor in scope["headers"]:
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome == "CONTENT_LENGTH":
+            continue
+        chave = "CONTENT_TYPE" if nome == "CONTENT_TYPE" else f"HTTP_{nome}"
+        environ[chave] = f"{environ[chave]},{valor}" if chave in environ else valor
+    return environ
+
+
+async def _encaminhar_wsgi(scope, receive, send):
+    """Atende a requisição com o app Flask numa thread, repassando o corpo em partes (ex.: SSE)"""
+    loop = asyncio.get_running_loop()
+    environ = _environ(scope, await _ler_corpo(receive))
+    inicio = {}
+
+    def start_response(status, headers, exc_info=None):
+        inicio["status"] = int(status.split(" ", 1)[0])
+        inicio["headers"] = [(nome.lower().encode("latin-1"), valor.encode("latin-1")) for nome, valor in headers]
+
+    resposta = await loop.run_in_executor(None, app_flask, environ, start_response)
+    # Cada parte do SSE espera a próxima transição: a iteração vai para o pool das esperas
+    stream = dict(inicio["headers"]).get(b"content-type", b"").startswith(b"text/event-stream")
+    try:
+        partes = iter(resposta)
+        await send({"type": "http.response.start", "status": inicio["status"], "headers": inicio["headers"]})
+        while (parte := await loop.run_in_executor(_esperas if stream else None, next, partes, None)) is not None:
+            await send({"type": "http.response.body", "body": parte, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(resposta, "close"):
+            await loop.run_in_executor(None, resposta.close)
+
+
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            iniciar_supervisor()
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            # Espera as confirmações das publicações ainda em voo
+            await asyncio.get_running_loop().run_in_executor(None, publicador_assincrono.fechar)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,596 @@
+"""Broker AMQP em memória para testes e benchmarks sem rede.
+
+Implementa o subconjunto da API do pika.BlockingConnection usado pelo projeto:
+filas duráveis, exchange padrão e exchanges diretas, prefetch, ack/nack com
+requeue, publisher confirms (com atraso opcional), TTL por fila e
+dead-lettering. Cada conexão tem a sua fila de eventos, processada pela thread
+que chama start_consuming ou process_data_events, como no pika.
+"""
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+import pika
+from pika import spec
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError, ConnectionWrongStateError
+
+
+class MensagemMemoria:
+    __slots__ = ("exchange", "routing_key", "corpo", "properties", "enfileirada_em",
+                 "expira_em", "entregue_em", "redelivered", "prioridade")
+
+    def __init__(self, exchange, routing_key, corpo, properties, agora, ttl_ms):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.corpo = corpo
+        self.properties = properties or pika.BasicProperties()
+        self.enfileirada_em = agora
+        self.expira_em = agora + ttl_ms / 1000 if ttl_ms is not None else None
+        self.entregue_em = None
+        self.redelivered = False
+        self.prioridade = self.properties.priority or 0
+
+
+class FilaMemoria:
+    def __init__(self, nome, arguments):
+        self.nome = nome
+        self.arguments = dict(arguments or {})
+        self.mensagens = deque()
+        self.consumidores = []
+        self._proximo = 0
+
+    @property
+    def ttl_ms(self):
+        return self.arguments.get("x-message-ttl")
+
+    def enfileirar(self, mensagem, no_inicio=False):
+        if no_inicio:
+            self.mensagens.appendleft(mensagem)
+        else:
+            self.mensagens.append(mensagem)
+
+    def proximo_consumidor(self):
+        """Round-robin entre consumidores com espaço no prefetch"""
+        for _ in range(len(self.consumidores)):
+            consumidor = self.consumidores[self._proximo % len(self.consumidores)]
+            self._proximo += 1
+            if consumidor.canal.tem_espaco():
+                return consumidor
+        return None
+
+
+class ConsumidorMemoria:
+    def __init__(self, canal, fila, callback, tag, auto_ack):
+        self.canal = canal
+        self.fila = fila
+        self.callback = callback
+        self.tag = tag
+        self.auto_ack = auto_ack
+
+
+class EstatisticasFila:
+    """Tempos de espera na fila e de processamento (entrega até ack) por fila"""
+
+    def __init__(self):
+        self.espera = []
+        self.processamento = []
+        self.publicadas = 0
+        self.confirmadas = 0
+        self.rejeitadas = 0
+        self.expiradas = 0
+
+
+class CanalMemoria:
+    def __init__(self, conexao, numero):
+        self.conexao = conexao
+        self.broker = conexao.broker
+        self.channel_number = numero
+        self.is_open = True
+        self.prefetch = 0
+        self.nao_confirmadas = {}
+        self._tags = itertools.count(1)
+        self._ao_confirmar = None
+        self._tag_publicacao = 0
+        self._consumidores = {}
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def _verificar_aberto(self):
+        if not self.is_open:
+            raise ChannelWrongStateError("Canal fechado")
+
+    def tem_espaco(self):
+        return self.is_open and (self.prefetch == 0 or len(self.nao_confirmadas) < self.prefetch)
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, global_qos=False):
+        self._verificar_aberto()
+        self.prefetch = prefetch_count
+        self.broker.despachar_todas()
+
+    def confirm_delivery(self, ack_nack_callback=None, callback=None):
+        self._verificar_aberto()
+        self._ao_confirmar = ack_nack_callback
+        if callback is not None:
+            self.conexao.agendar(lambda: callback(pika.frame.Method(self.channel_number, spec.Confirm.SelectOk())))
+
+    def queue_declare(self, queue, passive=False, durable=False, exclusive=False,
+                      auto_delete=False, arguments=None, callback=None):
+        self._verificar_aberto()
+        fila = self.broker.declarar_fila(self, queue, passive, arguments)
+        resultado = pika.frame.Method(
+            self.channel_number,
+            spec.Queue.DeclareOk(fila.nome, len(fila.mensagens), len(fila.consumidores))
+        )
+        if callback is not None:
+            self.conexao.agendar(lambda: callback(resultado))
+        return resultado
+
+    def exchange_declare(self, exchange, exchange_type="direct", passive=False, durable=False,
+                         auto_delete=False, internal=False, arguments=None, callback=None):
+        self._verificar_aberto()
+        self.broker.declarar_exchange(exchange)
+        if callback is not None:
+            self.conexao.agendar(lambda: callback(None))
+
+    def queue_bind(self, queue, exchange, routing_key=None, arguments=None, callback=None):
+        self._verificar_aberto()
+        self.broker.vincular(queue, exchange, routing_key or queue)
+        if callback is not None:
+            self.conexao.agendar(lambda: callback(None))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._verificar_aberto()
+        if isinstance(body, str):
+            body = body.encode()
+        if properties is not None:
+            # Como no pika real: headers que não cabem no protocolo falham aqui
+            properties.encode()
+        self.broker.publicar(exchange, routing_key, body, properties)
+        if self._ao_confirmar is not None:
+            self._tag_publicacao += 1
+            frame = pika.frame.Method(self.channel_number, spec.Basic.Ack(delivery_tag=self._tag_publicacao))
+            ao_confirmar = self._ao_confirmar
+            self.broker.confirmar(self.conexao, lambda: ao_confirmar(frame))
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False,
+                      consumer_tag=None, arguments=None, callback=None):
+        self._verificar_aberto()
+        tag = consumer_tag or f"ctag-{id(self)}-{len(self._consumidores) + 1}"
+        consumidor = ConsumidorMemoria(self, queue, on_message_callback, tag, auto_ack)
+        self._consumidores[tag] = consumidor
+        self.broker.registrar_consumidor(consumidor)
+        return tag
+
+    def basic_cancel(self, consumer_tag):
+        consumidor = self._consumidores.pop(consumer_tag, None)
+        if consumidor is not None:
+            self.broker.remover_consumidor(consumidor)
+
+    def basic_get(self, queue, auto_ack=False):
+        self._verificar_aberto()
+        with self.broker.lock:
+            mensagem = self.broker.retirar(queue)
+            if mensagem is None:
+                return None, None, None
+            tag = self._registrar_entrega(queue, mensagem, auto_ack)
+        metodo = spec.Basic.GetOk(tag, mensagem.redelivered, mensagem.exchange, mensagem.routing_key)
+        return metodo, mensagem.properties, mensagem.corpo
+
+    def _registrar_entrega(self, fila, mensagem, auto_ack):
+        tag = next(self._tags)
+        mensagem.entregue_em = time.monotonic()
+        self.broker.registrar_espera(fila, mensagem)
+        if auto_ack:
+            self.broker.registrar_processamento(fila, mensagem)
+        else:
+            self.nao_confirmadas[tag] = (fila, mensagem)
+        return tag
+
+    def entregar(self, consumidor, mensagem):
+        """Chamado pelo broker (sob o lock dele) para entregar ao consumidor"""
+        tag = self._registrar_entrega(consumidor.fila, mensagem, consumidor.auto_ack)
+        metodo = spec.Basic.Deliver(consumidor.tag, tag, mensagem.redelivered,
+                                    mensagem.exchange, mensagem.routing_key)
+
+        def executar():
+            if self.is_open:
+                consumidor.callback(self, metodo, mensagem.properties, mensagem.corpo)
+
+        self.conexao.agendar(executar)
+
+    def _tags_afetadas(self, delivery_tag, multiple):
+        if multiple:
+            return [tag for tag in list(self.nao_confirmadas) if tag <= delivery_tag]
+        return [delivery_tag]
+
+    def _retirar_entrega(self, tag):
+        entrega = self.nao_confirmadas.pop(tag, None)
+        if entrega is None:
+            self.is_open = False
+            raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - unknown delivery tag {tag}")
+        return entrega
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._verificar_aberto()
+        with self.broker.lock:
+            for tag in self._tags_afetadas(delivery_tag, multiple):
+                self.broker.registrar_processamento(*self._retirar_entrega(tag))
+            self.broker.despachar_todas()
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._verificar_aberto()
+        with self.broker.lock:
+            for tag in self._tags_afetadas(delivery_tag, multiple):
+                fila, mensagem = self._retirar_entrega(tag)
+                self.broker.rejeitar(fila, mensagem, requeue)
+            self.broker.despachar_todas()
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+
+    def start_consuming(self):
+        self.conexao.consumir(self)
+
+    def stop_consuming(self, consumer_tag=None):
+        self.conexao.consumindo = False
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        with self.broker.lock:
+            for consumidor in list(self._consumidores.values()):
+                self.broker.remover_consumidor(consumidor)
+            self._consumidores.clear()
+            pendentes, self.nao_confirmadas = self.nao_confirmadas, {}
+            for fila, mensagem in sorted(pendentes.values(), key=lambda entrega: -entrega[1].enfileirada_em):
+                self.broker.rejeitar(fila, mensagem, requeue=True)
+            self.broker.despachar_todas()
+
+
+class ConexaoMemoria:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.consumindo = False
+        self._eventos = queue.Queue()
+        self._canais = []
+        self._numeros = itertools.count(1)
+        self._bloqueios = []
+        self._desbloqueios = []
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self, channel_number=None, on_open_callback=None):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Conexão fechada")
+        canal = CanalMemoria(self, channel_number or next(self._numeros))
+        self._canais.append(canal)
+        if on_open_callback is not None:
+            self.agendar(lambda: on_open_callback(canal))
+        return canal
+
+    def agendar(self, evento):
+        self._eventos.put(evento)
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Conexão fechada")
+        self.agendar(callback)
+
+    def add_on_connection_blocked_callback(self, callback):
+        self._bloqueios.append(callback)
+
+    def add_on_connection_unblocked_callback(self, callback):
+        self._desbloqueios.append(callback)
+
+    def sinalizar_bloqueio(self, bloqueado):
+        # Como no pika, os callbacks rodam quando a conexão processa eventos
+        callbacks = self._bloqueios if bloqueado else self._desbloqueios
+        for callback in callbacks:
+            self.agendar(lambda callback=callback: callback(self, None))
+
+    def _executar_eventos(self, timeout):
+        try:
+            evento = self._eventos.get(timeout=timeout) if timeout > 0 else self._eventos.get_nowait()
+        except queue.Empty:
+            return
+        evento()
+        while True:
+            try:
+                evento = self._eventos.get_nowait()
+            except queue.Empty:
+                return
+            evento()
+
+    def process_data_events(self, time_limit=0):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Conexão fechada")
+        self._executar_eventos(time_limit or 0)
+
+    def sleep(self, duration):
+        limite = time.monotonic() + duration
+        while (restante := limite - time.monotonic()) > 0:
+            self._executar_eventos(restante)
+
+    def consumir(self, canal):
+        self.consumindo = True
+        while self.consumindo and self.is_open and canal.is_open:
+            self._executar_eventos(0.05)
+        if not self.is_open:
+            raise pika.exceptions.ConnectionClosed(320, "Conexão fechada")
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.consumindo = False
+        for canal in self._canais:
+            canal.close()
+        self.broker.desconectar(self)
+
+
+class BrokerMemoria:
+    """Transporte em memória: conectar() devolve uma conexão compatível com BlockingConnection"""
+
+    def __init__(self, resolucao_ttl=0.005, registrar_latencias=True, atraso_confirmacao=0):
+        self.lock = threading.RLock()
+        self._filas = {}
+        self._exchanges = {"": None}
+        self._vinculos = {}
+        self._conexoes = []
+        self.estatisticas = {}
+        self.resolucao_ttl = resolucao_ttl
+        self.registrar_latencias = registrar_latencias
+        self.disponivel = True
+        self._expiracao = None
+        # Ida e volta simulada (s) até o ack de cada publicação, como num broker na rede
+        self.atraso_confirmacao = atraso_confirmacao
+        self._confirmacoes = deque()
+        self._confirmacoes_cond = threading.Condition()
+        self._entrega_confirmacoes = None
+
+    # Transporte
+    def conectar(self, parametros=None):
+        if not self.disponivel:
+            raise pika.exceptions.AMQPConnectionError("Broker em memória indisponível")
+        conexao = ConexaoMemoria(self)
+        with self.lock:
+            self._conexoes.append(conexao)
+        return conexao
+
+    def desconectar(self, conexao):
+        with self.lock:
+            if conexao in self._conexoes:
+                self._conexoes.remove(conexao)
+
+    def derrubar(self):
+        """Simula a queda do nó: fecha todas as conexões e recusa novas"""
+        self.disponivel = False
+        with self.lock:
+            conexoes = list(self._conexoes)
+        for conexao in conexoes:
+            conexao.close()
+
+    def bloquear(self, bloqueado=True):
+        """Simula connection.blocked/unblocked (alarme de recursos) em todas as conexões"""
+        with self.lock:
+            conexoes = list(self._conexoes)
+        for conexao in conexoes:
+            conexao.sinalizar_bloqueio(bloqueado)
+
+    # Topologia
+    def declarar_fila(self, canal, nome, passive=False, arguments=None):
+        with self.lock:
+            fila = self._filas.get(nome)
+            if fila is None:
+                if passive:
+                    canal.is_open = False
+                    raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{nome}'")
+                fila = FilaMemoria(nome, arguments)
+                self._filas[nome] = fila
+                self.estatisticas.setdefault(nome, EstatisticasFila())
+                if fila.ttl_ms is not None:
+                    self._iniciar_expiracao()
+            elif not passive and dict(arguments or {}) != fila.arguments:
+                canal.is_open = False
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - inequivalent arg for queue '{nome}'")
+            return fila
+
+    def declarar_exchange(self, nome):
+        with self.lock:
+            self._exchanges.setdefault(nome, "direct")
+
+    def vincular(self, fila, exchange, routing_key):
+        with self.lock:
+            self._vinculos.setdefault((exchange, routing_key), set()).add(fila)
+
+    def profundidade(self, nome):
+        with self.lock:
+            fila = self._filas.get(nome)
+            return len(fila.mensagens) if fila is not None else 0
+
+    # Publicação e entrega
+    def _destinos(self, exchange, routing_key):
+        if exchange == "":
+            return [routing_key] if routing_key in self._filas else []
+        return sorted(self._vinculos.get((exchange, routing_key), ()))
+
+    def publicar(self, exchange, routing_key, corpo, properties, no_inicio=False):
+        agora = time.monotonic()
+        with self.lock:
+            for nome in self._destinos(exchange, routing_key):
+                fila = self._filas[nome]
+                mensagem = MensagemMemoria(exchange, routing_key, corpo, properties, agora, fila.ttl_ms)
+                self._enfileirar(fila, mensagem, no_inicio)
+                self.estatisticas[nome].publicadas += 1
+                self._despachar(fila)
+
+    def _enfileirar(self, fila, mensagem, no_inicio=False):
+        maximo = fila.arguments.get("x-max-priority")
+        if maximo and not no_inicio:
+            prioridade = min(mensagem.prioridade, maximo)
+            # Mantém a fila ordenada por prioridade, FIFO dentro da mesma prioridade
+            for indice, existente in enumerate(fila.mensagens):
+                if min(existente.prioridade, maximo) < prioridade:
+                    fila.mensagens.insert(indice, mensagem)
+                    return
+        fila.enfileirar(mensagem, no_inicio)
+
+    def _despachar(self, fila):
+        agora = time.monotonic()
+        while fila.mensagens and fila.consumidores:
+            cabeca = fila.mensagens[0]
+            if cabeca.expira_em is not None and cabeca.expira_em <= agora:
+                fila.mensagens.popleft()
+                self._expirar(fila, cabeca)
+                continue
+            consumidor = fila.proximo_consumidor()
+            if consumidor is None:
+                return
+            fila.mensagens.popleft()
+            consumidor.canal.entregar(consumidor, cabeca)
+
+    def despachar_todas(self):
+        with self.lock:
+            for fila in list(self._filas.values()):
+                self._despachar(fila)
+
+    def retirar(self, nome):
+        with self.lock:
+            fila = self._filas.get(nome)
+            if fila is None or not fila.mensagens:
+                return None
+            return fila.mensagens.popleft()
+
+    def registrar_consumidor(self, consumidor):
+        with self.lock:
+            fila = self._filas.get(consumidor.fila)
+            if fila is None:
+                consumidor.canal.is_open = False
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{consumidor.fila}'")
+            fila.consumidores.append(consumidor)
+            self._despachar(fila)
+
+    def remover_consumidor(self, consumidor):
+        with self.lock:
+            fila = self._filas.get(consumidor.fila)
+            if fila is not None and consumidor in fila.consumidores:
+                fila.consumidores.remove(consumidor)
+
+    def rejeitar(self, nome, mensagem, requeue):
+        with self.lock:
+            fila = self._filas.get(nome)
+            if fila is None:
+                return
+            self.estatisticas[nome].rejeitadas += 1
+            if requeue:
+                mensagem.redelivered = True
+                fila.enfileirar(mensagem, no_inicio=True)
+                self._despachar(fila)
+            else:
+                self._dead_letter(fila, mensagem, "rejected")
+
+    # TTL e dead-letter
+    def _expirar(self, fila, mensagem):
+        estatisticas = self.estatisticas[fila.nome]
+        estatisticas.expiradas += 1
+        if self.registrar_latencias:
+            estatisticas.espera.append(time.monotonic() - mensagem.enfileirada_em)
+        self._dead_letter(fila, mensagem, "expired")
+
+    def _dead_letter(self, fila, mensagem, motivo):
+        exchange = fila.arguments.get("x-dead-letter-exchange")
+        if exchange is None:
+            return
+        routing_key = fila.arguments.get("x-dead-letter-routing-key", mensagem.routing_key)
+        original = mensagem.properties
+        headers = dict(original.headers or {})
+        mortes = list(headers.get("x-death", []))
+        mortes.insert(0, {"queue": fila.nome, "reason": motivo, "count": 1,
+                          "exchange": mensagem.exchange, "routing-keys": [mensagem.routing_key]})
+        headers["x-death"] = mortes
+        properties = pika.BasicProperties(
+            content_type=original.content_type,
+            delivery_mode=original.delivery_mode,
+            priority=original.priority,
+            correlation_id=original.correlation_id,
+            message_id=original.message_id,
+            timestamp=original.timestamp,
+            headers=headers
+        )
+        self.publicar(exchange, routing_key, mensagem.corpo, properties)
+
+    def confirmar(self, conexao, evento):
+        """Agenda o ack na conexão do publicador, após atraso_confirmacao"""
+        if not self.atraso_confirmacao:
+            conexao.agendar(evento)
+            return
+        with self._confirmacoes_cond:
+            self._confirmacoes.append((time.monotonic() + self.atraso_confirmacao, conexao, evento))
+            if self._entrega_confirmacoes is None:
+                self._entrega_confirmacoes = threading.Thread(target=self._confirmar_continuamente,
+                                                              name="BrokerMemoria-Confirmacoes", daemon=True)
+                self._entrega_confirmacoes.start()
+            self._confirmacoes_cond.notify()
+
+    def _confirmar_continuamente(self):
+        # Atraso constante: a fila já está em ordem de prazo
+        while True:
+            with self._confirmacoes_cond:
+                while not self._confirmacoes:
+                    self._confirmacoes_cond.wait()
+                prazo, conexao, evento = self._confirmacoes[0]
+                espera = prazo - time.monotonic()
+                if espera > 0:
+                    self._confirmacoes_cond.wait(espera)
+                    continue
+                self._confirmacoes.popleft()
+            if conexao.is_open:
+                conexao.agendar(evento)
+
+    def _iniciar_expiracao(self):
+        if self._expiracao is None:
+            self._expiracao = threading.Thread(target=self._expirar_continuamente,
+                                               name="BrokerMemoria-TTL", daemon=True)
+            self._expiracao.start()
+
+    def _expirar_continuamente(self):
+        while True:
+            time.sleep(self.resolucao_ttl)
+            agora = time.monotonic()
+            with self.lock:
+                for fila in list(self._filas.values()):
+                    if fila.ttl_ms is None:
+                        continue
+                    while (fila.mensagens and fila.mensagens[0].expira_em is not None
+                           and fila.mensagens[0].expira_em <= agora):
+                        self._expirar(fila, fila.mensagens.popleft())
+
+    # Estatísticas
+    def registrar_espera(self, nome, mensagem):
+        if self.registrar_latencias:
+            with self.lock:
+                self.estatisticas[nome].espera.append(mensagem.entregue_em - mensagem.enfileirada_em)
+
+    def registrar_processamento(self, nome, mensagem):
+        with self.lock:
+            estatisticas = self.estatisticas[nome]
+            estatisticas.confirmadas += 1
+            if self.registrar_latencias:
+                estatisticas.processamento.append(time.monotonic() - mensagem.entregue_em)
+
+
+class TransporteNosMemoria:
+    """Um BrokerMemoria por nó (host, porta), para exercitar a distribuição entre nós sem rede"""
+
+    def __init__(self, nos, **opcoes):
+        self.brokers = {(host, porta): BrokerMemoria(**opcoes) for host, porta in nos}
+
+    def conectar(self, parametros):
+        return self.brokers[(parametros.host, parametros.port)].conectar(parametros)
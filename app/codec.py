@@ -0,0 +1,70 @@
+"""Codificação das mensagens no broker, escolhida pelo content_type.
+
+O produtor grava o content_type nas BasicProperties e os consumidores decodificam
+de acordo com ele; mensagens sem content_type são tratadas como JSON. orjson e
+msgpack são opcionais: sem orjson o JSON cai para o módulo json da biblioteca
+padrão, e sem msgpack o formato application/msgpack fica indisponível.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+class CodecJson:
+    content_type = JSON
+
+    if orjson is not None:
+        codificar = staticmethod(orjson.dumps)
+        decodificar = staticmethod(orjson.loads)
+    else:
+        @staticmethod
+        def codificar(dados):
+            return json.dumps(dados, separators=(",", ":")).encode()
+
+        decodificar = staticmethod(json.loads)
+
+
+class CodecMsgpack:
+    content_type = MSGPACK
+
+    @staticmethod
+    def codificar(dados):
+        return msgpack.packb(dados)
+
+    @staticmethod
+    def decodificar(corpo):
+        return msgpack.unpackb(corpo)
+
+
+CODECS = {JSON: CodecJson}
+if msgpack is not None:
+    CODECS[MSGPACK] = CodecMsgpack
+
+
+def obter_codec(content_type):
+    """Codec do content_type; None ou vazio é JSON (mensagens antigas)"""
+    if not content_type:
+        return CodecJson
+    try:
+        return CODECS[content_type]
+    except KeyError:
+        raise ValueError(f"Content type não suportado: {content_type}")
+
+
+def codificar(dados, content_type=JSON):
+    return obter_codec(content_type).codificar(dados)
+
+
+def decodificar(corpo, content_type=None):
+    return obter_codec(content_type).decodificar(corpo)
@@ -0,0 +1,156 @@
+import os
+
+# "pika" (broker real) ou "memoria" (broker em memória, para testes e benchmarks)
+TRANSPORTE = os.getenv("TRANSPORTE", "pika")
+
+# Nós do broker (host[:porta], separados por vírgula). A API distribui as
+# notificações entre eles por hashing consistente no traceId e os consumidores
+# atendem as filas de todos; um nó que falha fica fora por BROKER_FALHA_ESPERA s
+BROKER_NOS = [
+    (no.rpartition(":")[0], int(no.rpartition(":")[2])) if ":" in no else (no, 5672)
+    for no in (parte.strip() for parte in os.getenv("BROKER_NOS", "jaragua-01.lmq.cloudamqp.com:5672").split(","))
+    if no
+]
+BROKER_FALHA_ESPERA = float(os.getenv("BROKER_FALHA_ESPERA", "10"))
+
+FILA_ENTRADA = 'fila.notificacao.entrada.NATHAN'
+FILA_RETRY = 'fila.notificacao.retry.NATHAN'
+FILA_VALIDACAO = 'fila.notificacao.validacao.NATHAN'
+FILA_DLQ = 'fila.notificacao.dlq.NATHAN'
+
+# Validação em vias separadas por tipo: exchange direct roteia pelo tipoNotificacao
+TIPOS_NOTIFICACAO = ("EMAIL", "SMS", "PUSH")
+EXCHANGE_VALIDACAO = 'exchange.notificacao.validacao.NATHAN'
+FILAS_VALIDACAO = {tipo: f"{FILA_VALIDACAO}.{tipo.lower()}" for tipo in TIPOS_NOTIFICACAO}
+# x-max-priority das filas de validação (0 desliga a prioridade por mensagem)
+VALIDACAO_PRIORIDADE_MAX = int(os.getenv("VALIDACAO_PRIORIDADE_MAX", "0"))
+# Drena FILA_VALIDACAO, a fila única de antes das vias por tipo, reencaminhando
+# pela exchange; desligue (0) quando ela estiver vazia em todos os nós
+VALIDACAO_LEGADO_DRENAR = os.getenv("VALIDACAO_LEGADO_DRENAR", "1") == "1"
+
+# Pool de publicação usado pela API
+PUBLICADOR_POOL_TAMANHO = int(os.getenv("PUBLICADOR_POOL_TAMANHO", "4"))
+PUBLICADOR_POOL_TIMEOUT = float(os.getenv("PUBLICADOR_POOL_TIMEOUT", "5"))
+PUBLICADOR_VERIFICAR_APOS = float(os.getenv("PUBLICADOR_VERIFICAR_APOS", "30"))
+
+# Publisher confirms na API e nos encaminhamentos dos consumidores
+PUBLICADOR_CONFIRMACOES = os.getenv("PUBLICADOR_CONFIRMACOES", "1") == "1"
+PUBLICADOR_TIMEOUT_CONFIRMACAO = float(os.getenv("PUBLICADOR_TIMEOUT_CONFIRMACAO", "5"))
+ENCAMINHAMENTO_CONFIRMACOES = os.getenv("ENCAMINHAMENTO_CONFIRMACOES", "1") == "1"
+
+# Workers e prefetch por estágio do pipeline; cada via de validação tem os seus
+# (VALIDACAO_EMAIL_WORKERS etc.), com VALIDACAO_WORKERS como padrão comum
+_VALIDACAO_WORKERS_PADRAO = {"EMAIL": "8", "SMS": "4", "PUSH": "4"}
+ESTAGIO_WORKERS = {
+    "entrada": int(os.getenv("ENTRADA_WORKERS", "8")),
+    "retry": int(os.getenv("RETRY_WORKERS", "8")),
+    **{
+        f"validacao_{tipo.lower()}": int(os.getenv(
+            f"VALIDACAO_{tipo}_WORKERS", os.getenv("VALIDACAO_WORKERS", _VALIDACAO_WORKERS_PADRAO[tipo])
+        ))
+        for tipo in TIPOS_NOTIFICACAO
+    },
+    **({"validacao_legado": int(os.getenv("VALIDACAO_LEGADO_WORKERS", "1"))} if VALIDACAO_LEGADO_DRENAR else {}),
+    "dlq": int(os.getenv("DLQ_WORKERS", "1")),
+}
+ESTAGIO_PREFETCH = {
+    nome: int(os.getenv(f"{nome.upper()}_PREFETCH", str(workers * 2)))
+    for nome, workers in ESTAGIO_WORKERS.items()
+}
+
+# Consumidores no processo da API (0 quando rodam à parte, em python -m app.worker)
+API_CONSUMIDORES = os.getenv("API_CONSUMIDORES", "1") == "1"
+
+# Motor de consumo: "threads" (iniciar_consumidores) ou "asyncio"
+MOTOR_CONSUMIDORES = os.getenv("MOTOR_CONSUMIDORES", "threads")
+ASYNC_PREFETCH = int(os.getenv("ASYNC_PREFETCH", "1000"))
+
+# Store de status: limite de entradas e TTL (segundos) para estados finais
+STATUS_MAX_ENTRADAS = int(os.getenv("STATUS_MAX_ENTRADAS", "100000"))
+STATUS_TTL_FINAL = float(os.getenv("STATUS_TTL_FINAL", "3600"))
+# "memoria" (por processo) ou "sqlite" (compartilhado entre workers do mesmo host)
+STATUS_BACKEND = os.getenv("STATUS_BACKEND", "memoria")
+STATUS_SQLITE_CAMINHO = os.getenv("STATUS_SQLITE_CAMINHO", "notificacoes_status.db")
+
+# Envio em lote (POST /api/notificar/lote)
+LOTE_MAX_ITENS = int(os.getenv("LOTE_MAX_ITENS", "1000"))
+LOTE_TIMEOUT_CONFIRMACAO = float(os.getenv("LOTE_TIMEOUT_CONFIRMACAO", "10"))
+
+# Consulta de status em lote (POST /api/notificacao/status/lote): identificadores por requisição
+STATUS_LOTE_MAX_ITENS = int(os.getenv("STATUS_LOTE_MAX_ITENS", "5000"))
+
+# Retry com atraso no broker (TTL + dead-letter), backoff exponencial
+RETRY_MAX_TENTATIVAS = max(1, int(os.getenv("RETRY_MAX_TENTATIVAS", "3")))
+RETRY_ATRASO_BASE_MS = int(os.getenv("RETRY_ATRASO_BASE_MS", "3000"))
+RETRY_FATOR = float(os.getenv("RETRY_FATOR", "2"))
+
+# Multiplicador dos atrasos simulados nos estágios (benchmarks usam valores < 1)
+ESCALA_ATRASO_SIMULADO = float(os.getenv("ESCALA_ATRASO_SIMULADO", "1"))
+
+# Métricas: intervalo (s) da amostragem passiva de profundidade das filas
+METRICAS_INTERVALO_FILAS = float(os.getenv("METRICAS_INTERVALO_FILAS", "15"))
+
+# Long-poll (?wait=) e SSE do status: prazo máximo (s) e intervalo de keepalive do stream
+STATUS_ESPERA_MAX = float(os.getenv("STATUS_ESPERA_MAX", "30"))
+STATUS_STREAM_MAX = float(os.getenv("STATUS_STREAM_MAX", "300"))
+STATUS_STREAM_KEEPALIVE = float(os.getenv("STATUS_STREAM_KEEPALIVE", "15"))
+# Front end ASGI: threads reservadas às esperas de long-poll e SSE, fora do pool padrão do loop
+ASGI_ESPERAS_THREADS = int(os.getenv("ASGI_ESPERAS_THREADS", "64"))
+
+# Codificação das mensagens publicadas pela API: application/json (orjson) ou application/msgpack
+CODEC = os.getenv("CODEC", "application/json")
+
+# Idempotência por mensagemId: por quanto tempo (s) um reenvio devolve o traceId original
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", "86400"))
+
+# Supervisor dos consumidores: backoff (s) com jitter entre reinícios de um estágio
+SUPERVISOR_BACKOFF_BASE = float(os.getenv("SUPERVISOR_BACKOFF_BASE", "1"))
+SUPERVISOR_BACKOFF_MAX = float(os.getenv("SUPERVISOR_BACKOFF_MAX", "30"))
+
+# Controle de admissão da API (0 desliga cada limite): backlog máximo nas filas do
+# pipeline (pela amostragem de METRICAS_INTERVALO_FILAS), notificações em andamento
+# e taxa (notificações/s) e rajada por tipo; Retry-After (s) das recusas por carga
+ADMISSAO_MAX_FILA = int(os.getenv("ADMISSAO_MAX_FILA", "0"))
+ADMISSAO_MAX_EM_ANDAMENTO = int(os.getenv("ADMISSAO_MAX_EM_ANDAMENTO", "0"))
+ADMISSAO_TAXAS = {tipo: float(os.getenv(f"ADMISSAO_TAXA_{tipo}", "0")) for tipo in TIPOS_NOTIFICACAO}
+ADMISSAO_RAJADAS = {tipo: float(os.getenv(f"ADMISSAO_RAJADA_{tipo}", "0")) for tipo in TIPOS_NOTIFICACAO}
+ADMISSAO_RETRY_AFTER = float(os.getenv("ADMISSAO_RETRY_AFTER", "5"))
+
+# Entrega aos provedores: "simulado" (padrão, atraso aleatório), "smtp" (EMAIL) ou
+# "http" (gateways de SMS e PUSH). Conexões persistentes por provedor, que também
+# limitam os lotes em andamento, e micro-lotes de até ENTREGA_<TIPO>_LOTE
+# mensagens juntadas durante ENTREGA_JANELA_MS
+ENTREGA_PROVEDORES = {tipo: os.getenv(f"ENTREGA_{tipo}", "simulado") for tipo in TIPOS_NOTIFICACAO}
+ENTREGA_CONEXOES = {tipo: int(os.getenv(f"ENTREGA_{tipo}_CONEXOES", "4")) for tipo in TIPOS_NOTIFICACAO}
+ENTREGA_LOTE = {tipo: int(os.getenv(f"ENTREGA_{tipo}_LOTE", "50")) for tipo in TIPOS_NOTIFICACAO}
+ENTREGA_JANELA_MS = float(os.getenv("ENTREGA_JANELA_MS", "10"))
+# Os workers da validação não esperam o provedor, então as mensagens em voo (e o
+# tamanho real dos micro-lotes) são limitadas pelo prefetch da via. Com um
+# provedor real, o prefetch padrão comporta um lote cheio em cada conexão
+for _tipo in TIPOS_NOTIFICACAO:
+    if ENTREGA_PROVEDORES[_tipo] != "simulado" and not os.getenv(f"VALIDACAO_{_tipo}_PREFETCH"):
+        ESTAGIO_PREFETCH[f"validacao_{_tipo.lower()}"] = max(
+            ESTAGIO_PREFETCH[f"validacao_{_tipo.lower()}"], ENTREGA_LOTE[_tipo] * ENTREGA_CONEXOES[_tipo]
+        )
+ENTREGA_TIMEOUT = float(os.getenv("ENTREGA_TIMEOUT", "10"))
+ENTREGA_SMTP_HOST = os.getenv("ENTREGA_SMTP_HOST", "localhost")
+ENTREGA_SMTP_PORTA = int(os.getenv("ENTREGA_SMTP_PORTA", "25"))
+ENTREGA_SMTP_REMETENTE = os.getenv("ENTREGA_SMTP_REMETENTE", "notificacoes@localhost")
+ENTREGA_SMTP_USUARIO = os.getenv("ENTREGA_SMTP_USUARIO")
+ENTREGA_SMTP_SENHA = os.getenv("ENTREGA_SMTP_SENHA")
+ENTREGA_SMTP_STARTTLS = os.getenv("ENTREGA_SMTP_STARTTLS", "0") == "1"
+ENTREGA_URLS = {tipo: os.getenv(f"ENTREGA_{tipo}_URL") for tipo in TIPOS_NOTIFICACAO}
+ENTREGA_TOKENS = {tipo: os.getenv(f"ENTREGA_{tipo}_TOKEN") for tipo in TIPOS_NOTIFICACAO}
+
+# Arquivo da DLQ (SQLite, consultado pela API) e reenvio em massa para a validação:
+# taxa máxima (notificações/s) de cada reenvio, executados um de cada vez
+DLQ_ARQUIVO_CAMINHO = os.getenv("DLQ_ARQUIVO_CAMINHO", "notificacoes_dlq.db")
+DLQ_REENVIO_TAXA = float(os.getenv("DLQ_REENVIO_TAXA", "50"))
+DLQ_REENVIO_MAX_ITENS = int(os.getenv("DLQ_REENVIO_MAX_ITENS", "10000"))
+# Falha ao arquivar (SQLite travado, disco cheio): nova tentativa após
+# DLQ_ARQUIVO_ATRASO_MS pela fila de atraso da DLQ; esgotadas as tentativas, a
+# mensagem fica na fila de estacionamento, sem consumidor
+DLQ_ARQUIVO_MAX_TENTATIVAS = max(1, int(os.getenv("DLQ_ARQUIVO_MAX_TENTATIVAS", "5")))
+DLQ_ARQUIVO_ATRASO_MS = int(os.getenv("DLQ_ARQUIVO_ATRASO_MS", "5000"))
+FILA_DLQ_ATRASO = f"{FILA_DLQ}.atraso"
+FILA_DLQ_ESTACIONAMENTO = f"{FILA_DLQ}.estacionamento"
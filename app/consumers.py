@@ -1,302 +1,601 @@
-import json
 import random
 import time
-import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from uuid import UUID
 from pika import BasicProperties
-from .rabbitmq import RabbitMQConnection
+from . import config, metricas, codec, rastreio
+from .rabbitmq import RabbitMQConnection, RastreadorConfirmacoes, ativar_confirmacoes
+from .nos_broker import nome_no
+from .reinicio import atraso_reinicio
+from .entrega import obter_entregador
+from .arquivo_dlq import ArquivoDLQ
+from .status_store import criar_status_store, AssinaturasStatus, NOMES_STATUS_FINAIS
+from .config import FILA_ENTRADA, FILA_RETRY, FILA_VALIDACAO, FILA_DLQ, FILAS_VALIDACAO, EXCHANGE_VALIDACAO
+from .config import FILA_DLQ_ATRASO, FILA_DLQ_ESTACIONAMENTO
 
 logger = logging.getLogger(__name__)
 
-notificacoes_status = {}
-notificacoes_lock = threading.Lock()
+notificacoes_status = criar_status_store(
+    config.STATUS_BACKEND,
+    max_entradas=config.STATUS_MAX_ENTRADAS,
+    ttl_final=config.STATUS_TTL_FINAL,
+    caminho=config.STATUS_SQLITE_CAMINHO,
+    ttl_idempotencia=config.IDEMPOTENCIA_TTL
+)
+
+metricas.coletar_status_store(notificacoes_status)
+
+assinaturas_status = AssinaturasStatus()
+
+arquivo_dlq = ArquivoDLQ(config.DLQ_ARQUIVO_CAMINHO)
 
 def atualizar_status(traceId, status, dados):
-    with notificacoes_lock:
-        if traceId not in notificacoes_status:
-            notificacoes_status[traceId] = {
-                "traceId": traceId,
-                "mensagemId": UUID(dados["mensagemId"]),
-                "conteudoMensagem": dados["conteudoMensagem"],
-                "tipoNotificacao": dados["tipoNotificacao"],
-                "status": status,
-                "historico": [status]
-            }
-        else:
-            notificacoes_status[traceId]["status"] = status
-            notificacoes_status[traceId]["historico"].append(status)
-
-def criar_conexao_segura(nome):
+    notificacoes_status.atualizar(traceId, status, dados)
+    metricas.STATUS_TRANSICOES.labels(status).inc()
+    assinaturas_status.notificar(traceId)
+
+def atualizar_status_lote(itens):
+    """Registra vários (traceId, status, dados) em uma única operação do store"""
+    notificacoes_status.atualizar_lote(itens)
+    contagem = {}
+    for _, status, _ in itens:
+        contagem[status] = contagem.get(status, 0) + 1
+    for status, quantidade in contagem.items():
+        metricas.STATUS_TRANSICOES.labels(status).inc(quantidade)
+    if len(assinaturas_status):
+        for traceId, _, _ in itens:
+            assinaturas_status.notificar(traceId)
+
+def registrar_etapa(trace_id, estagio, span, headers, recebido_em, processamento):
+    """Grava o span do estágio no store e alimenta as métricas de espera e processamento"""
+    espera = rastreio.espera_na_fila(headers, recebido_em)
+    notificacoes_status.registrar_etapa(
+        trace_id, estagio.nome, span, headers.get(rastreio.HEADER_SPAN), recebido_em, espera, processamento
+    )
+    if espera is not None:
+        metricas.ESTAGIO_ESPERA.labels(estagio.nome).observe(espera)
+    metricas.LATENCIAS_ESTAGIOS.registrar(estagio.nome, espera, processamento)
+
+def consultar_status(traceId):
+    """Retorna o status da notificação como dict, ou None se não existir"""
+    return notificacoes_status.obter(traceId)
+
+def consultar_status_lote(traceIds):
+    """Status das notificações existentes entre os traceIds (as ausentes ficam de fora)"""
+    return notificacoes_status.obter_lote(traceIds)
+
+def buscar_por_mensagem(mensagemId):
+    """Status de todas as notificações geradas com o mensagemId, pelo índice secundário do store"""
+    return notificacoes_status.buscar_por_mensagem(mensagemId)
+
+def reservar_mensagem(mensagemId, traceId):
+    """Devolve o traceId original se o mensagemId já foi aceito, senão None"""
+    return notificacoes_status.reservar_mensagem(mensagemId, traceId)
+
+def liberar_mensagem(mensagemId, traceId):
+    notificacoes_status.liberar_mensagem(mensagemId, traceId)
+
+def acompanhar_status(traceId, versao=0, timeout=30, pulso=None):
+    """Gera o status sempre que o historico passar de versao entradas.
+
+    Acorda pelas notificações de atualizar_status em vez de reler o store em
+    laço. Termina num status final ou no prazo; com pulso, gera None a cada
+    pulso segundos sem mudança (keepalive). Com o backend sqlite as mudanças
+    podem vir de outro processo, então o store também é relido a cada segundo.
+    """
+    limite = time.monotonic() + timeout
+    releitura = 1 if config.STATUS_BACKEND == "sqlite" else None
+    espera_maxima = min(intervalo for intervalo in (pulso, releitura, timeout) if intervalo is not None)
+    evento = assinaturas_status.assinar(traceId)
+    ultimo_envio = time.monotonic()
+    try:
+        while True:
+            evento.clear()
+            dados = consultar_status(traceId)
+            agora = time.monotonic()
+            if dados is not None and len(dados["historico"]) > versao:
+                versao = len(dados["historico"])
+                ultimo_envio = agora
+                yield dados
+                if dados["status"] in NOMES_STATUS_FINAIS:
+                    return
+            elif pulso is not None and agora - ultimo_envio >= pulso:
+                ultimo_envio = agora
+                yield None
+            restante = limite - agora
+            if restante <= 0:
+                return
+            evento.wait(min(restante, espera_maxima))
+    finally:
+        assinaturas_status.cancelar(traceId, evento)
+
+_conexoes_abertas = set()
+
+class EstadoEstagio:
+    """Saúde de um estágio, atualizada pela thread (ou event loop) que o consome"""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.estado = "parado"
+        self.reinicios = 0
+        self.ultimo_erro = None
+        self.conectado_em = None
+
+    def conectando(self):
+        self.estado = "conectando"
+
+    def conectado(self):
+        self.estado = "conectado"
+        self.conectado_em = time.monotonic()
+
+    def falhou(self, erro):
+        self.estado = "reconectando"
+        self.ultimo_erro = str(erro)
+        self.reinicios += 1
+        self.conectado_em = None
+
+    def parado(self):
+        self.estado = "parado"
+        self.conectado_em = None
+
+    @property
+    def saudavel(self):
+        return self.estado == "conectado"
+
+    def como_dict(self):
+        return {
+            "estado": self.estado,
+            "reinicios": self.reinicios,
+            "ultimoErro": self.ultimo_erro,
+            "conectadoHaSegundos": (
+                None if self.conectado_em is None else round(time.monotonic() - self.conectado_em, 1)
+            )
+        }
+
+def nome_unidade(nome, no=0):
+    """Nome de um estágio num nó do broker; com um único nó, o próprio nome do estágio"""
+    return nome if len(config.BROKER_NOS) == 1 else f"{nome}@{nome_no(config.BROKER_NOS[no])}"
+
+def criar_conexao_segura(nome, no=0):
     """Cria uma conexão com tratamento de erros"""
     max_tentativas = 5
     tentativa = 0
+    unidade = nome_unidade(nome, no)
     
     while tentativa < max_tentativas:
         try:
-            connection = RabbitMQConnection.get_connection(nome)
+            connection = RabbitMQConnection.get_connection(nome, no)
             channel = connection.channel()
+            metricas.CONEXOES.labels(unidade, "sucesso").inc()
+            if unidade in _conexoes_abertas:
+                metricas.RECONEXOES.labels(unidade).inc()
+            _conexoes_abertas.add(unidade)
             return connection, channel
         except Exception as e:
+            metricas.CONEXOES.labels(unidade, "falha").inc()
             tentativa += 1
-            logger.warning(f"Tentativa {tentativa}/{max_tentativas} para conexão '{nome}' falhou: {e}")
-            time.sleep(2 ** tentativa)
+            logger.warning(f"Tentativa {tentativa}/{max_tentativas} para conexão '{unidade}' falhou: {e}")
+            time.sleep(atraso_reinicio(tentativa))
     
-    raise Exception(f"Não foi possível estabelecer conexão '{nome}' após {max_tentativas} tentativas")
+    raise Exception(f"Não foi possível estabelecer conexão '{unidade}' após {max_tentativas} tentativas")
 
-def processador_entrada():
-    """Processador principal com reconexão robusta"""
-    while True:
-        try:
-            connection, channel = criar_conexao_segura("entrada")
-            channel.queue_declare(queue='fila.notificacao.entrada.NATHAN', durable=True)
-            
-            def callback(ch, method, properties, body):
-                try:
-                    dados = json.loads(body.decode())
-                    trace_id = UUID(dados["traceId"])
-                    
-                    if random.random() < 0.12:
-                        atualizar_status(trace_id, "FALHA_PROCESSAMENTO_INICIAL", dados)
-                        retry_conn, retry_channel = criar_conexao_segura("retry_pub")
-                        retry_channel.queue_declare(queue='fila.notificacao.retry.NATHAN', durable=True)
-                        retry_channel.basic_publish(
-                            exchange='',
-                            routing_key='fila.notificacao.retry.NATHAN',
-                            body=json.dumps(dados),
-                            properties=BasicProperties(delivery_mode=2)
-                        )
-                        retry_conn.close()
-                        
-                    else:
-                        time.sleep(random.uniform(1, 1.5))
-                        atualizar_status(trace_id, "PROCESSADO_INTERMEDIARIO", dados)
-                        
-                        validacao_conn, validacao_channel = criar_conexao_segura("validacao_pub")
-                        validacao_channel.queue_declare(queue='fila.notificacao.validacao.NATHAN', durable=True)
-                        validacao_channel.basic_publish(
-                            exchange='',
-                            routing_key='fila.notificacao.validacao.NATHAN',
-                            body=json.dumps(dados),
-                            properties=BasicProperties(delivery_mode=2)
-                        )
-                        validacao_conn.close()
-                        
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    
-                except Exception as e:
-                    logger.error(f"Erro no processamento da mensagem: {e}")
-                    try:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    except:
-                        pass
-            
-            channel.basic_consume(
-                queue='fila.notificacao.entrada.NATHAN',
-                on_message_callback=callback,
-                auto_ack=False
+class EncaminhadorEstagio:
+    """Publica os encaminhamentos de um estágio no próprio canal do consumidor.
+
+    Os callbacks do BlockingConnection rodam na thread dona da conexão, então
+    reutilizar o canal de consumo é seguro e evita abrir uma conexão por mensagem.
+    As filas de destino são declaradas uma única vez, na criação do encaminhador.
+    Destinos em ROTEAMENTOS são publicados na exchange correspondente, com a
+    chave de roteamento informada em encaminhar. Com um rastreador de
+    confirmações, ao_confirmar é chamado quando o broker confirma o
+    encaminhamento; sem ele, logo após a publicação. Cada encaminhamento é
+    carimbado com o instante de enfileiramento e o span do estágio (rastreio).
+    """
+
+    def __init__(self, channel, destinos, rastreador=None):
+        self.channel = channel
+        self.rastreador = rastreador
+        for fila in destinos:
+            if fila in ROTEAMENTOS:
+                declarar_roteamento(channel, *ROTEAMENTOS[fila])
+            else:
+                channel.queue_declare(queue=fila, durable=True, arguments=ARGUMENTOS_FILAS.get(fila))
+        self.destinos = frozenset(destinos)
+
+    def encaminhar(self, fila, corpo, ao_confirmar=None, headers=None, content_type=None,
+                   chave=None, prioridade=None, span=None):
+        """Publica o corpo recebido sem recodificá-lo, preservando o content_type"""
+        if fila not in self.destinos:
+            raise ValueError(f"Fila '{fila}' não declarada para este estágio")
+        exchange, routing_key = '', fila
+        if fila in ROTEAMENTOS:
+            exchange, routing_key = ROTEAMENTOS[fila][0], chave
+        if self.rastreador is not None:
+            self.rastreador.registrar(ao_confirmar)
+        inicio = time.perf_counter()
+        self.channel.basic_publish(
+            exchange=exchange,
+            routing_key=routing_key,
+            body=corpo,
+            properties=BasicProperties(
+                delivery_mode=2, content_type=content_type, headers=rastreio.carimbar(headers, span),
+                priority=prioridade
             )
-            
-            logger.info("Processador de entrada iniciado e consumindo")
-            channel.start_consuming()
-            
+        )
+        metricas.PUBLICACAO_DURACAO.labels("encaminhamento").observe(time.perf_counter() - inicio)
+        if self.rastreador is None and ao_confirmar is not None:
+            ao_confirmar(True)
+
+def fila_atraso(tentativa):
+    return f"{FILA_RETRY}.atraso.{tentativa}"
+
+def atraso_tentativa_ms(tentativa):
+    """Backoff exponencial: base * fator^(tentativa - 1)"""
+    return int(config.RETRY_ATRASO_BASE_MS * config.RETRY_FATOR ** (tentativa - 1))
+
+# Filas de atraso por tentativa: a mensagem expira pelo TTL da fila e o broker a
+# devolve (dead-letter) à fila de retry, sem nenhum consumidor dormindo.
+FILAS_ATRASO = [fila_atraso(tentativa) for tentativa in range(1, config.RETRY_MAX_TENTATIVAS + 1)]
+ARGUMENTOS_FILAS = {
+    fila_atraso(tentativa): {
+        "x-message-ttl": atraso_tentativa_ms(tentativa),
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": FILA_RETRY
+    }
+    for tentativa in range(1, config.RETRY_MAX_TENTATIVAS + 1)
+}
+ARGUMENTOS_FILAS[FILA_DLQ_ATRASO] = {
+    "x-message-ttl": config.DLQ_ARQUIVO_ATRASO_MS,
+    "x-dead-letter-exchange": "",
+    "x-dead-letter-routing-key": FILA_DLQ
+}
+if config.VALIDACAO_PRIORIDADE_MAX:
+    for fila in FILAS_VALIDACAO.values():
+        ARGUMENTOS_FILAS[fila] = {"x-max-priority": config.VALIDACAO_PRIORIDADE_MAX}
+
+# Encaminhar para FILA_VALIDACAO publica na exchange direct, roteado pelo tipo,
+# e cada tipo cai na sua fila: um EMAIL lento não segura SMS e PUSH atrás dele.
+ROTEAMENTOS = {FILA_VALIDACAO: (EXCHANGE_VALIDACAO, FILAS_VALIDACAO)}
+
+def declarar_roteamento(channel, exchange, filas_por_chave):
+    channel.exchange_declare(exchange=exchange, exchange_type='direct', durable=True)
+    for chave, fila in filas_por_chave.items():
+        channel.queue_declare(queue=fila, durable=True, arguments=ARGUMENTOS_FILAS.get(fila))
+        channel.queue_bind(queue=fila, exchange=exchange, routing_key=chave)
+
+class Decisao:
+    """Resultado do processamento de uma mensagem por um estágio"""
+
+    __slots__ = ("atraso", "status", "destino", "headers", "envio", "concluida")
+
+    def __init__(self, atraso=0, status=None, destino=None, headers=None, envio=None, concluida=True):
+        self.atraso = atraso
+        self.status = status
+        self.destino = destino
+        self.headers = headers
+        # Future do envio ao provedor; o estágio espera o resultado e chama decisao_do_envio
+        self.envio = envio
+        # False quando o destino devolve a mensagem ao próprio estágio: o passo não é marcado
+        self.concluida = concluida
+
+class Estagio:
+    """Definição de um estágio do pipeline: fila consumida, destinos e decisão.
+
+    passo é o bit do store que marca a entrega como concluída, para descartar
+    reentregas; com por_tentativa cada tentativa (x-tentativa) usa o bit seguinte.
+    Com devolver_em_erro, uma mensagem legível que falha no processamento volta
+    à fila em vez de ser descartada.
+    """
+
+    def __init__(self, nome, fila, destinos, decidir, passo=0, por_tentativa=False, devolver_em_erro=False):
+        self.nome = nome
+        self.fila = fila
+        self.destinos = destinos
+        self.decidir = decidir
+        self.passo = passo
+        self.por_tentativa = por_tentativa
+        self.devolver_em_erro = devolver_em_erro
+
+    def passo_da_entrega(self, headers):
+        if self.por_tentativa:
+            return self.passo + headers.get("x-tentativa", 1) - 1
+        return self.passo
+
+def decidir_entrada(dados, headers):
+    """Retorna a Decisao com atraso simulado, novo status e fila de destino"""
+    if random.random() < 0.12:
+        return Decisao(0, "FALHA_PROCESSAMENTO_INICIAL", fila_atraso(1), {"x-tentativa": 1})
+    return Decisao(random.uniform(1, 1.5), "PROCESSADO_INTERMEDIARIO", FILA_VALIDACAO)
+
+def decidir_retry(dados, headers):
+    tentativa = headers.get("x-tentativa", 1)
+    if random.random() < 0.2:
+        if tentativa < config.RETRY_MAX_TENTATIVAS:
+            proxima = tentativa + 1
+            return Decisao(0, "REPROCESSAMENTO_AGENDADO", fila_atraso(proxima), {"x-tentativa": proxima})
+        return Decisao(0, "FALHA_FINAL_REPROCESSAMENTO", FILA_DLQ, {"x-tentativa": tentativa})
+    return Decisao(0, "REPROCESSADO_COM_SUCESSO", FILA_VALIDACAO, {"x-tentativa": tentativa})
+
+def decidir_validacao_legado(dados, headers):
+    """Mensagens deixadas na fila única de validação seguem para a via do seu tipo"""
+    return Decisao(destino=FILA_VALIDACAO, headers=headers)
+
+def decidir_validacao(dados, headers):
+    tipo = dados["tipoNotificacao"]
+    entregador = obter_entregador(tipo)
+    if entregador is not None:
+        return Decisao(headers=headers, envio=entregador.submeter(dados))
+
+    if tipo == "EMAIL":
+        atraso = random.uniform(0.5, 1.0)
+    elif tipo == "SMS":
+        atraso = random.uniform(0.3, 0.7)
+    else:
+        atraso = random.uniform(0.2, 0.5)
+
+    if random.random() < 0.05:
+        return Decisao(atraso, "FALHA_ENVIO_FINAL", FILA_DLQ, headers)
+    return Decisao(atraso, "ENVIADO_SUCESSO")
+
+def decisao_do_envio(sucesso, headers):
+    """Envio recusado ou provedor fora do ar vai para a DLQ, de onde pode ser reenviado"""
+    if sucesso:
+        return Decisao(0, "ENVIADO_SUCESSO")
+    return Decisao(0, "FALHA_ENVIO_FINAL", FILA_DLQ, headers)
+
+def decidir_dlq(dados, headers):
+    """Arquiva a notificação com o motivo, o estágio de origem e as tentativas, para consulta e reenvio.
+
+    Se o arquivo falhar, a mensagem não volta direto à fila (seria reentregue em
+    laço): passa pela fila de atraso da DLQ e, esgotadas as tentativas, é estacionada.
+    """
+    motivo = headers.get("x-motivo")
+    try:
+        arquivo_dlq.arquivar(dados, motivo, headers.get("x-estagio"), headers.get("x-tentativa", 1))
+    except Exception as e:
+        tentativas = headers.get("x-tentativa-arquivo", 0) + 1
+        headers = {**headers, "x-tentativa-arquivo": tentativas}
+        if tentativas < config.DLQ_ARQUIVO_MAX_TENTATIVAS:
+            logger.warning(f"Falha ao arquivar {dados['traceId']} na DLQ ({e}); tentativa {tentativas}, "
+                           f"nova tentativa em {config.DLQ_ARQUIVO_ATRASO_MS} ms")
+            return Decisao(destino=FILA_DLQ_ATRASO, headers=headers, concluida=False)
+        logger.error(f"Falha ao arquivar {dados['traceId']} na DLQ após {tentativas} tentativas ({e}), "
+                     f"estacionando em {FILA_DLQ_ESTACIONAMENTO}")
+        metricas.DLQ_ESTACIONADAS.inc()
+        return Decisao(destino=FILA_DLQ_ESTACIONAMENTO, headers=headers)
+    metricas.DLQ_ARQUIVADAS.labels(motivo or "desconhecido").inc()
+    logger.info(f"Mensagem com traceId {dados['traceId']} arquivada na DLQ ({motivo})")
+    return Decisao()
+
+def anotar_origem(estagio, decisao):
+    """Encaminhamentos para a DLQ levam o motivo (status) e o estágio de origem nos headers"""
+    if decisao.destino == FILA_DLQ:
+        decisao.headers = {**(decisao.headers or {}), "x-motivo": decisao.status, "x-estagio": estagio.nome}
+    return decisao
+
+ESTAGIO_ENTRADA = Estagio("entrada", FILA_ENTRADA, [FILAS_ATRASO[0], FILA_VALIDACAO], decidir_entrada, passo=0)
+ESTAGIOS_VALIDACAO = {
+    tipo: Estagio(f"validacao_{tipo.lower()}", fila, [FILA_DLQ], decidir_validacao, passo=1)
+    for tipo, fila in FILAS_VALIDACAO.items()
+}
+ESTAGIO_DLQ = Estagio("dlq", FILA_DLQ, [FILA_DLQ_ATRASO, FILA_DLQ_ESTACIONAMENTO], decidir_dlq, passo=2,
+                      devolver_em_erro=True)
+ESTAGIO_RETRY = Estagio("retry", FILA_RETRY, FILAS_ATRASO + [FILA_DLQ, FILA_VALIDACAO], decidir_retry,
+                        passo=3, por_tentativa=True)
+# Bit próprio, depois dos da retry: as mensagens da fila antiga já passaram pela entrada
+ESTAGIO_VALIDACAO_LEGADO = Estagio("validacao_legado", FILA_VALIDACAO, [FILA_VALIDACAO], decidir_validacao_legado,
+                                   passo=ESTAGIO_RETRY.passo + config.RETRY_MAX_TENTATIVAS)
+ESTAGIOS = [ESTAGIO_ENTRADA, ESTAGIO_RETRY, *ESTAGIOS_VALIDACAO.values(), ESTAGIO_DLQ]
+if config.VALIDACAO_LEGADO_DRENAR:
+    ESTAGIOS.insert(-1, ESTAGIO_VALIDACAO_LEGADO)
+
+def processar_entrega(estagio, connection, channel, encaminhador, delivery_tag, properties, body):
+    """Processa uma entrega em uma thread do pool de workers do estágio.
+
+    O canal pertence à thread da conexão, então o encaminhamento e o ack/nack
+    são agendados nela via add_callback_threadsafe. O passo do estágio é marcado
+    no store antes do ack, e reentregas de um passo já concluído são só confirmadas.
+    Cada entrega processada abre um span, filho do span que a publicou. Com um
+    provedor de entrega, o restante roda quando o envio termina, na thread do
+    provedor, e o worker fica livre para a próxima entrega.
+    """
+    trace_id = passo = None
+    span = rastreio.novo_span()
+    recebido_em = time.time()
+
+    def concluir(decisao):
+        try:
+            if decisao.destino:
+                encaminhador.encaminhar(decisao.destino, body,
+                                        ao_confirmar=lambda confirmado: confirmar(confirmado, decisao.concluida),
+                                        headers=decisao.headers, content_type=properties.content_type,
+                                        chave=tipo, prioridade=properties.priority, span=span)
+            else:
+                notificacoes_status.marcar_passo(trace_id, passo)
+                channel.basic_ack(delivery_tag=delivery_tag)
         except Exception as e:
-            logger.error(f"Erro fatal no processador de entrada: {e}")
-            time.sleep(5)
-            try:
-                RabbitMQConnection.close_connection("entrada")
-            except:
-                pass
+            logger.error(f"Erro ao encaminhar mensagem no estágio {estagio.nome}: {e}")
+            rejeitar()
 
-def processador_retry():
-    """Processador de retry com reconexão robusta"""
-    while True:
+    def confirmar(confirmado, concluida=True):
+        # A entrega só é confirmada depois que o broker aceitou o encaminhamento
         try:
-            connection, channel = criar_conexao_segura("retry")
-            
-            channel.queue_declare(queue='fila.notificacao.retry.NATHAN', durable=True)
-            
-            def callback(ch, method, properties, body):
-                try:
-                    time.sleep(3)
-                    dados = json.loads(body.decode())
-                    trace_id = UUID(dados["traceId"])
-                    
-                    if random.random() < 0.2:
-                        atualizar_status(trace_id, "FALHA_FINAL_REPROCESSAMENTO", dados)
-                        dlq_conn, dlq_channel = criar_conexao_segura("dlq_pub")
-                        dlq_channel.queue_declare(queue='fila.notificacao.dlq.NATHAN', durable=True)
-                        dlq_channel.basic_publish(
-                            exchange='',
-                            routing_key='fila.notificacao.dlq.NATHAN',
-                            body=json.dumps(dados),
-                            properties=BasicProperties(delivery_mode=2)
-                        )
-                        dlq_conn.close()
-                        
-                    else:
-                        atualizar_status(trace_id, "REPROCESSADO_COM_SUCESSO", dados)
-                        
-                        validacao_conn, validacao_channel = criar_conexao_segura("validacao_pub2")
-                        validacao_channel.queue_declare(queue='fila.notificacao.validacao.NATHAN', durable=True)
-                        validacao_channel.basic_publish(
-                            exchange='',
-                            routing_key='fila.notificacao.validacao.NATHAN',
-                            body=json.dumps(dados),
-                            properties=BasicProperties(delivery_mode=2)
-                        )
-                        validacao_conn.close()
-                        
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    
-                except Exception as e:
-                    logger.error(f"Erro no processamento de retry: {e}")
-                    try:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    except:
-                        pass
-            
-            channel.basic_consume(
-                queue='fila.notificacao.retry.NATHAN',
-                on_message_callback=callback,
-                auto_ack=False
-            )
-            
-            logger.info("Processador de retry iniciado e consumindo")
-            channel.start_consuming()
-            
+            if confirmado:
+                if concluida:
+                    notificacoes_status.marcar_passo(trace_id, passo)
+                channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                logger.error(f"Broker recusou encaminhamento no estágio {estagio.nome}, devolvendo à fila")
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
         except Exception as e:
-            logger.error(f"Erro fatal no processador de retry: {e}")
-            time.sleep(5)
-            try:
-                RabbitMQConnection.close_connection("retry")
-            except:
-                pass
+            logger.error(f"Erro ao confirmar entrega no estágio {estagio.nome}: {e}")
 
-def processador_validacao():
-    """Processador de validação com reconexão robusta"""
-    while True:
+    def rejeitar(requeue=False):
         try:
-            connection, channel = criar_conexao_segura("validacao")
-            channel.queue_declare(queue='fila.notificacao.validacao.NATHAN', durable=True)
-            
-            def callback(ch, method, properties, body):
-                try:
-                    dados = json.loads(body.decode())
-                    trace_id = UUID(dados["traceId"])
-                    tipo = dados["tipoNotificacao"]
-                
-                    if tipo == "EMAIL":
-                        time.sleep(random.uniform(0.5, 1.0))
-
-                    elif tipo == "SMS":
-                        time.sleep(random.uniform(0.3, 0.7))
-                        
-                    else:
-                        time.sleep(random.uniform(0.2, 0.5))
-                   
-                    if random.random() < 0.05:
-                        atualizar_status(trace_id, "FALHA_ENVIO_FINAL", dados)
-                        dlq_conn, dlq_channel = criar_conexao_segura("dlq_pub2")
-                        dlq_channel.queue_declare(queue='fila.notificacao.dlq.NATHAN', durable=True)
-                        dlq_channel.basic_publish(
-                            exchange='',
-                            routing_key='fila.notificacao.dlq.NATHAN',
-                            body=json.dumps(dados),
-                            properties=BasicProperties(delivery_mode=2)
-                        )
-                        dlq_conn.close()
-                        
-                    else:
-                        atualizar_status(trace_id, "ENVIADO_SUCESSO", dados)
-                        
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    
-                except Exception as e:
-                    logger.error(f"Erro no processamento de validação: {e}")
-                    try:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    except:
-                        pass
-            
-            channel.basic_consume(
-                queue='fila.notificacao.validacao.NATHAN',
-                on_message_callback=callback,
-                auto_ack=False
-            )
-            
-            logger.info("Processador de validação iniciado e consumindo")
-            channel.start_consuming()
-            
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+        except:
+            pass
+
+    def finalizar(decisao):
+        anotar_origem(estagio, decisao)
+        if decisao.atraso:
+            time.sleep(decisao.atraso * config.ESCALA_ATRASO_SIMULADO)
+        if decisao.status:
+            atualizar_status(trace_id, decisao.status, dados)
+        registrar_etapa(trace_id, estagio, span, headers, recebido_em, time.perf_counter() - inicio)
+        connection.add_callback_threadsafe(lambda: concluir(decisao))
+
+    def falhou(e):
+        logger.error(f"Erro no processamento da mensagem no estágio {estagio.nome}: {e}")
+        devolver = estagio.devolver_em_erro and trace_id is not None
+        try:
+            connection.add_callback_threadsafe(lambda: rejeitar(devolver))
+        except:
+            pass
+
+    def encerrar():
+        em_processamento.dec()
+        metricas.ESTAGIO_DURACAO.labels(estagio.nome, tipo).observe(time.perf_counter() - inicio)
+
+    def apos_envio(envio, headers_envio):
+        try:
+            finalizar(decisao_do_envio(envio.result(), headers_envio))
         except Exception as e:
-            logger.error(f"Erro fatal no processador de validação: {e}")
-            time.sleep(5)
-            try:
-                RabbitMQConnection.close_connection("validacao")
-            except:
-                pass
+            falhou(e)
+        finally:
+            encerrar()
 
-def processador_dlq():
-    """Processador DLQ com reconexão robusta"""
-    while True:
+    em_processamento = metricas.ESTAGIO_EM_PROCESSAMENTO.labels(estagio.nome)
+    em_processamento.inc()
+    inicio = time.perf_counter()
+    tipo = "desconhecido"
+    aguardando_envio = False
+    try:
+        dados = codec.decodificar(body, properties.content_type)
+        trace_id = UUID(dados["traceId"])
+        tipo = dados.get("tipoNotificacao", tipo)
+        headers = properties.headers or {}
+        passo = estagio.passo_da_entrega(headers)
+        if notificacoes_status.passo_concluido(trace_id, passo):
+            logger.info(f"Reentrega de {trace_id} já processada no estágio {estagio.nome}, descartando")
+            metricas.DUPLICADAS.labels(estagio.nome).inc()
+            connection.add_callback_threadsafe(lambda: channel.basic_ack(delivery_tag=delivery_tag))
+            return
+        decisao = estagio.decidir(dados, headers)
+        if decisao.envio is not None:
+            # O worker não espera o provedor: as entregas em voo ficam limitadas pelo
+            # prefetch da via, e não pelos workers, para os micro-lotes encherem
+            decisao.envio.add_done_callback(lambda envio: apos_envio(envio, decisao.headers))
+            aguardando_envio = True
+            return
+        finalizar(decisao)
+
+    except Exception as e:
+        falhou(e)
+    finally:
+        if not aguardando_envio:
+            encerrar()
+
+def executar_estagio(estagio, parar=None, estado=None, no=0):
+    """Consome a fila do estágio com reconexão robusta e um pool de workers.
+
+    Com um threading.Event em parar, o laço termina quando o evento é sinalizado
+    e a conexão é fechada. Falhas seguidas reiniciam com backoff e jitter; a
+    saúde do estágio fica em estado (EstadoEstagio). Consome do nó no do broker;
+    com vários nós, cada estágio tem uma execução por nó.
+    """
+    workers = config.ESTAGIO_WORKERS[estagio.nome]
+    prefetch = config.ESTAGIO_PREFETCH[estagio.nome]
+    unidade = nome_unidade(estagio.nome, no)
+    estado = estado or EstadoEstagio(unidade)
+    falhas_seguidas = 0
+
+    while parar is None or not parar.is_set():
+        executor = None
         try:
-            connection, channel = criar_conexao_segura("dlq")
-            
-            channel.queue_declare(queue='fila.notificacao.dlq.NATHAN', durable=True)
-            
+            estado.conectando()
+            connection, channel = criar_conexao_segura(estagio.nome, no)
+            channel.queue_declare(queue=estagio.fila, durable=True, arguments=ARGUMENTOS_FILAS.get(estagio.fila))
+            channel.basic_qos(prefetch_count=prefetch)
+            rastreador = None
+            if config.ENCAMINHAMENTO_CONFIRMACOES:
+                rastreador = RastreadorConfirmacoes("encaminhamento")
+                ativar_confirmacoes(channel, rastreador)
+            encaminhador = EncaminhadorEstagio(channel, estagio.destinos, rastreador)
+            executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix=f"Worker-{estagio.nome}"
+            )
+
             def callback(ch, method, properties, body):
-                try:
-                    dados = json.loads(body.decode())
-                    trace_id = UUID(dados["traceId"])
-                    logger.info(f"Mensagem com traceId {trace_id} enviada para DLQ e não será mais processada")
-                    
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    
-                except Exception as e:
-                    logger.error(f"Erro no processamento DLQ: {e}")
-                    try:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    except:
-                        pass
-            
+                executor.submit(
+                    processar_entrega, estagio, connection, ch,
+                    encaminhador, method.delivery_tag, properties, body
+                )
+
             channel.basic_consume(
-                queue='fila.notificacao.dlq.NATHAN',
+                queue=estagio.fila,
                 on_message_callback=callback,
                 auto_ack=False
             )
-            
-            logger.info("Processador DLQ iniciado e consumindo")
-            channel.start_consuming()
-            
+
+            logger.info(f"Processador {unidade} iniciado com {workers} workers (prefetch {prefetch})")
+            estado.conectado()
+            if parar is None:
+                channel.start_consuming()
+            else:
+                # Laço de eventos com saída: parar é verificado a cada segundo
+                while not parar.is_set():
+                    connection.process_data_events(time_limit=1)
+
         except Exception as e:
-            logger.error(f"Erro fatal no processador DLQ: {e}")
-            time.sleep(5)
+            if parar is not None and parar.is_set():
+                break
+            # Uma conexão que ficou de pé por um tempo zera o backoff
+            if estado.conectado_em is not None and time.monotonic() - estado.conectado_em > 30:
+                falhas_seguidas = 0
+            falhas_seguidas += 1
+            estado.falhou(e)
+            espera = atraso_reinicio(falhas_seguidas)
+            logger.error(f"Erro fatal no processador {unidade}: {e}; reiniciando em {espera:.1f}s")
+            if parar is None:
+                time.sleep(espera)
+            else:
+                parar.wait(espera)
             try:
-                RabbitMQConnection.close_connection("dlq")
+                RabbitMQConnection.close_connection(estagio.nome, no)
             except:
                 pass
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    try:
+        RabbitMQConnection.close_connection(estagio.nome, no)
+    except:
+        pass
+    estado.parado()
+
+def processador_entrada():
+    """Processador principal com reconexão robusta"""
+    executar_estagio(ESTAGIO_ENTRADA)
+
+def processador_retry():
+    """Processador de retry com reconexão robusta"""
+    executar_estagio(ESTAGIO_RETRY)
+
+def processador_validacao(tipo):
+    """Processador de validação de um tipo de notificação, com reconexão robusta"""
+    executar_estagio(ESTAGIOS_VALIDACAO[tipo])
+
+def processador_dlq():
+    """Processador DLQ com reconexão robusta"""
+    executar_estagio(ESTAGIO_DLQ)
 
 def iniciar_consumidores():
-    """Iniciar todos os consumidores em threads separadas"""
-    threads = []
-    consumers = [
-        ("Entrada", processador_entrada),
-        ("Retry", processador_retry),
-        ("Validação", processador_validacao),
-        ("DLQ", processador_dlq)
-    ]
-    
-    for name, consumer_func in consumers:
-        thread = threading.Thread(
-            target=consumer_func, 
-            name=f"Consumer-{name}",
-            daemon=True
-        )
-        thread.start()
-        threads.append(thread)
-        time.sleep(2)
-    
-    logger.info("Todos os consumidores iniciados")
-    
-    while True:
-        time.sleep(1)
\ No newline at end of file
+    """Inicia todos os consumidores em paralelo, sob um supervisor, e bloqueia"""
+    from .supervisor import SupervisorConsumidores
+    supervisor = SupervisorConsumidores()
+    supervisor.iniciar()
+    supervisor.aguardar()
\ No newline at end of file
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from uuid import UUID
+from pika.adapters.asyncio_connection import AsyncioConnection
+from . import config, metricas, codec, rastreio
+from .rabbitmq import RabbitMQConnection, RastreadorConfirmacoes, ativar_confirmacoes
+from .consumers import (
+    atualizar_status, notificacoes_status, EncaminhadorEstagio, EstadoEstagio, ESTAGIOS, ARGUMENTOS_FILAS,
+    atraso_reinicio, decisao_do_envio, anotar_origem, registrar_etapa, nome_unidade
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def abrir_conexao(loop, no=0):
+    """Abre uma AsyncioConnection com o nó no e devolve (conexão, futuro de fechamento)"""
+    aberta = loop.create_future()
+    fechada = loop.create_future()
+
+    def ao_abrir(connection):
+        aberta.set_result(connection)
+
+    def ao_falhar(connection, erro):
+        if not aberta.done():
+            aberta.set_exception(Exception(f"Falha ao abrir conexão assíncrona: {erro}"))
+
+    def ao_fechar(connection, motivo):
+        if not fechada.done():
+            fechada.set_result(motivo)
+
+    AsyncioConnection(
+        RabbitMQConnection.parametros(no),
+        on_open_callback=ao_abrir,
+        on_open_error_callback=ao_falhar,
+        on_close_callback=ao_fechar,
+        custom_ioloop=loop
+    )
+    return await aberta, fechada
+
+
+async def abrir_canal(loop, connection):
+    aberto = loop.create_future()
+    connection.channel(on_open_callback=aberto.set_result)
+    return await aberto
+
+
+async def declarar_fila(loop, channel, fila):
+    declarada = loop.create_future()
+    channel.queue_declare(queue=fila, durable=True, arguments=ARGUMENTOS_FILAS.get(fila),
+                          callback=declarada.set_result)
+    return await declarada
+
+
+async def definir_prefetch(loop, channel, prefetch):
+    definido = loop.create_future()
+    channel.basic_qos(prefetch_count=prefetch, callback=definido.set_result)
+    return await definido
+
+
+async def processar_entrega(estagio, channel, encaminhador, delivery_tag, properties, body):
+    """Versão assíncrona de consumers.processar_entrega.
+
+    Roda inteiramente na thread do event loop, dona do canal, então encaminhamento
+    e ack são feitos diretamente. A espera simulada não bloqueia os demais estágios.
+    """
+    trace_id = passo = None
+    span = rastreio.novo_span()
+    recebido_em = time.time()
+
+    def concluir(confirmado, concluida=True):
+        try:
+            if confirmado:
+                if concluida:
+                    notificacoes_status.marcar_passo(trace_id, passo)
+                channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                logger.error(f"Broker recusou encaminhamento no estágio {estagio.nome}, devolvendo à fila")
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        except Exception as e:
+            logger.error(f"Erro ao confirmar entrega no estágio {estagio.nome}: {e}")
+
+    em_processamento = metricas.ESTAGIO_EM_PROCESSAMENTO.labels(estagio.nome)
+    em_processamento.inc()
+    inicio = time.perf_counter()
+    tipo = "desconhecido"
+    try:
+        dados = codec.decodificar(body, properties.content_type)
+        trace_id = UUID(dados["traceId"])
+        tipo = dados.get("tipoNotificacao", tipo)
+        headers = properties.headers or {}
+        passo = estagio.passo_da_entrega(headers)
+        if notificacoes_status.passo_concluido(trace_id, passo):
+            metricas.DUPLICADAS.labels(estagio.nome).inc()
+            channel.basic_ack(delivery_tag=delivery_tag)
+            return
+        decisao = estagio.decidir(dados, headers)
+        if decisao.envio is not None:
+            decisao = decisao_do_envio(await asyncio.wrap_future(decisao.envio), decisao.headers)
+        anotar_origem(estagio, decisao)
+        if decisao.atraso:
+            await asyncio.sleep(decisao.atraso * config.ESCALA_ATRASO_SIMULADO)
+        if decisao.status:
+            atualizar_status(trace_id, decisao.status, dados)
+        registrar_etapa(trace_id, estagio, span, headers, recebido_em, time.perf_counter() - inicio)
+        if decisao.destino:
+            encaminhador.encaminhar(decisao.destino, body,
+                                    ao_confirmar=lambda confirmado: concluir(confirmado, decisao.concluida),
+                                    headers=decisao.headers, content_type=properties.content_type,
+                                    chave=tipo, prioridade=properties.priority, span=span)
+        else:
+            concluir(True)
+
+    except Exception as e:
+        logger.error(f"Erro no processamento assíncrono no estágio {estagio.nome}: {e}")
+        devolver = estagio.devolver_em_erro and trace_id is not None
+        try:
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=devolver)
+        except:
+            pass
+    finally:
+        em_processamento.dec()
+        metricas.ESTAGIO_DURACAO.labels(estagio.nome, tipo).observe(time.perf_counter() - inicio)
+
+
+async def iniciar_estagio(loop, connection, estagio, tarefas):
+    channel = await abrir_canal(loop, connection)
+    await definir_prefetch(loop, channel, config.ASYNC_PREFETCH)
+    await declarar_fila(loop, channel, estagio.fila)
+    rastreador = None
+    if config.ENCAMINHAMENTO_CONFIRMACOES:
+        rastreador = RastreadorConfirmacoes("encaminhamento")
+        ativar_confirmacoes(channel, rastreador)
+    encaminhador = EncaminhadorEstagio(channel, estagio.destinos, rastreador)
+
+    def callback(ch, method, properties, body):
+        tarefa = loop.create_task(
+            processar_entrega(estagio, ch, encaminhador, method.delivery_tag, properties, body)
+        )
+        tarefas.add(tarefa)
+        tarefa.add_done_callback(tarefas.discard)
+
+    channel.basic_consume(queue=estagio.fila, on_message_callback=callback, auto_ack=False)
+    logger.info(f"Processador assíncrono {estagio.nome} iniciado (prefetch {config.ASYNC_PREFETCH})")
+
+
+async def executar_motor_assincrono(estagios=ESTAGIOS, estados=None, no=0):
+    """Executa os estágios de um nó do broker em um único event loop, com reconexão robusta.
+
+    Todos os estágios compartilham a conexão com o nó, então caem e voltam
+    juntos; a saúde de cada um fica em estados (nome_unidade -> EstadoEstagio).
+    """
+    loop = asyncio.get_running_loop()
+    tarefas = set()
+    unidades = {estagio.nome: nome_unidade(estagio.nome, no) for estagio in estagios}
+    estados = estados or {unidade: EstadoEstagio(unidade) for unidade in unidades.values()}
+    estados = {estagio.nome: estados[unidades[estagio.nome]] for estagio in estagios}
+    falhas_seguidas = 0
+
+    while True:
+        conectado_em = None
+        try:
+            for estagio in estagios:
+                estados[estagio.nome].conectando()
+            connection, fechada = await abrir_conexao(loop, no)
+            for estagio in estagios:
+                await iniciar_estagio(loop, connection, estagio, tarefas)
+                estados[estagio.nome].conectado()
+            conectado_em = loop.time()
+
+            motivo = await fechada
+            erro = f"Conexão do motor assíncrono fechada: {motivo}"
+
+        except Exception as e:
+            erro = f"Erro fatal no motor assíncrono: {e}"
+
+        # Uma conexão que ficou de pé por um tempo zera o backoff
+        if conectado_em is not None and loop.time() - conectado_em > 30:
+            falhas_seguidas = 0
+        falhas_seguidas += 1
+        for estado in estados.values():
+            estado.falhou(erro)
+        espera = atraso_reinicio(falhas_seguidas)
+        logger.error(f"{erro}; reiniciando em {espera:.1f}s")
+        await asyncio.sleep(espera)
+
+
+def iniciar_consumidores_assincronos(estados=None, estagios=ESTAGIOS):
+    """Alternativa a iniciar_consumidores: todos os estágios em um só event loop, uma conexão por nó"""
+    async def executar():
+        await asyncio.gather(*(
+            executar_motor_assincrono(estagios, estados, no) for no in range(len(config.BROKER_NOS))
+        ))
+    asyncio.run(executar())
@@ -0,0 +1,365 @@
+"""Adaptadores de entrega das notificações aos provedores (SMTP e gateways HTTP).
+
+Cada provedor tem um pool de conexões persistentes e um AgrupadorEntregas, que
+junta as mensagens submetidas pelos workers dentro de uma janela curta e envia
+o lote em uma conexão do pool. O número de lotes em andamento por provedor é
+limitado pela concorrência configurada, que também é o tamanho do pool.
+
+Sem provedor configurado para o tipo (ENTREGA_<TIPO>=simulado, o padrão), a
+validação continua simulando o envio com atrasos aleatórios.
+"""
+import http.client
+import json
+import logging
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from email.message import EmailMessage
+from urllib.parse import urlsplit
+from . import config, metricas
+
+logger = logging.getLogger(__name__)
+
+
+class PoolConexoes:
+    """Pool de conexões persistentes de um provedor, criadas sob demanda"""
+
+    def __init__(self, criar, tamanho=4, fechar=None):
+        self.criar = criar
+        self.tamanho = tamanho
+        self._fechar = fechar or (lambda conexao: conexao.close())
+        self._livres = queue.LifoQueue()
+        for _ in range(tamanho):
+            self._livres.put(None)
+
+    @contextmanager
+    def conexao(self):
+        conexao = self._livres.get()
+        try:
+            if conexao is None:
+                conexao = self.criar()
+            yield conexao
+        except Exception:
+            # Conexão em estado desconhecido: a próxima requisição abre outra
+            self.descartar(conexao)
+            conexao = None
+            raise
+        finally:
+            self._livres.put(conexao)
+
+    def descartar(self, conexao):
+        if conexao is None:
+            return
+        try:
+            self._fechar(conexao)
+        except Exception:
+            pass
+
+    def fechar(self):
+        for _ in range(self.tamanho):
+            self.descartar(self._livres.get())
+        for _ in range(self.tamanho):
+            self._livres.put(None)
+
+
+class AdaptadorEntrega:
+    """Interface dos adaptadores: envia um lote e devolve um booleano por mensagem"""
+
+    nome = "provedor"
+
+    def enviar_lote(self, mensagens):
+        raise NotImplementedError
+
+    def fechar(self):
+        pass
+
+
+# Erros de uma conexão reaproveitada que o provedor já fechou: vale repetir em outra
+ERROS_CONEXAO = (smtplib.SMTPServerDisconnected, http.client.RemoteDisconnected,
+                 http.client.CannotSendRequest, ConnectionError)
+
+
+class AdaptadorSmtp(AdaptadorEntrega):
+    """EMAIL por SMTP: um lote é enviado em uma única sessão, mensagem a mensagem"""
+
+    nome = "smtp"
+
+    def __init__(self, host, porta=25, remetente="notificacoes@localhost", usuario=None, senha=None,
+                 starttls=False, assunto="Notificação", conexoes=4, timeout=10):
+        self.host = host
+        self.porta = porta
+        self.remetente = remetente
+        self.usuario = usuario
+        self.senha = senha
+        self.starttls = starttls
+        self.assunto = assunto
+        self.timeout = timeout
+        self.pool = PoolConexoes(self._conectar, conexoes, fechar=self._encerrar)
+
+    def _conectar(self):
+        sessao = smtplib.SMTP(self.host, self.porta, timeout=self.timeout)
+        if self.starttls:
+            sessao.starttls()
+        if self.usuario:
+            sessao.login(self.usuario, self.senha)
+        return sessao
+
+    @staticmethod
+    def _encerrar(sessao):
+        try:
+            sessao.quit()
+        except smtplib.SMTPException:
+            sessao.close()
+
+    def _mensagem(self, dados):
+        mensagem = EmailMessage()
+        mensagem["From"] = self.remetente
+        mensagem["To"] = dados["destinatario"]
+        mensagem["Subject"] = self.assunto
+        mensagem["Message-ID"] = f"<{dados['mensagemId']}@notificacoes>"
+        mensagem.set_content(dados["conteudoMensagem"])
+        return mensagem
+
+    def enviar_lote(self, mensagens):
+        resultados = [False] * len(mensagens)
+        pendentes = [indice for indice, dados in enumerate(mensagens) if dados.get("destinatario")]
+        for tentativa in range(2):
+            try:
+                with self.pool.conexao() as sessao:
+                    while pendentes:
+                        indice = pendentes[0]
+                        try:
+                            recusados = sessao.send_message(self._mensagem(mensagens[indice]))
+                            resultados[indice] = not recusados
+                        except smtplib.SMTPRecipientsRefused:
+                            sessao.rset()
+                        except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                            logger.warning(f"SMTP recusou a mensagem {mensagens[indice]['mensagemId']}: {e}")
+                            sessao.rset()
+                        pendentes.pop(0)
+                return resultados
+            except ERROS_CONEXAO as e:
+                if tentativa:
+                    raise
+                logger.info(f"Sessão SMTP encerrada pelo servidor ({e}), reenviando em outra")
+        return resultados
+
+    def fechar(self):
+        self.pool.fechar()
+
+
+class AdaptadorHttp(AdaptadorEntrega):
+    """Gateway HTTP (SMS, PUSH): um POST JSON por lote em conexão keep-alive.
+
+    O corpo é {"mensagens": [{id, destinatario, conteudo, tipo}]}. Uma resposta
+    2xx com {"resultados": [{"sucesso": bool}]} informa o resultado por mensagem;
+    sem resultados, todas foram aceitas. 4xx recusa o lote e 5xx é erro do provedor.
+    """
+
+    def __init__(self, url, token=None, conexoes=4, timeout=10, nome="http"):
+        partes = urlsplit(url)
+        self.nome = nome
+        self.caminho = partes.path or "/"
+        self.token = token
+        classe = http.client.HTTPSConnection if partes.scheme == "https" else http.client.HTTPConnection
+        self.pool = PoolConexoes(
+            lambda: classe(partes.hostname, partes.port, timeout=timeout), conexoes
+        )
+
+    def _corpo(self, mensagens):
+        return json.dumps({"mensagens": [
+            {
+                "id": dados["mensagemId"],
+                "destinatario": dados["destinatario"],
+                "conteudo": dados["conteudoMensagem"],
+                "tipo": dados["tipoNotificacao"]
+            }
+            for dados in mensagens
+        ]}).encode()
+
+    def _postar(self, corpo):
+        cabecalhos = {"Content-Type": "application/json"}
+        if self.token:
+            cabecalhos["Authorization"] = f"Bearer {self.token}"
+        for tentativa in range(2):
+            try:
+                with self.pool.conexao() as conexao:
+                    conexao.request("POST", self.caminho, body=corpo, headers=cabecalhos)
+                    resposta = conexao.getresponse()
+                    return resposta.status, resposta.read()
+            except ERROS_CONEXAO as e:
+                if tentativa:
+                    raise
+                logger.info(f"Conexão com {self.nome} encerrada pelo servidor ({e}), reenviando em outra")
+
+    def enviar_lote(self, mensagens):
+        resultados = [False] * len(mensagens)
+        validos = [indice for indice, dados in enumerate(mensagens) if dados.get("destinatario")]
+        if not validos:
+            return resultados
+
+        status, corpo = self._postar(self._corpo([mensagens[indice] for indice in validos]))
+        if status >= 500:
+            raise Exception(f"{self.nome} respondeu {status}")
+        if status >= 400:
+            logger.warning(f"{self.nome} recusou lote de {len(validos)} mensagens: {status}")
+            return resultados
+
+        itens = json.loads(corpo).get("resultados") if corpo else None
+        if itens and len(itens) < len(validos):
+            # As mensagens além dos resultados ficam como falha; as informadas valem
+            logger.warning(
+                f"{self.nome} devolveu {len(itens)} resultados para um lote de {len(validos)} mensagens"
+            )
+        for posicao, indice in enumerate(validos):
+            if not itens:
+                resultados[indice] = True
+            elif posicao < len(itens):
+                resultados[indice] = bool(itens[posicao].get("sucesso", True))
+        return resultados
+
+    def fechar(self):
+        self.pool.fechar()
+
+
+class AgrupadorEntregas:
+    """Micro-lotes por provedor: submeter devolve um Future com o resultado da mensagem.
+
+    A thread agrupadora espera a primeira mensagem e uma vaga entre os lotes em
+    andamento (concorrencia); depois junta o que chegar durante a janela, até
+    tamanho_lote. Com o provedor ocupado, as mensagens acumulam e o próximo
+    lote sai maior; se já há mensagens acumuladas, elas são divididas entre as
+    conexões livres em vez de irem todas em um lote só.
+    """
+
+    def __init__(self, adaptador, janela=0.01, tamanho_lote=50, concorrencia=4):
+        self.adaptador = adaptador
+        self.janela = janela
+        self.tamanho_lote = tamanho_lote
+        self.concorrencia = concorrencia
+        self._fila = queue.Queue()
+        self._vagas = threading.Semaphore(concorrencia)
+        self._em_andamento = 0
+        self._executor = ThreadPoolExecutor(concorrencia, thread_name_prefix=f"Entrega-{adaptador.nome}")
+        self._thread = None
+        self._lock = threading.Lock()
+        self._duracao = metricas.ENTREGA_DURACAO.labels(adaptador.nome)
+        self._tamanhos = metricas.ENTREGA_LOTE.labels(adaptador.nome)
+
+    def submeter(self, dados):
+        futuro = Future()
+        self._iniciar()
+        self._fila.put((dados, futuro))
+        return futuro
+
+    def _iniciar(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._agrupar, name=f"Agrupador-{self.adaptador.nome}", daemon=True
+                    )
+                    self._thread.start()
+
+    def _agrupar(self):
+        while True:
+            primeiro = self._fila.get()
+            if primeiro is None:
+                return
+            self._vagas.acquire()
+            with self._lock:
+                livres = self.concorrencia - self._em_andamento
+                self._em_andamento += 1
+            lote = [primeiro]
+            acumuladas = 1 + self._fila.qsize()
+            maximo = self.tamanho_lote if acumuladas == 1 else min(self.tamanho_lote, -(-acumuladas // livres))
+            limite = time.monotonic() + self.janela
+            while len(lote) < maximo:
+                try:
+                    item = self._fila.get(timeout=max(0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._fila.put(None)
+                    break
+                lote.append(item)
+            self._executor.submit(self._enviar, lote)
+
+    def _enviar(self, lote):
+        inicio = time.perf_counter()
+        try:
+            resultados = self.adaptador.enviar_lote([dados for dados, _ in lote])
+        except Exception as e:
+            logger.error(f"Falha ao enviar lote de {len(lote)} mensagens por {self.adaptador.nome}: {e}")
+            resultados = [False] * len(lote)
+        finally:
+            with self._lock:
+                self._em_andamento -= 1
+            self._vagas.release()
+        self._duracao.observe(time.perf_counter() - inicio)
+        self._tamanhos.observe(len(lote))
+        for (_, futuro), sucesso in zip(lote, resultados):
+            metricas.ENTREGAS.labels(self.adaptador.nome, "sucesso" if sucesso else "falha").inc()
+            futuro.set_result(sucesso)
+
+    def fechar(self):
+        """Envia o que já foi submetido e fecha as conexões do provedor"""
+        if self._thread is not None:
+            self._fila.put(None)
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        self.adaptador.fechar()
+
+
+def criar_adaptador(tipo):
+    """Adaptador configurado para o tipo, ou None para o envio simulado"""
+    provedor = config.ENTREGA_PROVEDORES[tipo]
+    conexoes = config.ENTREGA_CONEXOES[tipo]
+    if provedor == "simulado":
+        return None
+    if provedor == "smtp":
+        return AdaptadorSmtp(
+            config.ENTREGA_SMTP_HOST, config.ENTREGA_SMTP_PORTA,
+            remetente=config.ENTREGA_SMTP_REMETENTE,
+            usuario=config.ENTREGA_SMTP_USUARIO,
+            senha=config.ENTREGA_SMTP_SENHA,
+            starttls=config.ENTREGA_SMTP_STARTTLS,
+            conexoes=conexoes,
+            timeout=config.ENTREGA_TIMEOUT
+        )
+    if provedor == "http":
+        return AdaptadorHttp(
+            config.ENTREGA_URLS[tipo], token=config.ENTREGA_TOKENS[tipo],
+            conexoes=conexoes, timeout=config.ENTREGA_TIMEOUT, nome=f"http-{tipo.lower()}"
+        )
+    raise ValueError(f"Provedor de entrega não suportado para {tipo}: {provedor}")
+
+
+_entregadores = {}
+_entregadores_lock = threading.Lock()
+
+
+def obter_entregador(tipo):
+    """AgrupadorEntregas do tipo, criado no primeiro uso; None quando o envio é simulado"""
+    if tipo not in _entregadores:
+        with _entregadores_lock:
+            if tipo not in _entregadores:
+                adaptador = criar_adaptador(tipo)
+                _entregadores[tipo] = adaptador and AgrupadorEntregas(
+                    adaptador,
+                    janela=config.ENTREGA_JANELA_MS / 1000,
+                    tamanho_lote=config.ENTREGA_LOTE[tipo],
+                    concorrencia=config.ENTREGA_CONEXOES[tipo]
+                )
+    return _entregadores[tipo]
+
+
+def fechar_entregadores():
+    with _entregadores_lock:
+        for entregador in _entregadores.values():
+            if entregador is not None:
+                entregador.fechar()
+        _entregadores.clear()
@@ -0,0 +1,378 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import deque
+from pika.exceptions import ChannelClosedByBroker
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_labels(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor))
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, descricao, labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.nomes_labels = tuple(labels)
+        self._filhos = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *valores):
+        """Devolve (e guarda) a série da combinação de labels; reutilize-a no caminho quente"""
+        filho = self._filhos.get(valores)
+        if filho is None:
+            with self._lock:
+                filho = self._filhos.setdefault(valores, self._novo_filho())
+        return filho
+
+    def _sem_labels(self):
+        return self.labels()
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        for valores, filho in sorted(self._filhos.items()):
+            linhas.extend(self._exportar_filho(valores, filho))
+        return linhas
+
+
+class _ValorSimples:
+    __slots__ = ("valor", "_lock")
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, quantidade=1):
+        with self._lock:
+            self.valor += quantidade
+
+    def dec(self, quantidade=1):
+        with self._lock:
+            self.valor -= quantidade
+
+    def set(self, valor):
+        self.valor = valor
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def _novo_filho(self):
+        return _ValorSimples()
+
+    def inc(self, quantidade=1):
+        self._sem_labels().inc(quantidade)
+
+    def _exportar_filho(self, valores, filho):
+        return [f"{self.nome}{_formatar_labels(self.nomes_labels, valores)} {_formatar_numero(filho.valor)}"]
+
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+    def set(self, valor):
+        self._sem_labels().set(valor)
+
+
+class _ValorHistograma:
+    __slots__ = ("limites", "contagens", "soma", "_lock")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, valor):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.contagens[indice] += 1
+            self.soma += valor
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, labels=(), buckets=BUCKETS_PADRAO):
+        super().__init__(nome, descricao, labels)
+        self.buckets = tuple(buckets)
+
+    def _novo_filho(self):
+        return _ValorHistograma(self.buckets)
+
+    def observe(self, valor):
+        self._sem_labels().observe(valor)
+
+    def _exportar_filho(self, valores, filho):
+        with filho._lock:
+            contagens = list(filho.contagens)
+            soma = filho.soma
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+            acumulado += contagem
+            le = f'le="{_formatar_numero(limite)}"'
+            linhas.append(f"{self.nome}_bucket{_formatar_labels(self.nomes_labels, valores, le)} {acumulado}")
+        rotulos = _formatar_labels(self.nomes_labels, valores)
+        linhas.append(f"{self.nome}_sum{rotulos} {_formatar_numero(soma)}")
+        linhas.append(f"{self.nome}_count{rotulos} {acumulado}")
+        return linhas
+
+
+class JanelaLatencias:
+    """Últimas amostras de espera na fila e de processamento por estágio.
+
+    Percentis exatos sobre uma janela deslizante de tamanho amostras por
+    estágio, complementando os histogramas (cujos buckets só aproximam percentis).
+    """
+
+    def __init__(self, tamanho=2048):
+        self.tamanho = tamanho
+        self._amostras = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, estagio, espera, processamento):
+        amostras = self._amostras.get(estagio)
+        if amostras is None:
+            with self._lock:
+                amostras = self._amostras.setdefault(
+                    estagio, (deque(maxlen=self.tamanho), deque(maxlen=self.tamanho))
+                )
+        if espera is not None:
+            amostras[0].append(espera)
+        amostras[1].append(processamento)
+
+    @staticmethod
+    def _percentis(valores, percentis):
+        if not valores:
+            return None
+        ordenados = sorted(valores)
+        # Nearest-rank: o menor valor com ao menos percentil% das amostras abaixo ou igual
+        resumo = {
+            f"p{percentil:g}": ordenados[max(0, math.ceil(percentil / 100 * len(ordenados)) - 1)]
+            for percentil in percentis
+        }
+        resumo["max"] = ordenados[-1]
+        return resumo
+
+    def resumo(self, percentis=(50, 90, 99)):
+        with self._lock:
+            estagios = list(self._amostras.items())
+        return {
+            estagio: {
+                "amostras": len(processamentos),
+                "esperaFila": self._percentis(list(esperas), percentis),
+                "processamento": self._percentis(list(processamentos), percentis)
+            }
+            for estagio, (esperas, processamentos) in estagios
+        }
+
+    def clear(self):
+        with self._lock:
+            self._amostras.clear()
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def coletar_ao_exportar(self, coletor):
+        """coletor() atualiza métricas lidas de outro componente a cada exportação"""
+        self._coletores.append(coletor)
+
+    def exportar(self):
+        for coletor in self._coletores:
+            try:
+                coletor()
+            except Exception as e:
+                logger.warning(f"Falha ao coletar métricas: {e}")
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+STATUS_TRANSICOES = registro.registrar(Contador(
+    "notificacoes_status_total", "Transições de status registradas", ("status",)))
+API_DURACAO = registro.registrar(Histograma(
+    "notificacoes_api_duracao_segundos", "Duração das requisições da API, por endpoint e código de resposta",
+    ("endpoint", "codigo")))
+ESTAGIO_DURACAO = registro.registrar(Histograma(
+    "notificacoes_estagio_duracao_segundos", "Duração do processamento por estágio e tipo",
+    ("estagio", "tipo")))
+ESTAGIO_ESPERA = registro.registrar(Histograma(
+    "notificacoes_estagio_espera_fila_segundos", "Espera na fila antes de cada estágio", ("estagio",),
+    buckets=BUCKETS_PADRAO + (120, 300, 600)))
+ESTAGIO_EM_PROCESSAMENTO = registro.registrar(Medidor(
+    "notificacoes_em_processamento", "Mensagens em processamento por estágio", ("estagio",)))
+PUBLICACAO_DURACAO = registro.registrar(Histograma(
+    "rabbitmq_publicacao_duracao_segundos", "Duração de basic_publish por origem", ("origem",)))
+PUBLICACAO_RECUSADAS = registro.registrar(Contador(
+    "rabbitmq_publicacoes_recusadas_total", "Publicações recusadas (nack) pelo broker", ("origem",)))
+DUPLICADAS = registro.registrar(Contador(
+    "notificacoes_duplicadas_total", "Reenvios e reentregas descartados por idempotência", ("origem",)))
+ENTREGA_DURACAO = registro.registrar(Histograma(
+    "notificacoes_entrega_lote_duracao_segundos", "Duração do envio de um lote ao provedor", ("provedor",)))
+ENTREGA_LOTE = registro.registrar(Histograma(
+    "notificacoes_entrega_lote_tamanho", "Mensagens por lote enviado ao provedor", ("provedor",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200)))
+ENTREGAS = registro.registrar(Contador(
+    "notificacoes_entregas_total", "Mensagens enviadas aos provedores, por resultado", ("provedor", "resultado")))
+DLQ_ARQUIVADAS = registro.registrar(Contador(
+    "notificacoes_dlq_arquivadas_total", "Notificações arquivadas pela DLQ, por motivo", ("motivo",)))
+DLQ_ESTACIONADAS = registro.registrar(Contador(
+    "notificacoes_dlq_estacionadas_total", "Mensagens da DLQ estacionadas após falhas seguidas ao arquivar"))
+DLQ_REENVIADAS = registro.registrar(Contador(
+    "notificacoes_dlq_reenviadas_total", "Notificações da DLQ republicadas na validação, por resultado",
+    ("resultado",)))
+RECUSADAS_ADMISSAO = registro.registrar(Contador(
+    "notificacoes_recusadas_admissao_total", "Notificações recusadas pelo controle de admissão", ("motivo",)))
+CONEXOES = registro.registrar(Contador(
+    "rabbitmq_tentativas_conexao_total", "Tentativas de conexão em criar_conexao_segura",
+    ("conexao", "resultado")))
+RECONEXOES = registro.registrar(Contador(
+    "rabbitmq_reconexoes_total", "Conexões reabertas após a primeira, por nome", ("conexao",)))
+FILA_MENSAGENS = registro.registrar(Medidor(
+    "rabbitmq_fila_mensagens", "Mensagens prontas na fila (amostragem passiva)", ("fila",)))
+FILA_CONSUMIDORES = registro.registrar(Medidor(
+    "rabbitmq_fila_consumidores", "Consumidores da fila (amostragem passiva)", ("fila",)))
+
+STATUS_STORE_ENTRADAS = registro.registrar(Medidor(
+    "notificacoes_status_store_entradas", "Notificações guardadas no store de status"))
+STATUS_STORE_BYTES = registro.registrar(Medidor(
+    "notificacoes_status_store_bytes_estimados", "Memória estimada do store de status em memória"))
+STATUS_STORE_PENDENTES = registro.registrar(Medidor(
+    "notificacoes_status_store_pendentes", "Atualizações aguardando a gravação em lote no SQLite"))
+STATUS_STORE_DESPEJOS = registro.registrar(Contador(
+    "notificacoes_status_store_despejos_total", "Entradas removidas do store de status, por motivo",
+    ("motivo",)))
+
+LATENCIAS_ESTAGIOS = JanelaLatencias()
+
+
+def coletar_status_store(store):
+    """Exporta em /metrics as estatísticas de memória e despejo do store (memória ou SQLite)"""
+    def coletar():
+        estatisticas = store.estatisticas()
+        STATUS_STORE_ENTRADAS.set(estatisticas["entradas"])
+        if "bytesEstimados" in estatisticas:
+            STATUS_STORE_BYTES.set(estatisticas["bytesEstimados"])
+        if "pendentes" in estatisticas:
+            STATUS_STORE_PENDENTES.set(estatisticas["pendentes"])
+        for motivo, chave in (("ttl", "despejosTtl"), ("capacidade", "despejosCapacidade"),
+                              ("poda", "removidosPoda")):
+            if chave in estatisticas:
+                STATUS_STORE_DESPEJOS.labels(motivo).set(estatisticas[chave])
+    registro.coletar_ao_exportar(coletar)
+
+
+class AmostradorFilas:
+    """Amostra a profundidade das filas com queue_declare passivo em baixa frequência.
+
+    Roda em thread própria com uma conexão dedicada, fora do caminho quente. O
+    último valor fica disponível em profundidades para quem precisar dele. Com
+    nos > 1, obter_canal(no) abre o canal de cada nó do broker e cada fila soma
+    os nós que responderam.
+    """
+
+    def __init__(self, obter_canal, filas, intervalo=15, nos=1):
+        self.obter_canal = obter_canal
+        self.filas = list(filas)
+        self.intervalo = intervalo
+        self.nos = nos
+        self.profundidades = {}
+        self.amostrado_em = None
+        self._thread = None
+        self._parar = threading.Event()
+
+    def amostrar(self):
+        if self.nos == 1:
+            contagens = self._amostrar_no(self.obter_canal)
+        else:
+            contagens = {}
+            for no in range(self.nos):
+                try:
+                    por_fila = self._amostrar_no(lambda: self.obter_canal(no))
+                except Exception as e:
+                    logger.warning(f"Falha ao amostrar profundidade das filas no nó {no}: {e}")
+                    continue
+                for fila, (mensagens, consumidores) in por_fila.items():
+                    total = contagens.get(fila, (0, 0))
+                    contagens[fila] = (total[0] + mensagens, total[1] + consumidores)
+            if not contagens:
+                raise Exception("nenhum nó do broker respondeu")
+        for fila, (mensagens, consumidores) in contagens.items():
+            self.profundidades[fila] = mensagens
+            FILA_MENSAGENS.labels(fila).set(mensagens)
+            FILA_CONSUMIDORES.labels(fila).set(consumidores)
+        self.amostrado_em = time.monotonic()
+
+    def _amostrar_no(self, obter_canal):
+        # O declare passivo de uma fila ainda não declarada (as de atraso e
+        # estacionamento só existem depois que os consumidores sobem) fecha o
+        # canal: a fila fica fora da amostra e as seguintes usam um canal novo
+        contagens = {}
+        ausentes = []
+        canal = obter_canal()
+        try:
+            for fila in self.filas:
+                if not canal.is_open:
+                    canal = obter_canal()
+                try:
+                    resultado = canal.queue_declare(queue=fila, passive=True)
+                except ChannelClosedByBroker as e:
+                    if e.reply_code != 404:
+                        raise
+                    ausentes.append(fila)
+                    continue
+                contagens[fila] = (resultado.method.message_count, resultado.method.consumer_count)
+        finally:
+            if canal.is_open:
+                canal.close()
+        if ausentes:
+            logger.warning(f"Filas ainda não declaradas, fora da amostra: {', '.join(ausentes)}")
+        return contagens
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                self.amostrar()
+            except Exception as e:
+                logger.warning(f"Falha ao amostrar profundidade das filas: {e}")
+            self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="AmostradorFilas", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
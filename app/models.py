@@ -16,11 +16,15 @@ class StatusNotificacao(str, Enum):
     REPROCESSADO_COM_SUCESSO = "REPROCESSADO_COM_SUCESSO"
     FALHA_ENVIO_FINAL = "FALHA_ENVIO_FINAL"
     ENVIADO_SUCESSO = "ENVIADO_SUCESSO"
+    REPROCESSAMENTO_AGENDADO = "REPROCESSAMENTO_AGENDADO"
 
 class NotificacaoRequest(BaseModel):
     mensagemId: Optional[UUID] = Field(default_factory=uuid4)
     conteudoMensagem: str
     tipoNotificacao: TipoNotificacao
+    prioridade: Optional[int] = Field(default=None, ge=0, le=255)
+    # Endereço de email, telefone ou token do dispositivo, usado pelos adaptadores de entrega
+    destinatario: Optional[str] = None
 
     class Config:
         use_enum_values = True
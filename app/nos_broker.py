@@ -0,0 +1,97 @@
+"""Distribuição das publicações entre os nós do broker (config.BROKER_NOS).
+
+Cada nó ocupa vários pontos (réplicas) de um anel de hashing consistente; uma
+chave (o traceId) pertence ao primeiro nó a partir do seu hash, e os nós
+seguintes no anel são a ordem de failover. Acrescentar ou remover um nó move
+só as chaves dos pontos dele. Um nó que falhou fica fora da escolha por um
+tempo e volta a ser tentado depois dele.
+"""
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+
+
+def nome_no(no):
+    host, porta = no
+    return f"{host}:{porta}"
+
+
+class AnelConsistente:
+    """Anel de hashing consistente sobre os índices de nos"""
+
+    def __init__(self, nos, replicas=100):
+        self.nos = [nome_no(no) if isinstance(no, tuple) else no for no in nos]
+        pontos = sorted(
+            (self._hash(f"{nome}#{replica}"), indice)
+            for indice, nome in enumerate(self.nos)
+            for replica in range(replicas)
+        )
+        self._hashes = [ponto for ponto, _ in pontos]
+        self._indices = [indice for _, indice in pontos]
+
+    @staticmethod
+    def _hash(chave):
+        return int.from_bytes(hashlib.blake2b(chave.encode(), digest_size=8).digest(), "big")
+
+    def preferencias(self, chave):
+        """Índices dos nós a partir da chave: o dono primeiro, depois a ordem de failover"""
+        if len(self.nos) == 1:
+            yield 0
+            return
+        inicio = bisect.bisect(self._hashes, self._hash(str(chave)))
+        vistos = set()
+        for posicao in range(inicio, inicio + len(self._indices)):
+            indice = self._indices[posicao % len(self._indices)]
+            if indice not in vistos:
+                vistos.add(indice)
+                yield indice
+                if len(vistos) == len(self.nos):
+                    return
+
+
+class DistribuidorNos:
+    """Escolhe o nó de cada publicação pelo anel, pulando os nós que falharam recentemente"""
+
+    def __init__(self, nos, espera_falha=10, replicas=100):
+        self.anel = AnelConsistente(nos, replicas)
+        self.espera_falha = espera_falha
+        self._indisponivel_ate = {}
+        self._rodizio = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def quantidade(self):
+        return len(self.anel.nos)
+
+    def candidatos(self, chave=None):
+        """Nós a tentar, em ordem: disponíveis pela preferência da chave e, por último, os que falharam.
+
+        Sem chave (ex.: reenvio da DLQ) os nós são usados em rodízio.
+        """
+        if self.quantidade == 1:
+            return [0]
+        if chave is None:
+            inicio = next(self._rodizio) % self.quantidade
+            ordem = [(inicio + deslocamento) % self.quantidade for deslocamento in range(self.quantidade)]
+        else:
+            ordem = list(self.anel.preferencias(chave))
+        agora = time.monotonic()
+        disponiveis = [no for no in ordem if self._indisponivel_ate.get(no, 0) <= agora]
+        return disponiveis + [no for no in ordem if no not in disponiveis]
+
+    def escolher(self, chave=None):
+        return self.candidatos(chave)[0]
+
+    def falhou(self, no):
+        with self._lock:
+            self._indisponivel_ate[no] = time.monotonic() + self.espera_falha
+
+    def recuperou(self, no):
+        if no in self._indisponivel_ate:
+            with self._lock:
+                self._indisponivel_ate.pop(no, None)
+
+    def disponivel(self, no):
+        return self._indisponivel_ate.get(no, 0) <= time.monotonic()
@@ -0,0 +1,174 @@
+"""Provedores locais para testes e benchmarks dos adaptadores de entrega.
+
+SmtpLocal fala o suficiente de SMTP para o smtplib (EHLO, MAIL, RCPT, DATA,
+RSET, NOOP, QUIT) e HttpLocal é um gateway HTTP/1.1 com keep-alive no formato
+esperado por AdaptadorHttp. Ambos escutam em 127.0.0.1 numa porta livre,
+contam conexões abertas e podem simular a latência do provedor (atraso, em
+segundos por mensagem no SMTP e por requisição no HTTP) e destinatários recusados.
+"""
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _ProvedorLocal:
+    def __init__(self, atraso=0, recusar=()):
+        self.atraso = atraso
+        self.recusar = set(recusar)
+        self.conexoes = 0
+        self.porta = None
+        self._servidor = None
+        self._lock = threading.Lock()
+
+    def _registrar_conexao(self):
+        with self._lock:
+            self.conexoes += 1
+
+    def _criar_servidor(self):
+        raise NotImplementedError
+
+    def iniciar(self):
+        self._servidor = self._criar_servidor()
+        self._servidor.daemon_threads = True
+        self._servidor.provedor = self
+        self.porta = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *erro):
+        self.parar()
+
+
+class _SessaoSmtp(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _responder(self, *linhas):
+        self.wfile.write("".join(f"{linha}\r\n" for linha in linhas).encode())
+
+    def handle(self):
+        provedor = self.server.provedor
+        provedor._registrar_conexao()
+        self._responder("220 localhost SMTP local")
+        remetente, destinatarios = None, []
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode(errors="replace").strip()
+            verbo = comando[:4].upper()
+            if verbo in ("EHLO", "HELO"):
+                self._responder("250-localhost", "250 8BITMIME")
+            elif verbo == "MAIL":
+                remetente = comando.split(":", 1)[1].split()[0].strip("<>")
+                destinatarios = []
+                self._responder("250 OK")
+            elif verbo == "RCPT":
+                endereco = comando.split(":", 1)[1].split()[0].strip("<>")
+                if endereco in provedor.recusar:
+                    self._responder("550 Destinatário recusado")
+                else:
+                    destinatarios.append(endereco)
+                    self._responder("250 OK")
+            elif verbo == "DATA":
+                self._responder("354 Envie a mensagem")
+                corpo = []
+                while (linha := self.rfile.readline()) not in (b".\r\n", b""):
+                    corpo.append(linha[1:] if linha.startswith(b"..") else linha)
+                if provedor.atraso:
+                    time.sleep(provedor.atraso)
+                provedor.registrar(remetente, destinatarios, b"".join(corpo))
+                remetente, destinatarios = None, []
+                self._responder("250 OK")
+            elif verbo in ("RSET", "NOOP"):
+                if verbo == "RSET":
+                    remetente, destinatarios = None, []
+                self._responder("250 OK")
+            elif verbo == "QUIT":
+                self._responder("221 Tchau")
+                return
+            else:
+                self._responder("502 Comando não implementado")
+
+
+class _ServidorTcp(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    # O padrão (5) descarta conexões quando muitos workers conectam de uma vez
+    request_queue_size = 128
+
+
+class _ServidorHttp(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class SmtpLocal(_ProvedorLocal):
+    """Servidor SMTP em thread; as mensagens aceitas ficam em mensagens"""
+
+    def __init__(self, atraso=0, recusar=()):
+        super().__init__(atraso, recusar)
+        self.mensagens = []
+
+    def _criar_servidor(self):
+        return _ServidorTcp(("127.0.0.1", 0), _SessaoSmtp)
+
+    def registrar(self, remetente, destinatarios, corpo):
+        with self._lock:
+            self.mensagens.append((remetente, destinatarios, corpo))
+
+
+class _RequisicaoGateway(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeçalhos e corpo saem em escritas separadas: sem TCP_NODELAY, o ACK atrasado do cliente segura o corpo
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.provedor._registrar_conexao()
+
+    def do_POST(self):
+        provedor = self.server.provedor
+        mensagens = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["mensagens"]
+        if provedor.atraso:
+            time.sleep(provedor.atraso)
+        provedor.registrar(self.path, mensagens)
+        corpo = json.dumps({"resultados": [
+            {"sucesso": mensagem["destinatario"] not in provedor.recusar} for mensagem in mensagens
+        ]}).encode()
+        self.send_response(provedor.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+class HttpLocal(_ProvedorLocal):
+    """Gateway HTTP em thread; cada POST recebido fica em lotes"""
+
+    def __init__(self, atraso=0, recusar=(), status=200):
+        super().__init__(atraso, recusar)
+        self.status = status
+        self.lotes = []
+
+    def _criar_servidor(self):
+        return _ServidorHttp(("127.0.0.1", 0), _RequisicaoGateway)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.porta}/mensagens"
+
+    def registrar(self, caminho, mensagens):
+        with self._lock:
+            self.lotes.append(mensagens)
@@ -1,54 +1,635 @@
 import pika
+import queue
 import threading
 import time
 import logging
+from concurrent.futures import Future
+from contextlib import contextmanager
+from . import config, metricas
+from .nos_broker import DistribuidorNos, nome_no
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class TransportePika:
+    """Transporte padrão: conexões bloqueantes do pika com o broker real"""
+
+    def conectar(self, parametros):
+        return pika.BlockingConnection(parametros)
+
+
 class RabbitMQConnection:
     _connections = {}
     _lock = threading.Lock()
+    _transporte = TransportePika()
+
+    @classmethod
+    def configurar_transporte(cls, transporte):
+        """Troca o transporte (ex.: BrokerMemoria) usado pelas novas conexões"""
+        with cls._lock:
+            cls._transporte = transporte
+            cls._connections = {}
     
     @classmethod
-    def get_connection(cls, name="default"):
+    def parametros(cls, no=0):
+        """Parâmetros do nó config.BROKER_NOS[no]"""
+        host, porta = config.BROKER_NOS[no]
+        credentials = pika.PlainCredentials('bjnuffmq', 'gj-YQIiEXyfxQxjsZtiYDKeXIT8ppUq7')
+        return pika.ConnectionParameters(
+            host=host,
+            port=porta,
+            virtual_host='bjnuffmq',
+            credentials=credentials,
+            heartbeat=300,
+            blocked_connection_timeout=150,
+            # Com vários nós, o failover para o próximo é mais rápido que insistir no mesmo
+            connection_attempts=3 if len(config.BROKER_NOS) == 1 else 1,
+            retry_delay=5,
+            socket_timeout=10
+        )
+
+    @staticmethod
+    def descrever(name, no=0):
+        return f"'{name}'" if len(config.BROKER_NOS) == 1 else f"'{name}' ({nome_no(config.BROKER_NOS[no])})"
+
+    @classmethod
+    def get_connection(cls, name="default", no=0):
+        """Conexão nomeada com o nó no; cada nó tem as suas conexões"""
         with cls._lock:
-            if name not in cls._connections or cls._connections[name].is_closed:
+            chave = (name, no)
+            if chave not in cls._connections or cls._connections[chave].is_closed:
                 try:
-                    credentials = pika.PlainCredentials('bjnuffmq', 'gj-YQIiEXyfxQxjsZtiYDKeXIT8ppUq7')
-                    parameters = pika.ConnectionParameters(
-                        host='jaragua-01.lmq.cloudamqp.com',
-                        port=5672,
-                        virtual_host='bjnuffmq',
-                        credentials=credentials,
-                        heartbeat=300,
-                        blocked_connection_timeout=150,
-                        connection_attempts=3,
-                        retry_delay=5,
-                        socket_timeout=10
-                    )
-                    cls._connections[name] = pika.BlockingConnection(parameters)
-                    logger.info(f"Conexão RabbitMQ '{name}' estabelecida com sucesso")
+                    parameters = cls.parametros(no)
+                    cls._connections[chave] = cls._transporte.conectar(parameters)
+                    logger.info(f"Conexão RabbitMQ {cls.descrever(name, no)} estabelecida com sucesso")
                 except Exception as e:
-                    logger.error(f"Erro ao conectar com RabbitMQ '{name}': {e}")
+                    logger.error(f"Erro ao conectar com RabbitMQ {cls.descrever(name, no)}: {e}")
                     raise
-            return cls._connections[name]
+            return cls._connections[chave]
     
     @classmethod
-    def close_connection(cls, name):
+    def close_connection(cls, name, no=0):
         with cls._lock:
-            if name in cls._connections and not cls._connections[name].is_closed:
+            chave = (name, no)
+            if chave in cls._connections and not cls._connections[chave].is_closed:
                 try:
-                    cls._connections[name].close()
-                    logger.info(f"Conexão RabbitMQ '{name}' fechada")
+                    cls._connections[chave].close()
+                    logger.info(f"Conexão RabbitMQ {cls.descrever(name, no)} fechada")
                 except Exception as e:
-                    logger.error(f"Erro ao fechar conexão '{name}': {e}")
+                    logger.error(f"Erro ao fechar conexão {cls.descrever(name, no)}: {e}")
                 finally:
-                    if name in cls._connections:
-                        del cls._connections[name]
+                    if chave in cls._connections:
+                        del cls._connections[chave]
     
     @classmethod
     def close_all(cls):
+        # close_connection toma o _lock (não reentrante): as chaves são lidas antes
         with cls._lock:
-            for name in list(cls._connections.keys()):
-                cls.close_connection(name)
\ No newline at end of file
+            chaves = list(cls._connections.keys())
+        for name, no in chaves:
+            cls.close_connection(name, no)
+
+class ConfirmacaoTimeout(Exception):
+    """O broker não confirmou as publicações dentro do prazo"""
+
+
+class RastreadorConfirmacoes:
+    """Acompanha as delivery tags de um canal em modo de publisher confirms.
+
+    O broker confirma de forma assíncrona, possivelmente várias tags de uma vez
+    (multiple=True); cada tag resolvida chama o callback registrado com True
+    (ack) ou False (nack). Os nacks são contados em métricas sob a origem.
+    """
+
+    def __init__(self, origem="api"):
+        self.ultima_tag = 0
+        self._pendentes = {}
+        self._recusadas = metricas.PUBLICACAO_RECUSADAS.labels(origem)
+
+    def registrar(self, callback=None):
+        self.ultima_tag += 1
+        self._pendentes[self.ultima_tag] = callback
+        return self.ultima_tag
+
+    def ao_confirmar(self, frame):
+        metodo = frame.method
+        confirmado = isinstance(metodo, pika.spec.Basic.Ack)
+        if metodo.multiple:
+            tags = []
+            for tag in self._pendentes:
+                if tag > metodo.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [metodo.delivery_tag]
+
+        if not confirmado:
+            self._recusadas.inc(len(tags))
+        for tag in tags:
+            callback = self._pendentes.pop(tag, None)
+            if callback is not None:
+                callback(confirmado)
+
+    @property
+    def pendentes(self):
+        return len(self._pendentes)
+
+
+def ativar_confirmacoes(channel, rastreador):
+    """Coloca o canal em modo confirm sem tornar cada basic_publish síncrono.
+
+    O BlockingChannel.confirm_delivery espera o ack de cada publicação; aqui o
+    Confirm.Select (nowait) é enviado ao canal subjacente com um callback de
+    ack/nack, e as confirmações chegam enquanto a conexão processa eventos.
+    Funciona também com canais assíncronos, que não têm _impl.
+    """
+    impl = getattr(channel, "_impl", channel)
+    impl.confirm_delivery(ack_nack_callback=rastreador.ao_confirmar)
+
+
+def aguardar(connection, condicao, timeout):
+    """Processa eventos da conexão até a condição ser satisfeita ou o prazo acabar"""
+    limite = time.monotonic() + timeout
+    while not condicao():
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            raise ConfirmacaoTimeout(f"Broker não respondeu em {timeout}s")
+        connection.process_data_events(time_limit=min(restante, 0.1))
+
+
+class CanalPublicacao:
+    """Conexão e canal de longa duração emprestados pelo pool de publicação, num nó do broker"""
+
+    def __init__(self, nome, no=0):
+        self.nome = nome
+        self.no = no
+        self.connection = None
+        self.channel = None
+        self.filas_declaradas = set()
+        self.rastreador = None
+        self.ultimo_uso = 0.0
+        self.bloqueado = False
+
+    @property
+    def descricao(self):
+        return RabbitMQConnection.descrever(self.nome, self.no)
+
+    def esta_saudavel(self):
+        return (
+            self.connection is not None and self.connection.is_open
+            and self.channel is not None and self.channel.is_open
+        )
+
+    def conectar(self):
+        self.connection = RabbitMQConnection.get_connection(self.nome, self.no)
+        self.channel = self.connection.channel()
+        self.filas_declaradas = set()
+        self.rastreador = None
+        self.bloqueado = False
+        # connection.blocked: o broker parou de ler publicações (alarme de memória ou disco)
+        self.connection.add_on_connection_blocked_callback(self._ao_bloquear)
+        self.connection.add_on_connection_unblocked_callback(self._ao_desbloquear)
+
+    def _ao_bloquear(self, connection, frame):
+        logger.warning(f"Broker bloqueou a conexão de publicação {self.descricao}")
+        self.bloqueado = True
+
+    def _ao_desbloquear(self, connection, frame):
+        logger.info(f"Broker desbloqueou a conexão de publicação {self.descricao}")
+        self.bloqueado = False
+
+    def verificar(self):
+        """Processa heartbeats pendentes e detecta conexões derrubadas pelo broker"""
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except Exception as e:
+            logger.warning(f"Canal de publicação {self.descricao} inválido: {e}")
+            self.descartar()
+
+    def descartar(self):
+        if self.rastreador is not None and self.rastreador.pendentes:
+            logger.error(
+                f"Canal de publicação {self.descricao} descartado com "
+                f"{self.rastreador.pendentes} publicações sem confirmação do broker"
+            )
+        self.channel = None
+        self.filas_declaradas = set()
+        self.rastreador = None
+        self.bloqueado = False
+        RabbitMQConnection.close_connection(self.nome, self.no)
+        self.connection = None
+
+    def garantir_fila(self, fila):
+        if fila not in self.filas_declaradas:
+            self.channel.queue_declare(queue=fila, durable=True)
+            self.filas_declaradas.add(fila)
+
+    def garantir_confirmacoes(self):
+        if self.rastreador is None:
+            rastreador = RastreadorConfirmacoes()
+            ativar_confirmacoes(self.channel, rastreador)
+            self.rastreador = rastreador
+
+    def publicar(self, fila, corpo, properties, ao_confirmar=None, exchange='', origem="api"):
+        """Publica na fila; em modo confirm devolve a delivery tag da publicação.
+
+        Com exchange, fila é a chave de roteamento e a declaração do roteamento
+        fica a cargo de quem publica. origem é o label da duração em métricas.
+        """
+        if not exchange:
+            self.garantir_fila(fila)
+        tag = None
+        if self.rastreador is not None:
+            # Registrada antes do envio: o ack pode chegar durante o próprio basic_publish
+            tag = self.rastreador.registrar(ao_confirmar)
+        inicio = time.perf_counter()
+        self.channel.basic_publish(
+            exchange=exchange,
+            routing_key=fila,
+            body=corpo,
+            properties=properties
+        )
+        duracao = _duracao_publicacao if origem == "api" else metricas.PUBLICACAO_DURACAO.labels(origem)
+        duracao.observe(time.perf_counter() - inicio)
+        return tag
+
+
+_duracao_publicacao = metricas.PUBLICACAO_DURACAO.labels("api")
+
+
+class PoolPublicacao:
+    """Pool thread-safe de canais de publicação reutilizados entre requisições.
+
+    Cada nó do broker tem tamanho canais. A chave de cada publicação (o traceId)
+    escolhe o nó pelo anel do distribuidor; se o nó não conecta, ele é marcado
+    como indisponível e a publicação segue para o próximo nó do anel.
+    """
+
+    def __init__(self, tamanho=4, prefixo="publisher", timeout=5, verificar_apos=30, confirmacoes=True,
+                 distribuidor=None):
+        self.tamanho = tamanho
+        self.confirmacoes = confirmacoes
+        self.prefixo = prefixo
+        self.timeout = timeout
+        self.verificar_apos = verificar_apos
+        self.distribuidor = distribuidor or DistribuidorNos(config.BROKER_NOS, config.BROKER_FALHA_ESPERA)
+        self._disponiveis = []
+        self._itens = []
+        for no in range(self.distribuidor.quantidade):
+            disponiveis = queue.LifoQueue()
+            for indice in range(tamanho):
+                item = CanalPublicacao(f"{prefixo}-{indice}", no)
+                self._itens.append(item)
+                disponiveis.put(item)
+            self._disponiveis.append(disponiveis)
+        self._bloqueio_verificado_em = 0.0
+
+    def bloqueado(self):
+        """Alguma conexão do pool recebeu connection.blocked e ainda não foi desbloqueada.
+
+        Enquanto houver bloqueio a API não publica, então os canais livres
+        processam eventos (no máximo uma vez por segundo) para receber o
+        connection.unblocked do broker.
+        """
+        if not any(item.bloqueado for item in self._itens):
+            return False
+        agora = time.monotonic()
+        if agora - self._bloqueio_verificado_em >= 1:
+            self._bloqueio_verificado_em = agora
+            for disponiveis in self._disponiveis:
+                livres = []
+                while True:
+                    try:
+                        livres.append(disponiveis.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in reversed(livres):
+                    if item.bloqueado:
+                        item.verificar()
+                    disponiveis.put(item)
+        return any(item.bloqueado for item in self._itens)
+
+    def _falhou(self, no, erro):
+        if self.distribuidor.quantidade > 1 and self.distribuidor.disponivel(no):
+            logger.warning(
+                f"Nó {nome_no(config.BROKER_NOS[no])} indisponível ({erro}); publicações seguem para os "
+                f"próximos do anel por {self.distribuidor.espera_falha}s"
+            )
+        self.distribuidor.falhou(no)
+
+    def canal(self, chave=None):
+        """Empresta um canal do nó da chave; sem chave, os nós são usados em rodízio"""
+        return self._emprestar(self.distribuidor.candidatos(chave))
+
+    @contextmanager
+    def _emprestar(self, candidatos):
+        erro = None
+        for no in candidatos:
+            try:
+                item = self._disponiveis[no].get(timeout=self.timeout)
+            except queue.Empty:
+                raise Exception(f"Nenhum canal de publicação disponível após {self.timeout}s")
+            try:
+                if item.esta_saudavel() and time.monotonic() - item.ultimo_uso > self.verificar_apos:
+                    item.verificar()
+                if not item.esta_saudavel():
+                    item.conectar()
+                if self.confirmacoes:
+                    item.garantir_confirmacoes()
+            except Exception as e:
+                item.descartar()
+                self._disponiveis[no].put(item)
+                self._falhou(no, e)
+                erro = e
+                continue
+            break
+        else:
+            raise erro
+
+        try:
+            yield item
+            item.ultimo_uso = time.monotonic()
+            self.distribuidor.recuperou(no)
+        except ConfirmacaoTimeout:
+            raise
+        except Exception as e:
+            item.descartar()
+            if isinstance(e, pika.exceptions.AMQPConnectionError) \
+                    and not isinstance(e, pika.exceptions.ConnectionBlockedTimeout):
+                self._falhou(no, e)
+            raise
+        finally:
+            self._disponiveis[no].put(item)
+
+    def publicar(self, fila, corpo, properties, aguardar_confirmacao=False, timeout=5, chave=None):
+        """Publica reutilizando um canal do pool, com uma nova tentativa se o canal morreu.
+
+        Sem aguardar_confirmacao a confirmação do broker é processada depois, nas
+        próximas operações do canal, e um nack é apenas registrado no log. Com
+        aguardar_confirmacao devolve True (ack) ou False (nack). A nova tentativa
+        após uma queda de conexão vai para o próximo nó do anel.
+        """
+        try:
+            return self._publicar(fila, corpo, properties, aguardar_confirmacao, timeout, chave)
+        except pika.exceptions.ConnectionBlockedTimeout:
+            # Broker segue bloqueado: repetir só esperaria de novo o blocked_connection_timeout
+            raise
+        except pika.exceptions.AMQPError as e:
+            logger.warning(f"Falha ao publicar em '{fila}', reconectando: {e}")
+            return self._publicar(fila, corpo, properties, aguardar_confirmacao, timeout, chave)
+
+    def _publicar(self, fila, corpo, properties, aguardar_confirmacao, timeout, chave):
+        resultado = []
+        if aguardar_confirmacao:
+            ao_confirmar = resultado.append
+        else:
+            def ao_confirmar(confirmado):
+                if not confirmado:
+                    logger.error(f"Broker recusou publicação em '{fila}'")
+
+        with self.canal(chave) as item:
+            item.publicar(fila, corpo, properties, ao_confirmar)
+            if aguardar_confirmacao and item.rastreador is not None:
+                aguardar(item.connection, lambda: resultado, timeout)
+                return resultado[0]
+        return None
+
+    def publicar_lote(self, fila, corpos, properties, timeout=5, chaves=None):
+        """Publica vários corpos e espera as confirmações em lote, um canal por nó.
+
+        properties pode ser uma lista, com as propriedades de cada corpo, e
+        chaves escolhe o nó de cada corpo. Devolve uma lista de booleanos
+        (ack/nack), na ordem dos corpos; com vários nós, os corpos de um nó que
+        falhou ficam com None e os demais seguem.
+        """
+        resultados = [None] * len(corpos)
+        if not isinstance(properties, list):
+            properties = [properties] * len(corpos)
+
+        def registrar(indice):
+            def ao_confirmar(confirmado):
+                resultados[indice] = confirmado
+            return ao_confirmar
+
+        grupos = {}
+        for indice in range(len(corpos)):
+            candidatos = self.distribuidor.candidatos(chaves[indice] if chaves else None)
+            grupos.setdefault(candidatos[0], (candidatos, []))[1].append(indice)
+
+        erros = []
+        for candidatos, indices in grupos.values():
+            try:
+                with self._emprestar(candidatos) as item:
+                    item.garantir_confirmacoes()
+                    for indice in indices:
+                        item.publicar(fila, corpos[indice], properties[indice], registrar(indice))
+                    aguardar(item.connection, lambda: all(resultados[indice] is not None for indice in indices),
+                             timeout)
+            except Exception as e:
+                if len(grupos) == 1:
+                    raise
+                logger.error(f"Falha ao publicar {len(indices)} notificações do lote: {e}")
+                erros.append(e)
+        if erros and len(erros) == len(grupos):
+            raise erros[-1]
+        return resultados
+
+    def fechar(self):
+        for disponiveis in self._disponiveis:
+            itens = []
+            while True:
+                try:
+                    itens.append(disponiveis.get_nowait())
+                except queue.Empty:
+                    break
+            for item in itens:
+                if item.connection is not None:
+                    item.descartar()
+                disponiveis.put(item)
+
+
+class PublicadorAssincrono:
+    """Publicação que não bloqueia quem chama, para o front end ASGI.
+
+    Em cada nó do broker, uma thread dona da conexão e do canal publica os
+    pedidos na ordem de chegada e processa as confirmações do broker enquanto
+    espera os próximos, então muitas publicações ficam em voo ao mesmo tempo
+    num só canal. publicar() devolve um concurrent.futures.Future (num event
+    loop, use asyncio.wrap_future) com as mesmas respostas de
+    PoolPublicacao.publicar: None logo após o basic_publish ou, com
+    aguardar_confirmacao, True/False no ack/nack. A chave escolhe o nó pelo
+    anel; se o nó cai, o pedido passa ao próximo, e só quando não há outro o
+    Future é resolvido com a exceção.
+    """
+
+    def __init__(self, nome="publisher-async", confirmacoes=True, distribuidor=None):
+        self.distribuidor = distribuidor or DistribuidorNos(config.BROKER_NOS, config.BROKER_FALHA_ESPERA)
+        self._nos = [
+            _PublicadorNo(CanalPublicacao(nome, no), confirmacoes, self._redirecionar)
+            for no in range(self.distribuidor.quantidade)
+        ]
+
+    @property
+    def bloqueado(self):
+        return any(publicador.item.bloqueado for publicador in self._nos)
+
+    def publicar(self, fila, corpo, properties, aguardar_confirmacao=False, chave=None):
+        futuro = Future()
+        candidatos = self.distribuidor.candidatos(chave)
+        self._nos[candidatos[0]].enviar((fila, corpo, properties, aguardar_confirmacao, futuro, candidatos[1:]))
+        return futuro
+
+    def _redirecionar(self, no, pedido, erro):
+        """Marca o nó como indisponível e passa o pedido ao próximo do anel; False se não houver outro"""
+        self.distribuidor.falhou(no)
+        restantes = pedido[-1]
+        if not restantes:
+            return False
+        logger.warning(f"Nó {nome_no(config.BROKER_NOS[no])} indisponível ({erro}), publicando no próximo do anel")
+        self._nos[restantes[0]].enviar(pedido[:-1] + (restantes[1:],))
+        return True
+
+    def fechar(self):
+        """Publica os pedidos já recebidos, espera as confirmações pendentes e fecha as conexões"""
+        for publicador in self._nos:
+            publicador.fechar()
+
+
+class _PublicadorNo:
+    """Thread de publicação do PublicadorAssincrono em um nó"""
+
+    def __init__(self, item, confirmacoes, redirecionar):
+        self.item = item
+        self.confirmacoes = confirmacoes
+        self.redirecionar = redirecionar
+        self._pedidos = queue.SimpleQueue()
+        self._aguardando = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enviar(self, pedido):
+        self._iniciar()
+        self._pedidos.put(pedido)
+        self._acordar()
+
+    def _iniciar(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, daemon=True,
+                                                    name=f"PublicadorAssincrono-{self.item.no}")
+                    self._thread.start()
+
+    def _acordar(self):
+        """Interrompe o process_data_events da thread para publicar o novo pedido já"""
+        connection = self.item.connection
+        if connection is not None:
+            try:
+                connection.add_callback_threadsafe(lambda: None)
+            except Exception:
+                pass
+
+    def _retirar(self, bloquear):
+        pedidos = [self._pedidos.get()] if bloquear else []
+        while True:
+            try:
+                pedidos.append(self._pedidos.get_nowait())
+            except queue.Empty:
+                return pedidos
+
+    def _executar(self):
+        while True:
+            # Sem conexão, nada chega do broker: basta esperar o próximo pedido
+            for pedido in self._retirar(bloquear=not self.item.esta_saudavel()):
+                if pedido is None:
+                    self._encerrar()
+                    return
+                self._publicar(*pedido)
+            if self.item.esta_saudavel():
+                try:
+                    # Confirmações, heartbeats e connection.blocked chegam aqui
+                    self.item.connection.process_data_events(time_limit=0 if not self._pedidos.empty() else 1)
+                except Exception as e:
+                    logger.warning(f"Canal de publicação {self.item.descricao} inválido: {e}")
+                    self._falhar(e)
+                    self.item.descartar()
+
+    def _publicar(self, fila, corpo, properties, aguardar_confirmacao, futuro, restantes):
+        # Um pedido redirecionado de outro nó já está em andamento
+        if not futuro.running() and not futuro.set_running_or_notify_cancel():
+            return
+        for tentativa in range(2):
+            try:
+                self._publicar_no_canal(fila, corpo, properties, aguardar_confirmacao, futuro)
+                return
+            except Exception as e:
+                erro = e
+            # Conexão em estado desconhecido: as confirmações em voo nela se perderam
+            self._falhar(erro)
+            self.item.descartar()
+            # Com o broker bloqueado, repetir só esperaria de novo o blocked_connection_timeout
+            if tentativa or not isinstance(erro, pika.exceptions.AMQPError) \
+                    or isinstance(erro, pika.exceptions.ConnectionBlockedTimeout):
+                break
+            logger.warning(f"Falha ao publicar em '{fila}', reconectando: {erro}")
+        if isinstance(erro, pika.exceptions.AMQPConnectionError) \
+                and not isinstance(erro, pika.exceptions.ConnectionBlockedTimeout) \
+                and self.redirecionar(self.item.no, (fila, corpo, properties, aguardar_confirmacao, futuro, restantes),
+                                      erro):
+            return
+        futuro.set_exception(erro)
+
+    def _publicar_no_canal(self, fila, corpo, properties, aguardar_confirmacao, futuro):
+        if not self.item.esta_saudavel():
+            self.item.conectar()
+        if self.confirmacoes:
+            self.item.garantir_confirmacoes()
+
+        if aguardar_confirmacao and self.item.rastreador is not None:
+            def ao_confirmar(confirmado):
+                self._aguardando.discard(futuro)
+                futuro.set_result(confirmado)
+            self._aguardando.add(futuro)
+        else:
+            def ao_confirmar(confirmado):
+                if not confirmado:
+                    logger.error(f"Broker recusou publicação em '{fila}'")
+        try:
+            self.item.publicar(fila, corpo, properties, ao_confirmar)
+        except Exception:
+            self._aguardando.discard(futuro)
+            raise
+        self.item.ultimo_uso = time.monotonic()
+        if futuro not in self._aguardando:
+            futuro.set_result(None)
+
+    def _falhar(self, erro):
+        """Resolve com erro as publicações que esperavam confirmação no canal descartado"""
+        aguardando, self._aguardando = self._aguardando, set()
+        for futuro in aguardando:
+            if not futuro.done():
+                futuro.set_exception(erro)
+
+    def _encerrar(self, timeout=5):
+        if self._aguardando and self.item.esta_saudavel():
+            try:
+                aguardar(self.item.connection, lambda: not self._aguardando, timeout)
+            except Exception as e:
+                logger.warning(f"Publicador {self.item.descricao} encerrado sem todas as confirmações: {e}")
+        self._falhar(ConfirmacaoTimeout("Publicador encerrado antes da confirmação do broker"))
+        self.item.descartar()
+
+    def fechar(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._pedidos.put(None)
+            self._acordar()
+            thread.join()
+
+
+if config.TRANSPORTE == "memoria":
+    from .broker_memoria import BrokerMemoria, TransporteNosMemoria
+    RabbitMQConnection.configurar_transporte(
+        BrokerMemoria() if len(config.BROKER_NOS) == 1 else TransporteNosMemoria(config.BROKER_NOS)
+    )
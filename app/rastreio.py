@@ -0,0 +1,37 @@
+"""Spans de processamento propagados nos headers AMQP.
+
+Toda publicação (API, encaminhamentos dos estágios e reenvio da DLQ) carimba
+x-enfileirado-em, o instante (epoch em milissegundos, inteiro: a tabela de
+headers AMQP não codifica float) em que a mensagem entrou na fila, e x-span, o
+id do span que a publicou. O estágio que a consome abre um span filho: a espera
+na fila é o tempo entre o carimbo e a entrega, e o processamento vai da entrega
+até a decisão. Os relógios dos hosts precisam
+estar sincronizados (NTP) para que a espera entre processos faça sentido.
+"""
+import os
+import time
+
+HEADER_ENFILEIRADO_EM = "x-enfileirado-em"
+HEADER_SPAN = "x-span"
+
+
+def novo_span():
+    """Id de span de 64 bits em hexadecimal"""
+    return os.urandom(8).hex()
+
+
+def carimbar(headers=None, span=None):
+    """Cópia dos headers com o instante de enfileiramento e o span que publica"""
+    headers = dict(headers) if headers else {}
+    headers[HEADER_ENFILEIRADO_EM] = int(time.time() * 1000)
+    if span is not None:
+        headers[HEADER_SPAN] = span
+    return headers
+
+
+def espera_na_fila(headers, recebido_em):
+    """Segundos entre o enfileiramento e a entrega, ou None para mensagens sem carimbo"""
+    enfileirado_em = headers.get(HEADER_ENFILEIRADO_EM)
+    if enfileirado_em is None:
+        return None
+    return max(0.0, recebido_em - enfileirado_em / 1000)
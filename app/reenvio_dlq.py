@@ -0,0 +1,196 @@
+"""Reenvio em massa de notificações arquivadas na DLQ de volta à validação.
+
+Os reenvios são executados um de cada vez, numa thread própria, em lotes
+publicados na exchange de validação por um canal emprestado do pool de
+publicação da API. Um token bucket limita cada reenvio à sua taxa (no máximo
+taxa_maxima notificações/s), para que esvaziar a DLQ não sobrecarregue as vias
+de validação. Antes da publicação o status volta a REPROCESSAMENTO_AGENDADO e
+os passos de validação e DLQ são liberados no store, senão a deduplicação dos
+estágios descartaria a nova entrega.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID, uuid4
+from pika import BasicProperties
+from . import config, metricas, rastreio
+from .admissao import BaldeTokens
+from .codec import obter_codec
+from .consumers import (
+    arquivo_dlq, atualizar_status, notificacoes_status, declarar_roteamento, ROTEAMENTOS,
+    ESTAGIO_DLQ, ESTAGIOS_VALIDACAO
+)
+from .rabbitmq import aguardar
+from .status_store import CODIGO_POR_STATUS
+
+logger = logging.getLogger(__name__)
+
+
+class ReenvioDLQ:
+    """Um pedido de reenvio: notificações selecionadas, taxa e progresso"""
+
+    def __init__(self, registros, taxa):
+        self.id = str(uuid4())
+        self.registros = registros
+        self.taxa = taxa
+        self.estado = "agendado"
+        self.reenviadas = 0
+        self.falhas = 0
+        self.erro = None
+        self.criado_em = time.time()
+        self.concluido_em = None
+        self.cancelado = threading.Event()
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "estado": self.estado,
+            "total": len(self.registros),
+            "reenviadas": self.reenviadas,
+            "falhas": self.falhas,
+            "taxa": self.taxa,
+            "erro": self.erro,
+            "criadoEm": self.criado_em,
+            "concluidoEm": self.concluido_em
+        }
+
+
+class ReenviadorDLQ:
+    """Agenda e executa os reenvios da DLQ, guardando os últimos historico pedidos"""
+
+    def __init__(self, pool, arquivo=arquivo_dlq, taxa_maxima=50, max_itens=10000, timeout=5,
+                 codec=None, historico=100):
+        self.pool = pool
+        self.arquivo = arquivo
+        self.taxa_maxima = taxa_maxima
+        self.max_itens = max_itens
+        self.timeout = timeout
+        self.codec = codec or obter_codec(config.CODEC)
+        self.historico = historico
+        self._reenvios = OrderedDict()
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def agendar(self, limite=None, taxa=None, **filtros):
+        """Seleciona as notificações pendentes no arquivo e agenda o reenvio.
+
+        taxa (notificações/s) acima de taxa_maxima é reduzida a ela; limite acima
+        de max_itens, a max_itens.
+        """
+        limite = min(limite or self.max_itens, self.max_itens)
+        taxa = min(taxa or self.taxa_maxima, self.taxa_maxima)
+        reenvio = ReenvioDLQ(self.arquivo.consultar(limite=limite, pendentes=True, **filtros), taxa)
+        with self._lock:
+            self._reenvios[reenvio.id] = reenvio
+            while len(self._reenvios) > self.historico:
+                self._reenvios.popitem(last=False)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar_continuamente, name="ReenvioDLQ", daemon=True)
+                self._thread.start()
+        if reenvio.registros:
+            self._fila.put(reenvio)
+        else:
+            self._finalizar(reenvio, "concluido")
+        return reenvio
+
+    def obter(self, reenvio_id):
+        return self._reenvios.get(reenvio_id)
+
+    def cancelar(self, reenvio_id):
+        """Interrompe o reenvio antes do próximo lote; os lotes já publicados seguem no pipeline"""
+        reenvio = self._reenvios.get(reenvio_id)
+        if reenvio is not None:
+            reenvio.cancelado.set()
+            if reenvio.estado == "agendado":
+                self._finalizar(reenvio, "cancelado")
+        return reenvio
+
+    def _executar_continuamente(self):
+        while True:
+            reenvio = self._fila.get()
+            if reenvio.estado == "agendado":
+                self.executar(reenvio)
+
+    def executar(self, reenvio):
+        # Lotes de ~100 ms de vazão: o canal do pool fica emprestado só durante a publicação
+        tamanho_lote = max(1, min(100, int(reenvio.taxa / 10)))
+        balde = BaldeTokens(reenvio.taxa, capacidade=tamanho_lote)
+        reenvio.estado = "executando"
+        logger.info(f"Reenvio {reenvio.id} da DLQ iniciado: {len(reenvio.registros)} notificações a {reenvio.taxa}/s")
+        for inicio in range(0, len(reenvio.registros), tamanho_lote):
+            lote = reenvio.registros[inicio:inicio + tamanho_lote]
+            while (espera := balde.retirar(len(lote))) and not reenvio.cancelado.is_set():
+                reenvio.cancelado.wait(espera)
+            if reenvio.cancelado.is_set():
+                self._finalizar(reenvio, "cancelado")
+                return
+            try:
+                confirmados = self._publicar(lote)
+            except Exception as e:
+                logger.error(f"Reenvio {reenvio.id} da DLQ interrompido: {e}")
+                self._restaurar(lote)
+                reenvio.falhas += len(lote)
+                metricas.DLQ_REENVIADAS.labels("falha").inc(len(lote))
+                reenvio.erro = str(e)
+                self._finalizar(reenvio, "falhou")
+                return
+            aceitos = [registro for registro, confirmado in zip(lote, confirmados) if confirmado]
+            self._restaurar([registro for registro, confirmado in zip(lote, confirmados) if not confirmado])
+            self.arquivo.marcar_reenviadas([registro["trace_id"] for registro in aceitos])
+            reenvio.reenviadas += len(aceitos)
+            reenvio.falhas += len(lote) - len(aceitos)
+            metricas.DLQ_REENVIADAS.labels("sucesso").inc(len(aceitos))
+            metricas.DLQ_REENVIADAS.labels("falha").inc(len(lote) - len(aceitos))
+        self._finalizar(reenvio, "concluido")
+
+    def _finalizar(self, reenvio, estado):
+        reenvio.estado = estado
+        reenvio.concluido_em = time.time()
+        logger.info(
+            f"Reenvio {reenvio.id} da DLQ {estado}: {reenvio.reenviadas} reenviadas, {reenvio.falhas} falhas"
+        )
+
+    def _publicar(self, lote):
+        """Publica o lote na exchange de validação; devolve ack/nack de cada notificação"""
+        for registro in lote:
+            trace_id = UUID(registro["trace_id"])
+            tipo = registro["tipo"]
+            notificacoes_status.desmarcar_passos(trace_id, (ESTAGIOS_VALIDACAO[tipo].passo, ESTAGIO_DLQ.passo))
+            atualizar_status(trace_id, "REPROCESSAMENTO_AGENDADO", registro["dados"])
+
+        exchange, _ = ROTEAMENTOS[config.FILA_VALIDACAO]
+        resultados = [None] * len(lote)
+
+        def registrar(indice):
+            def ao_confirmar(confirmado):
+                resultados[indice] = confirmado
+            return ao_confirmar
+
+        with self.pool.canal() as item:
+            if exchange not in item.filas_declaradas:
+                declarar_roteamento(item.channel, *ROTEAMENTOS[config.FILA_VALIDACAO])
+                item.filas_declaradas.add(exchange)
+            for indice, registro in enumerate(lote):
+                item.publicar(
+                    registro["tipo"],
+                    self.codec.codificar(registro["dados"]),
+                    BasicProperties(delivery_mode=2, content_type=self.codec.content_type,
+                                    headers=rastreio.carimbar({"x-reenvio": registro["reenvios"] + 1},
+                                                              rastreio.novo_span())),
+                    registrar(indice),
+                    exchange=exchange,
+                    origem="reenvio_dlq"
+                )
+            if item.rastreador is None:
+                return [True] * len(lote)
+            aguardar(item.connection, lambda: None not in resultados, self.timeout)
+        return resultados
+
+    def _restaurar(self, registros):
+        """Notificações que não chegaram ao broker voltam ao status com que foram arquivadas"""
+        for registro in registros:
+            if registro["motivo"] in CODIGO_POR_STATUS:
+                atualizar_status(UUID(registro["trace_id"]), registro["motivo"], registro["dados"])
@@ -0,0 +1,18 @@
+"""Backoff de reinício, sem dependências além da configuração.
+
+Fica fora de consumers para que o processo pai do app.worker, que só
+supervisiona os filhos, não precise importar os consumidores (e criar o
+store de status e o arquivo da DLQ) para espaçar as recriações.
+"""
+import random
+from . import config
+
+
+def atraso_reinicio(tentativa):
+    """Backoff exponencial com jitter: metade fixa, metade aleatória, até o teto.
+
+    O jitter evita que todos os estágios (e processos) reconectem juntos
+    depois de uma queda do broker.
+    """
+    teto = min(config.SUPERVISOR_BACKOFF_MAX, config.SUPERVISOR_BACKOFF_BASE * 2 ** (tentativa - 1))
+    return teto / 2 + random.uniform(0, teto / 2)
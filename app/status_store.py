@@ -0,0 +1,772 @@
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from uuid import UUID
+from .models import StatusNotificacao, TipoNotificacao
+
+logger = logging.getLogger(__name__)
+
+STATUS_POR_CODIGO = tuple(status.value for status in StatusNotificacao)
+CODIGO_POR_STATUS = {status: codigo for codigo, status in enumerate(STATUS_POR_CODIGO)}
+TIPO_POR_CODIGO = tuple(tipo.value for tipo in TipoNotificacao)
+CODIGO_POR_TIPO = {tipo: codigo for codigo, tipo in enumerate(TIPO_POR_CODIGO)}
+
+# FALHA_PROCESSAMENTO_INICIAL não é final: a notificação segue para o retry
+STATUS_FINAIS = frozenset(
+    CODIGO_POR_STATUS[status]
+    for status in ("ENVIADO_SUCESSO", "FALHA_FINAL_REPROCESSAMENTO", "FALHA_ENVIO_FINAL")
+)
+
+NOMES_STATUS_FINAIS = frozenset(STATUS_POR_CODIGO[codigo] for codigo in STATUS_FINAIS)
+
+_CODIGO_RECEBIDO = CODIGO_POR_STATUS["RECEBIDO"]
+
+_TAMANHO_BYTEARRAY = sys.getsizeof(bytearray())
+# Tupla da etapa, os dois ids de span e os três floats (o nome do estágio é compartilhado)
+_TAMANHO_ETAPA = sys.getsizeof((None,) * 6) + 2 * sys.getsizeof("0" * 16) + 3 * sys.getsizeof(0.0) + 8
+
+
+def etapa_como_dict(etapa):
+    """(estagio, span, span_pai, inicio, espera, processamento) no formato da API"""
+    estagio, span, span_pai, inicio, espera, processamento = etapa
+    return {
+        "estagio": estagio,
+        "span": span,
+        "spanPai": span_pai,
+        "inicio": inicio,
+        "esperaFila": None if espera is None else round(espera, 6),
+        "processamento": round(processamento, 6)
+    }
+
+
+class RegistroStatus:
+    """Entrada compacta do store: histórico guardado como códigos de um byte"""
+
+    __slots__ = ("mensagem_id", "conteudo", "tipo", "historico", "atualizado_em", "passos", "etapas")
+
+    def __init__(self, mensagem_id, conteudo, tipo, codigo, agora):
+        self.mensagem_id = mensagem_id
+        self.conteudo = conteudo
+        self.tipo = tipo
+        self.historico = bytearray((codigo,))
+        self.atualizado_em = agora
+        self.passos = 0
+        # Spans dos estágios que processaram a notificação, criado na primeira etapa
+        self.etapas = None
+
+    @property
+    def status(self):
+        return self.historico[-1]
+
+    def tamanho_estimado(self):
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.conteudo)
+            + sys.getsizeof(self.mensagem_id) + _TAMANHO_BYTEARRAY + len(self.historico)
+            + (sys.getsizeof(self.etapas) + len(self.etapas) * _TAMANHO_ETAPA if self.etapas else 0)
+        )
+
+    def como_dict(self, trace_id):
+        return {
+            "traceId": trace_id,
+            "mensagemId": self.mensagem_id,
+            "conteudoMensagem": self.conteudo,
+            "tipoNotificacao": TIPO_POR_CODIGO[self.tipo],
+            "status": STATUS_POR_CODIGO[self.status],
+            "historico": [STATUS_POR_CODIGO[codigo] for codigo in self.historico],
+            "etapas": [etapa_como_dict(etapa) for etapa in self.etapas or ()]
+        }
+
+
+class _Fragmento:
+    """Uma faixa do store, com lock, ordem de despejo e contadores próprios.
+
+    _por_mensagem indexa os registros do fragmento por mensagemId: o valor é o
+    traceId, ou uma lista deles quando o mesmo mensagemId gerou mais de uma notificação.
+    """
+
+    def __init__(self, max_entradas, ttl_final, relogio, ttl_idempotencia=86400):
+        self.max_entradas = max_entradas
+        self.ttl_final = ttl_final
+        self.ttl_idempotencia = ttl_idempotencia
+        self._relogio = relogio
+        self._registros = OrderedDict()
+        self._finalizados = deque()
+        self._mensagens = OrderedDict()
+        self._por_mensagem = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._em_andamento = 0
+        self.despejos_ttl = 0
+        self.despejos_capacidade = 0
+
+    def atualizar(self, trace_id, status, dados):
+        self.atualizar_lote([(trace_id, status, dados)])
+
+    def atualizar_lote(self, itens):
+        agora = self._relogio()
+        with self._lock:
+            for trace_id, status, dados in itens:
+                self._aplicar(trace_id, CODIGO_POR_STATUS[status], dados, agora)
+            self._despejar(agora)
+
+    def _aplicar(self, trace_id, codigo, dados, agora):
+        registro = self._registros.get(trace_id)
+        if registro is None:
+            registro = RegistroStatus(
+                UUID(dados["mensagemId"]),
+                dados["conteudoMensagem"],
+                CODIGO_POR_TIPO[dados["tipoNotificacao"]],
+                codigo,
+                agora
+            )
+            self._registros[trace_id] = registro
+            self._bytes += registro.tamanho_estimado()
+            self._indexar(registro.mensagem_id, trace_id)
+            if codigo not in STATUS_FINAIS:
+                self._em_andamento += 1
+        else:
+            if registro.status not in STATUS_FINAIS and codigo in STATUS_FINAIS:
+                self._em_andamento -= 1
+            elif registro.status in STATUS_FINAIS and codigo not in STATUS_FINAIS:
+                # Reenvio da DLQ: a notificação volta ao pipeline
+                self._em_andamento += 1
+            registro.historico.append(codigo)
+            registro.atualizado_em = agora
+            self._registros.move_to_end(trace_id)
+            self._bytes += 1
+
+        if codigo in STATUS_FINAIS:
+            self._finalizados.append((agora + self.ttl_final, trace_id))
+
+    def _despejar(self, agora):
+        while self._finalizados and self._finalizados[0][0] <= agora:
+            expira_em, trace_id = self._finalizados.popleft()
+            registro = self._registros.get(trace_id)
+            if (registro is not None and registro.status in STATUS_FINAIS
+                    and registro.atualizado_em + self.ttl_final <= agora):
+                self._remover(trace_id)
+                self.despejos_ttl += 1
+
+        while len(self._registros) > self.max_entradas:
+            trace_id = next(iter(self._registros))
+            self._remover(trace_id)
+            self.despejos_capacidade += 1
+
+    def _remover(self, trace_id):
+        registro = self._registros.pop(trace_id)
+        self._bytes -= registro.tamanho_estimado()
+        self._desindexar(registro.mensagem_id, trace_id)
+        if registro.status not in STATUS_FINAIS:
+            self._em_andamento -= 1
+
+    def _indexar(self, mensagem_id, trace_id):
+        existente = self._por_mensagem.get(mensagem_id)
+        if existente is None:
+            self._por_mensagem[mensagem_id] = trace_id
+        elif isinstance(existente, list):
+            existente.append(trace_id)
+        else:
+            self._por_mensagem[mensagem_id] = [existente, trace_id]
+
+    def _desindexar(self, mensagem_id, trace_id):
+        existente = self._por_mensagem.get(mensagem_id)
+        if isinstance(existente, list):
+            existente.remove(trace_id)
+            if len(existente) == 1:
+                self._por_mensagem[mensagem_id] = existente[0]
+        elif existente == trace_id:
+            del self._por_mensagem[mensagem_id]
+
+    def obter(self, trace_id):
+        with self._lock:
+            self._despejar(self._relogio())
+            registro = self._registros.get(trace_id)
+            if registro is None:
+                return None
+            return registro.como_dict(trace_id)
+
+    def obter_lote(self, trace_ids):
+        with self._lock:
+            self._despejar(self._relogio())
+            return [
+                registro.como_dict(trace_id)
+                for trace_id in trace_ids
+                if (registro := self._registros.get(trace_id)) is not None
+            ]
+
+    def buscar_por_mensagem(self, mensagem_id):
+        with self._lock:
+            self._despejar(self._relogio())
+            trace_ids = self._por_mensagem.get(mensagem_id)
+            if trace_ids is None:
+                return []
+            if not isinstance(trace_ids, list):
+                trace_ids = [trace_ids]
+            return [self._registros[trace_id].como_dict(trace_id) for trace_id in trace_ids]
+
+    def reservar(self, mensagem_id, trace_id):
+        agora = self._relogio()
+        with self._lock:
+            while self._mensagens:
+                primeira = next(iter(self._mensagens.values()))
+                if primeira[1] + self.ttl_idempotencia > agora:
+                    break
+                self._mensagens.popitem(last=False)
+            existente = self._mensagens.get(mensagem_id)
+            if existente is not None and existente[1] + self.ttl_idempotencia > agora:
+                self._mensagens.move_to_end(mensagem_id)
+                return existente[0]
+            self._mensagens[mensagem_id] = (trace_id, agora)
+            self._mensagens.move_to_end(mensagem_id)
+            if len(self._mensagens) > self.max_entradas:
+                self._mensagens.popitem(last=False)
+            return None
+
+    def liberar(self, mensagem_id, trace_id):
+        with self._lock:
+            existente = self._mensagens.get(mensagem_id)
+            if existente is not None and existente[0] == trace_id:
+                del self._mensagens[mensagem_id]
+
+    def marcar_passo(self, trace_id, passo):
+        with self._lock:
+            registro = self._registros.get(trace_id)
+            if registro is not None:
+                registro.passos |= 1 << passo
+
+    def registrar_etapa(self, trace_id, etapa):
+        with self._lock:
+            registro = self._registros.get(trace_id)
+            if registro is not None:
+                self._bytes -= registro.tamanho_estimado()
+                if registro.etapas is None:
+                    registro.etapas = []
+                registro.etapas.append(etapa)
+                self._bytes += registro.tamanho_estimado()
+
+    def desmarcar_passos(self, trace_id, mascara):
+        with self._lock:
+            registro = self._registros.get(trace_id)
+            if registro is not None:
+                registro.passos &= ~mascara
+
+    def passo_concluido(self, trace_id, passo):
+        with self._lock:
+            registro = self._registros.get(trace_id)
+            return registro is not None and bool(registro.passos & (1 << passo))
+
+    def estatisticas(self):
+        with self._lock:
+            return len(self._registros), self._bytes, self.despejos_ttl, self.despejos_capacidade
+
+    def em_andamento(self):
+        return self._em_andamento
+
+    def clear(self):
+        with self._lock:
+            self._registros.clear()
+            self._finalizados.clear()
+            self._mensagens.clear()
+            self._por_mensagem.clear()
+            self._bytes = 0
+            self._em_andamento = 0
+
+    def __contains__(self, trace_id):
+        with self._lock:
+            self._despejar(self._relogio())
+            return trace_id in self._registros
+
+    def __len__(self):
+        return len(self._registros)
+
+
+class StatusStore:
+    """Store de status em memória com tamanho máximo e TTL para estados finais.
+
+    As entradas são distribuídas em fragmentos pelo traceId, cada um com o seu
+    lock, para que atualizações de notificações diferentes não disputem o mesmo
+    lock. Leituras copiam o registro sob o lock do fragmento. O índice de
+    idempotência (mensagemId -> traceId) usa os mesmos fragmentos, com LRU e TTL;
+    o índice secundário de buscar_por_mensagem fica em cada fragmento, junto
+    dos registros, e a busca consulta todos eles.
+    """
+
+    def __init__(self, max_entradas=100000, ttl_final=3600, fragmentos=16, relogio=time.monotonic,
+                 ttl_idempotencia=86400):
+        self.max_entradas = max_entradas
+        self.ttl_final = ttl_final
+        por_fragmento = max(1, -(-max_entradas // fragmentos))
+        self._fragmentos = [
+            _Fragmento(por_fragmento, ttl_final, relogio, ttl_idempotencia) for _ in range(fragmentos)
+        ]
+
+    def _fragmento(self, trace_id):
+        return self._fragmentos[hash(trace_id) % len(self._fragmentos)]
+
+    def atualizar(self, trace_id, status, dados):
+        self._fragmento(trace_id).atualizar(trace_id, status, dados)
+
+    def atualizar_lote(self, itens):
+        """Aplica várias atualizações tomando o lock de cada fragmento uma só vez"""
+        por_fragmento = {}
+        for item in itens:
+            por_fragmento.setdefault(self._fragmento(item[0]), []).append(item)
+        for fragmento, grupo in por_fragmento.items():
+            fragmento.atualizar_lote(grupo)
+
+    def obter(self, trace_id):
+        return self._fragmento(trace_id).obter(trace_id)
+
+    def obter_lote(self, trace_ids):
+        """Status das notificações existentes entre trace_ids, um lock por fragmento"""
+        por_fragmento = {}
+        for trace_id in trace_ids:
+            por_fragmento.setdefault(self._fragmento(trace_id), []).append(trace_id)
+        encontrados = []
+        for fragmento, grupo in por_fragmento.items():
+            encontrados.extend(fragmento.obter_lote(grupo))
+        return encontrados
+
+    def buscar_por_mensagem(self, mensagem_id):
+        """Status de todas as notificações geradas com o mensagemId"""
+        encontrados = []
+        for fragmento in self._fragmentos:
+            encontrados.extend(fragmento.buscar_por_mensagem(mensagem_id))
+        return encontrados
+
+    def reservar_mensagem(self, mensagem_id, trace_id):
+        """Associa o mensagemId ao traceId; se já havia associação, devolve o traceId original"""
+        return self._fragmento(mensagem_id).reservar(mensagem_id, trace_id)
+
+    def liberar_mensagem(self, mensagem_id, trace_id):
+        """Desfaz a reserva (ex.: publicação falhou) para que o cliente possa repetir"""
+        self._fragmento(mensagem_id).liberar(mensagem_id, trace_id)
+
+    def marcar_passo(self, trace_id, passo):
+        self._fragmento(trace_id).marcar_passo(trace_id, passo)
+
+    def registrar_etapa(self, trace_id, estagio, span, span_pai, inicio, espera, processamento):
+        """Anexa o span de um estágio: início (epoch), espera na fila e processamento, em segundos"""
+        self._fragmento(trace_id).registrar_etapa(
+            trace_id, (estagio, span, span_pai, inicio, espera, processamento)
+        )
+
+    def desmarcar_passos(self, trace_id, passos):
+        """Libera os passos para uma nova entrega (ex.: reenvio da DLQ)"""
+        self._fragmento(trace_id).desmarcar_passos(trace_id, sum(1 << passo for passo in set(passos)))
+
+    def passo_concluido(self, trace_id, passo):
+        return self._fragmento(trace_id).passo_concluido(trace_id, passo)
+
+    def em_andamento(self):
+        """Notificações ainda sem status final"""
+        return sum(fragmento.em_andamento() for fragmento in self._fragmentos)
+
+    def estatisticas(self):
+        entradas = bytes_estimados = despejos_ttl = despejos_capacidade = 0
+        for fragmento in self._fragmentos:
+            e, b, t, c = fragmento.estatisticas()
+            entradas += e
+            bytes_estimados += b
+            despejos_ttl += t
+            despejos_capacidade += c
+        return {
+            "entradas": entradas,
+            "bytesEstimados": bytes_estimados,
+            "despejosTtl": despejos_ttl,
+            "despejosCapacidade": despejos_capacidade,
+            "fragmentos": len(self._fragmentos)
+        }
+
+    def clear(self):
+        for fragmento in self._fragmentos:
+            fragmento.clear()
+
+    def __contains__(self, trace_id):
+        return trace_id in self._fragmento(trace_id)
+
+    def __len__(self):
+        return sum(len(fragmento) for fragmento in self._fragmentos)
+
+
+class SQLiteStatusStore:
+    """Store de status compartilhado entre processos em um arquivo SQLite (WAL).
+
+    As atualizações são acumuladas em memória e gravadas em lote por uma thread
+    de fundo; leituras no mesmo processo descarregam o lote pendente antes de
+    consultar, então a API sempre enxerga as próprias escritas. O RECEBIDO é a
+    exceção: a API o grava na hora, antes de publicar, para que a transição de
+    um consumidor em outro processo nunca chegue ao arquivo antes dele. Entradas
+    em estado final mais antigas que o TTL são podadas periodicamente.
+    """
+
+    def __init__(self, caminho, ttl_final=3600, intervalo=0.05, tamanho_lote=500, intervalo_poda=60,
+                 ttl_idempotencia=86400):
+        self.caminho = caminho
+        self.ttl_final = ttl_final
+        self.ttl_idempotencia = ttl_idempotencia
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_poda = intervalo_poda
+        self._local = threading.local()
+        self._pendentes = []
+        # Passos marcados neste processo e ainda não gravados (trace_id -> máscara),
+        # consultados por passo_concluido sem forçar a gravação do lote
+        self._passos_pendentes = {}
+        self._passos_gravando = {}
+        self._etapas_pendentes = []
+        self._lock = threading.Lock()
+        self._gravacao = threading.Lock()
+        self._sinal = threading.Event()
+        self._parar = threading.Event()
+        self._ultima_poda = time.time()
+        self.lotes_gravados = 0
+        self.removidos_poda = 0
+
+        conexao = self._conexao()
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS notificacoes (
+                trace_id TEXT PRIMARY KEY,
+                mensagem_id TEXT NOT NULL,
+                conteudo TEXT NOT NULL,
+                tipo INTEGER NOT NULL,
+                historico TEXT NOT NULL,
+                atualizado_em REAL NOT NULL,
+                final INTEGER NOT NULL,
+                passos INTEGER NOT NULL DEFAULT 0,
+                etapas TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_notificacoes_mensagem ON notificacoes (mensagem_id);
+            CREATE INDEX IF NOT EXISTS idx_notificacoes_final ON notificacoes (final, atualizado_em);
+            CREATE TABLE IF NOT EXISTS idempotencia (
+                mensagem_id TEXT PRIMARY KEY,
+                trace_id TEXT NOT NULL,
+                criado_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_idempotencia_criado ON idempotencia (criado_em);
+        """)
+        colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(notificacoes)")}
+        for coluna, definicao in (("passos", "INTEGER NOT NULL DEFAULT 0"), ("etapas", "TEXT NOT NULL DEFAULT ''")):
+            if coluna not in colunas:
+                try:
+                    with conexao:
+                        conexao.execute(f"ALTER TABLE notificacoes ADD COLUMN {coluna} {definicao}")
+                except sqlite3.OperationalError as e:
+                    # Outro processo migrou o arquivo ao mesmo tempo
+                    if "duplicate column" not in str(e):
+                        raise
+
+        self._thread = threading.Thread(target=self._gravar_continuamente, name="StatusStore-SQLite", daemon=True)
+        self._thread.start()
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def atualizar(self, trace_id, status, dados):
+        self.atualizar_lote([(trace_id, status, dados)])
+
+    def atualizar_lote(self, itens):
+        agora = time.time()
+        linhas = []
+        iniciais = []
+        for trace_id, status, dados in itens:
+            codigo = CODIGO_POR_STATUS[status]
+            (iniciais if codigo == _CODIGO_RECEBIDO else linhas).append((
+                str(trace_id),
+                dados["mensagemId"],
+                dados["conteudoMensagem"],
+                CODIGO_POR_TIPO[dados["tipoNotificacao"]],
+                str(codigo),
+                agora,
+                int(codigo in STATUS_FINAIS)
+            ))
+        if iniciais:
+            conexao = self._conexao()
+            with conexao:
+                conexao.executemany(self._INSERIR, iniciais)
+        if not linhas:
+            return
+        with self._lock:
+            self._pendentes.extend(linhas)
+            cheio = len(self._pendentes) >= self.tamanho_lote
+        if cheio:
+            self._sinal.set()
+
+    def descarregar(self):
+        """Grava o lote pendente em uma única transação"""
+        with self._gravacao:
+            with self._lock:
+                linhas, self._pendentes = self._pendentes, []
+                passos, self._passos_pendentes = self._passos_pendentes, {}
+                etapas, self._etapas_pendentes = self._etapas_pendentes, []
+                self._passos_gravando = passos
+            if not linhas and not passos and not etapas:
+                return
+            conexao = self._conexao()
+            try:
+                with conexao:
+                    conexao.executemany(self._INSERIR, linhas)
+                    conexao.executemany(
+                        "UPDATE notificacoes SET passos = passos | ? WHERE trace_id = ?",
+                        [(mascara, trace_id) for trace_id, mascara in passos.items()]
+                    )
+                    conexao.executemany(
+                        "UPDATE notificacoes SET etapas = etapas || ? WHERE trace_id = ?", etapas
+                    )
+            finally:
+                with self._lock:
+                    self._passos_gravando = {}
+            self.lotes_gravados += 1
+
+    _INSERIR = """
+        INSERT INTO notificacoes
+            (trace_id, mensagem_id, conteudo, tipo, historico, atualizado_em, final)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (trace_id) DO UPDATE SET
+            historico = historico || ',' || excluded.historico,
+            atualizado_em = excluded.atualizado_em,
+            final = excluded.final
+    """
+
+    def podar(self):
+        limite = time.time() - self.ttl_final
+        conexao = self._conexao()
+        with conexao:
+            cursor = conexao.execute(
+                "DELETE FROM notificacoes WHERE final = 1 AND atualizado_em < ?", (limite,)
+            )
+            conexao.execute(
+                "DELETE FROM idempotencia WHERE criado_em < ?", (time.time() - self.ttl_idempotencia,)
+            )
+        self.removidos_poda += cursor.rowcount
+
+    def _gravar_continuamente(self):
+        while not self._parar.is_set():
+            self._sinal.wait(self.intervalo)
+            self._sinal.clear()
+            try:
+                self.descarregar()
+                if time.time() - self._ultima_poda >= self.intervalo_poda:
+                    self._ultima_poda = time.time()
+                    self.podar()
+            except Exception as e:
+                logger.error(f"Erro ao gravar lote de status no SQLite: {e}")
+
+    _COLUNAS = "trace_id, mensagem_id, conteudo, tipo, historico, etapas"
+
+    def obter(self, trace_id):
+        if self._pendentes or self._etapas_pendentes:
+            self.descarregar()
+        linha = self._conexao().execute(
+            f"SELECT {self._COLUNAS} FROM notificacoes WHERE trace_id = ?", (str(trace_id),)
+        ).fetchone()
+        return None if linha is None else self._como_dict(linha, trace_id)
+
+    def obter_lote(self, trace_ids, tamanho_consulta=500):
+        """Status das notificações existentes entre trace_ids, em consultas IN de até tamanho_consulta"""
+        if self._pendentes or self._etapas_pendentes:
+            self.descarregar()
+        trace_ids = [str(trace_id) for trace_id in trace_ids]
+        encontrados = []
+        conexao = self._conexao()
+        for inicio in range(0, len(trace_ids), tamanho_consulta):
+            grupo = trace_ids[inicio:inicio + tamanho_consulta]
+            marcadores = ",".join("?" * len(grupo))
+            linhas = conexao.execute(
+                f"SELECT {self._COLUNAS} FROM notificacoes WHERE trace_id IN ({marcadores})", grupo
+            ).fetchall()
+            encontrados.extend(self._como_dict(linha) for linha in linhas)
+        return encontrados
+
+    def buscar_por_mensagem(self, mensagem_id):
+        """Status de todas as notificações geradas com o mensagemId (índice idx_notificacoes_mensagem)"""
+        if self._pendentes or self._etapas_pendentes:
+            self.descarregar()
+        linhas = self._conexao().execute(
+            f"SELECT {self._COLUNAS} FROM notificacoes WHERE mensagem_id = ? ORDER BY rowid", (str(mensagem_id),)
+        ).fetchall()
+        return [self._como_dict(linha) for linha in linhas]
+
+    def _como_dict(self, linha, trace_id=None):
+        trace_texto, mensagem_id, conteudo, tipo, historico, etapas = linha
+        historico = [STATUS_POR_CODIGO[int(codigo)] for codigo in historico.split(",")]
+        return {
+            "traceId": trace_id if trace_id is not None else UUID(trace_texto),
+            "mensagemId": UUID(mensagem_id),
+            "conteudoMensagem": conteudo,
+            "tipoNotificacao": TIPO_POR_CODIGO[tipo],
+            "status": historico[-1],
+            "historico": historico,
+            "etapas": [self._ler_etapa(etapa) for etapa in etapas.split(";") if etapa]
+        }
+
+    @staticmethod
+    def _ler_etapa(texto):
+        estagio, span, span_pai, inicio, espera, processamento = texto.split(",")
+        return etapa_como_dict((
+            estagio, span, span_pai or None, float(inicio),
+            float(espera) if espera else None, float(processamento)
+        ))
+
+    def reservar_mensagem(self, mensagem_id, trace_id):
+        """Reserva atômica entre processos; reservas expiradas são substituídas"""
+        agora = time.time()
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute("""
+                INSERT INTO idempotencia (mensagem_id, trace_id, criado_em) VALUES (?, ?, ?)
+                ON CONFLICT (mensagem_id) DO UPDATE SET
+                    trace_id = excluded.trace_id,
+                    criado_em = excluded.criado_em
+                WHERE idempotencia.criado_em < ?
+            """, (str(mensagem_id), str(trace_id), agora, agora - self.ttl_idempotencia))
+            existente = conexao.execute(
+                "SELECT trace_id FROM idempotencia WHERE mensagem_id = ?", (str(mensagem_id),)
+            ).fetchone()[0]
+        return None if existente == str(trace_id) else UUID(existente)
+
+    def liberar_mensagem(self, mensagem_id, trace_id):
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute(
+                "DELETE FROM idempotencia WHERE mensagem_id = ? AND trace_id = ?",
+                (str(mensagem_id), str(trace_id))
+            )
+
+    def marcar_passo(self, trace_id, passo):
+        trace_id = str(trace_id)
+        with self._lock:
+            self._passos_pendentes[trace_id] = self._passos_pendentes.get(trace_id, 0) | 1 << passo
+
+    def registrar_etapa(self, trace_id, estagio, span, span_pai, inicio, espera, processamento):
+        espera = "" if espera is None else repr(espera)
+        texto = f"{estagio},{span},{span_pai or ''},{inicio!r},{espera},{processamento!r};"
+        with self._lock:
+            self._etapas_pendentes.append((texto, str(trace_id)))
+
+    def desmarcar_passos(self, trace_id, passos):
+        self.descarregar()
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute(
+                "UPDATE notificacoes SET passos = passos & ~? WHERE trace_id = ?",
+                (sum(1 << passo for passo in set(passos)), str(trace_id))
+            )
+
+    def passo_concluido(self, trace_id, passo):
+        # Sem descarregar o lote: os passos deste processo ainda não gravados
+        # estão em memória, os dos demais processos já estão no arquivo
+        trace_id = str(trace_id)
+        with self._lock:
+            mascara = self._passos_pendentes.get(trace_id, 0) | self._passos_gravando.get(trace_id, 0)
+        if mascara & (1 << passo):
+            return True
+        linha = self._conexao().execute(
+            "SELECT passos FROM notificacoes WHERE trace_id = ?", (trace_id,)
+        ).fetchone()
+        return linha is not None and bool(linha[0] & (1 << passo))
+
+    def em_andamento(self):
+        """Notificações ainda sem status final, incluindo as pendentes de gravação"""
+        self.descarregar()
+        linha = self._conexao().execute("SELECT COUNT(*) FROM notificacoes WHERE final = 0").fetchone()
+        return linha[0]
+
+    def estatisticas(self):
+        return {
+            "entradas": len(self),
+            "pendentes": len(self._pendentes),
+            "lotesGravados": self.lotes_gravados,
+            "removidosPoda": self.removidos_poda
+        }
+
+    def clear(self):
+        with self._lock:
+            self._pendentes = []
+            self._passos_pendentes = {}
+            self._etapas_pendentes = []
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute("DELETE FROM notificacoes")
+            conexao.execute("DELETE FROM idempotencia")
+
+    def fechar(self):
+        self._parar.set()
+        self._sinal.set()
+        self._thread.join()
+        self.descarregar()
+
+    def __contains__(self, trace_id):
+        return self.obter(trace_id) is not None
+
+    def __len__(self):
+        if self._pendentes:
+            self.descarregar()
+        return self._conexao().execute("SELECT COUNT(*) FROM notificacoes").fetchone()[0]
+
+
+class AssinaturasStatus:
+    """Avisa quem aguarda um traceId quando o status dele muda.
+
+    Cada assinante recebe um threading.Event, sinalizado a cada atualização do
+    traceId. Sem assinantes, notificar custa uma consulta a um dict vazio.
+    """
+
+    def __init__(self):
+        self._assinantes = {}
+        self._lock = threading.Lock()
+
+    def assinar(self, trace_id):
+        evento = threading.Event()
+        with self._lock:
+            self._assinantes.setdefault(trace_id, set()).add(evento)
+        return evento
+
+    def cancelar(self, trace_id, evento):
+        with self._lock:
+            eventos = self._assinantes.get(trace_id)
+            if eventos is not None:
+                eventos.discard(evento)
+                if not eventos:
+                    del self._assinantes[trace_id]
+
+    def notificar(self, trace_id):
+        if trace_id not in self._assinantes:
+            return
+        with self._lock:
+            eventos = list(self._assinantes.get(trace_id, ()))
+        for evento in eventos:
+            evento.set()
+
+    def __len__(self):
+        return len(self._assinantes)
+
+
+def criar_status_store(backend, **opcoes):
+    """Cria o backend de status configurado ("memoria" ou "sqlite").
+
+    Todo backend expõe atualizar, atualizar_lote, obter, reservar_mensagem,
+    liberar_mensagem, marcar_passo, desmarcar_passos, passo_concluido,
+    registrar_etapa, obter_lote, buscar_por_mensagem, em_andamento,
+    estatisticas, clear, __contains__ e __len__.
+    """
+    ttl_idempotencia = opcoes.get("ttl_idempotencia", 86400)
+    if backend == "memoria":
+        return StatusStore(
+            max_entradas=opcoes["max_entradas"],
+            ttl_final=opcoes["ttl_final"],
+            ttl_idempotencia=ttl_idempotencia
+        )
+    if backend == "sqlite":
+        return SQLiteStatusStore(opcoes["caminho"], ttl_final=opcoes["ttl_final"],
+                                 ttl_idempotencia=ttl_idempotencia)
+    raise ValueError(f"Backend de status desconhecido: {backend}")
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from . import config
+from .consumers import ESTAGIOS, EstadoEstagio, executar_estagio, atraso_reinicio, nome_unidade
+
+logger = logging.getLogger(__name__)
+
+
+class SupervisorConsumidores:
+    """Sobe todos os estágios em paralelo e mantém as threads de consumo vivas.
+
+    Cada estágio já reconecta sozinho (executar_estagio); o supervisor cobre o
+    caso de a thread morrer, recriando-a com backoff e jitter. Com vários nós
+    do broker, cada estágio consome de todos (uma unidade estágio@nó por nó).
+    A saúde de cada unidade fica em estados, e pronto indica que todos os
+    estágios estão consumindo de ao menos um nó.
+    """
+
+    def __init__(self, estagios=ESTAGIOS, motor=None, intervalo=1):
+        self.estagios = list(estagios)
+        self.motor = motor or config.MOTOR_CONSUMIDORES
+        self.intervalo = intervalo
+        self._por_unidade = {
+            nome_unidade(estagio.nome, no): (estagio, no)
+            for estagio in self.estagios
+            for no in range(len(config.BROKER_NOS))
+        }
+        self.estados = {unidade: EstadoEstagio(unidade) for unidade in self._por_unidade}
+        self.iniciado = False
+        self._threads = {}
+        self._mortes = {}
+        self._proxima_tentativa = {}
+        self._parar = threading.Event()
+        self._monitor = None
+
+    def iniciar(self):
+        if self.iniciado:
+            return
+        self.iniciado = True
+        for nome in self._unidades():
+            self._iniciar_thread(nome)
+        self._monitor = threading.Thread(target=self._monitorar, name="Supervisor-Consumidores", daemon=True)
+        self._monitor.start()
+        logger.info(f"Supervisor iniciou {len(self.estagios)} estágios (motor: {self.motor})")
+
+    def _unidades(self):
+        # No motor asyncio um único event loop roda todos os estágios
+        if self.motor == "asyncio":
+            return ["asyncio"]
+        return list(self.estados)
+
+    def _alvo(self, nome):
+        if nome == "asyncio":
+            from .consumers_async import iniciar_consumidores_assincronos
+            return lambda: iniciar_consumidores_assincronos(self.estados, self.estagios)
+        estagio, no = self._por_unidade[nome]
+        return lambda: executar_estagio(estagio, self._parar, self.estados[nome], no)
+
+    def _iniciar_thread(self, nome):
+        thread = threading.Thread(target=self._alvo(nome), name=f"Consumer-{nome}", daemon=True)
+        self._threads[nome] = thread
+        thread.start()
+
+    def _monitorar(self):
+        while not self._parar.wait(self.intervalo):
+            for nome, thread in list(self._threads.items()):
+                if thread.is_alive() or self._parar.is_set():
+                    continue
+                agora = time.monotonic()
+                if nome not in self._proxima_tentativa:
+                    self._mortes[nome] = self._mortes.get(nome, 0) + 1
+                    espera = atraso_reinicio(self._mortes[nome])
+                    self._proxima_tentativa[nome] = agora + espera
+                    for estado in self._estados_da_unidade(nome):
+                        estado.falhou("thread de consumo encerrada")
+                    logger.error(f"Thread do estágio {nome} encerrou; recriando em {espera:.1f}s")
+                elif agora >= self._proxima_tentativa[nome]:
+                    del self._proxima_tentativa[nome]
+                    self._iniciar_thread(nome)
+
+    def _estados_da_unidade(self, nome):
+        return list(self.estados.values()) if nome == "asyncio" else [self.estados[nome]]
+
+    @property
+    def pronto(self):
+        # Um nó fora do ar não tira o estágio do ar: os demais nós seguem consumindo
+        consumindo = {self._por_unidade[unidade][0].nome for unidade, estado in self.estados.items()
+                      if estado.saudavel}
+        return self.iniciado and all(estagio.nome in consumindo for estagio in self.estagios)
+
+    def saude(self):
+        return {nome: estado.como_dict() for nome, estado in self.estados.items()}
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        for thread in self._threads.values():
+            thread.join(timeout)
+
+    def aguardar(self):
+        """Bloqueia enquanto o supervisor estiver ativo"""
+        self._parar.wait()
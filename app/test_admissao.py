@@ -0,0 +1,162 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+from uuid import uuid4
+import pika
+import pytest
+from app.admissao import BaldeTokens, ControleAdmissao, AdmissaoRecusada
+from app.app import app, controle_admissao, pool_publicacao
+from app.broker_memoria import BrokerMemoria
+from app.consumers import notificacoes_status
+from app.rabbitmq import RabbitMQConnection, PoolPublicacao
+from app.status_store import StatusStore
+
+class Relogio:
+    def __init__(self):
+        self.agora = 100.0
+
+    def __call__(self):
+        return self.agora
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+    notificacoes_status.clear()
+
+def test_balde_de_tokens_limita_rajada_e_informa_espera():
+    relogio = Relogio()
+    balde = BaldeTokens(taxa=2, capacidade=3, relogio=relogio)
+
+    assert [balde.retirar() for _ in range(3)] == [0, 0, 0]
+    assert balde.retirar() == pytest.approx(0.5)
+
+    relogio.agora += 1
+    assert balde.retirar(2) == 0
+    assert balde.retirar() == pytest.approx(0.5)
+
+def test_balde_com_taxa_abaixo_de_um_por_segundo_ainda_atende():
+    relogio = Relogio()
+    balde = BaldeTokens(taxa=0.5, relogio=relogio)
+
+    assert balde.retirar() == 0
+    assert balde.retirar() == pytest.approx(2)
+    relogio.agora += 2
+    assert balde.retirar() == 0
+
+def test_recusa_acima_da_marca_de_backlog_e_ignora_amostra_velha():
+    relogio = Relogio()
+    amostrador = SimpleNamespace(profundidades={'entrada': 60, 'retry': 50, 'dlq': 1000}, amostrado_em=relogio())
+    controle = ControleAdmissao(amostrador, ['entrada', 'retry'], max_fila=100, retry_after=2.5,
+                                validade_amostra=30, relogio=relogio)
+
+    with pytest.raises(AdmissaoRecusada) as erro:
+        controle.verificar_pipeline()
+    assert (erro.value.motivo, erro.value.codigo, erro.value.retry_after) == ("fila", 429, 3)
+
+    relogio.agora += 31
+    controle.verificar_pipeline()
+
+def test_em_andamento_lido_com_cache():
+    relogio = Relogio()
+    leituras = []
+    def em_andamento():
+        leituras.append(relogio())
+        return 10
+    controle = ControleAdmissao(em_andamento=em_andamento, max_em_andamento=10, relogio=relogio)
+
+    for _ in range(3):
+        with pytest.raises(AdmissaoRecusada):
+            controle.verificar_pipeline()
+    assert len(leituras) == 1
+
+def test_status_store_conta_notificacoes_sem_status_final():
+    store = StatusStore(fragmentos=2)
+    dados = {"mensagemId": str(uuid4()), "conteudoMensagem": "x", "tipoNotificacao": "EMAIL"}
+    traces = [uuid4() for _ in range(3)]
+    for trace_id in traces:
+        store.atualizar(trace_id, "RECEBIDO", dados)
+    store.atualizar(traces[0], "PROCESSADO_INTERMEDIARIO", dados)
+    store.atualizar(traces[0], "ENVIADO_SUCESSO", dados)
+
+    assert store.em_andamento() == 2
+
+def test_api_responde_429_com_retry_after_acima_da_marca(client):
+    amostrador = SimpleNamespace(profundidades={}, amostrado_em=None)
+    with patch.object(controle_admissao, 'amostrador', amostrador), \
+         patch.object(controle_admissao, 'max_fila', 10), \
+         patch.object(controle_admissao, 'retry_after', 7):
+        amostrador.profundidades = {controle_admissao.filas[0]: 10}
+        amostrador.amostrado_em = controle_admissao._relogio()
+        response = client.post('/api/notificar', json={'conteudoMensagem': 'x', 'tipoNotificacao': 'SMS'})
+        lote = client.post('/api/notificar/lote', json=[{'conteudoMensagem': 'x', 'tipoNotificacao': 'SMS'}])
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+    assert response.get_json()['motivo'] == 'fila'
+    assert lote.status_code == 429
+    assert len(notificacoes_status) == 0
+
+def test_reenvio_de_mensagem_aceita_nao_passa_pela_admissao(client):
+    """O retry do cliente recebe o traceId original mesmo com o pipeline recusando novas notificações"""
+    mensagem_id = str(uuid4())
+    item = {'conteudoMensagem': 'x', 'tipoNotificacao': 'SMS', 'mensagemId': mensagem_id}
+    with patch.object(pool_publicacao, 'publicar', return_value=None):
+        primeira = client.post('/api/notificar', json=item)
+
+    amostrador = SimpleNamespace(profundidades={controle_admissao.filas[0]: 10}, amostrado_em=controle_admissao._relogio())
+    with patch.object(controle_admissao, 'amostrador', amostrador), patch.object(controle_admissao, 'max_fila', 10):
+        segunda = client.post('/api/notificar', json=item)
+        lote = client.post('/api/notificar/lote', json=[item, {'conteudoMensagem': 'y', 'tipoNotificacao': 'SMS'}])
+        nova = client.post('/api/notificar', json={**item, 'mensagemId': str(uuid4())})
+
+    trace_id = primeira.get_json()['traceId']
+    assert segunda.status_code == 202 and segunda.get_json()['traceId'] == trace_id
+    assert lote.status_code == 202
+    assert lote.get_json()['resultados'][0]['traceId'] == trace_id
+    assert 'retryAfter' in lote.get_json()['resultados'][1]
+    assert nova.status_code == 429
+
+def test_lote_aplica_limite_de_taxa_por_tipo(client):
+    with patch.object(controle_admissao, 'baldes', {'SMS': BaldeTokens(taxa=0.5, capacidade=1)}), \
+         patch.object(pool_publicacao, 'publicar_lote', side_effect=lambda fila, corpos, *a, **k: [True] * len(corpos)):
+        response = client.post('/api/notificar/lote', json=[
+            {'conteudoMensagem': 'a', 'tipoNotificacao': 'SMS'},
+            {'conteudoMensagem': 'b', 'tipoNotificacao': 'SMS'},
+            {'conteudoMensagem': 'c', 'tipoNotificacao': 'EMAIL'}
+        ])
+        somente_sms = client.post('/api/notificar/lote', json=[{'conteudoMensagem': 'd', 'tipoNotificacao': 'SMS'}])
+
+    resultados = response.get_json()['resultados']
+    assert response.status_code == 202
+    assert 'traceId' in resultados[0] and 'traceId' in resultados[2]
+    assert resultados[1]['retryAfter'] == 2
+    assert somente_sms.status_code == 429
+    assert somente_sms.headers['Retry-After'] == '2'
+
+def test_bloqueio_do_broker_vira_503_com_retry_after(client):
+    with patch.object(pool_publicacao, 'publicar', side_effect=pika.exceptions.ConnectionBlockedTimeout()):
+        response = client.post('/api/notificar', json={
+            'conteudoMensagem': 'x', 'tipoNotificacao': 'EMAIL', 'mensagemId': str(uuid4())
+        })
+    assert response.status_code == 503
+    assert response.get_json()['motivo'] == 'broker_bloqueado'
+    assert 'Retry-After' in response.headers
+
+def test_pool_acompanha_connection_blocked_e_unblocked():
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    pool = PoolPublicacao(tamanho=1, prefixo="teste-bloqueio")
+    try:
+        assert pool.publicar('fila.bloqueio', b'1', None, aguardar_confirmacao=True) is True
+        broker.bloquear()
+        assert pool.publicar('fila.bloqueio', b'2', None, aguardar_confirmacao=True) is True
+        assert pool.bloqueado()
+
+        broker.bloquear(False)
+        pool._bloqueio_verificado_em = 0.0
+        assert not pool.bloqueado()
+    finally:
+        pool.fechar()
+        broker.derrubar()
+        RabbitMQConnection.configurar_transporte(transporte_original)
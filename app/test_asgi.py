@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from uuid import UUID, uuid4
+import pytest
+from app import config
+from app.app import app as app_flask, preparar_notificacao, publicador_assincrono, resposta_status
+from app.asgi import app
+from app.broker_memoria import BrokerMemoria
+from app.consumers import notificacoes_status
+from app.rabbitmq import PublicadorAssincrono, RabbitMQConnection
+
+@pytest.fixture
+def broker():
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    notificacoes_status.clear()
+    yield broker
+    publicador_assincrono.fechar()
+    RabbitMQConnection.configurar_transporte(transporte_original)
+    notificacoes_status.clear()
+
+def chamar(metodo, caminho, dados=None, query=""):
+    """Executa uma requisição HTTP no app ASGI e devolve (status, headers, corpo)"""
+    return asyncio.run(requisicao(metodo, caminho, dados, query))
+
+async def requisicao(metodo, caminho, dados=None, query=""):
+    corpo = json.dumps(dados).encode() if dados is not None else b""
+    scope = {
+        "type": "http", "method": metodo, "path": caminho, "query_string": query.encode(),
+        "headers": [(b"content-type", b"application/json")] if dados is not None else [],
+        "http_version": "1.1", "scheme": "http", "server": ("testserver", 80)
+    }
+    recebidas = [{"type": "http.request", "body": corpo, "more_body": False}]
+    enviadas = []
+
+    async def receive():
+        return recebidas.pop(0) if recebidas else {"type": "http.disconnect"}
+
+    async def send(mensagem):
+        enviadas.append(mensagem)
+
+    await app(scope, receive, send)
+    headers = {nome.decode(): valor.decode() for nome, valor in enviadas[0]["headers"]}
+    return enviadas[0]["status"], headers, b"".join(mensagem.get("body", b"") for mensagem in enviadas[1:])
+
+def test_notificar_e_consultar_status_como_a_api_flask(broker):
+    """Mesmos códigos e corpos da API Flask, com a publicação confirmada pelo broker"""
+    status, _, corpo = chamar("POST", "/api/notificar", {'conteudoMensagem': 'Oi', 'tipoNotificacao': 'SMS'},
+                              query="aguardarConfirmacao=true")
+    assert status == 202
+    resposta = json.loads(corpo)
+    UUID(resposta['traceId'])
+    assert broker.profundidade(config.FILA_ENTRADA) == 1
+
+    status, _, corpo = chamar("GET", f"/api/notificacao/status/{resposta['traceId']}")
+    flask = app_flask.test_client().get(f"/api/notificacao/status/{resposta['traceId']}")
+    assert status == flask.status_code == 200
+    assert json.loads(corpo) == flask.get_json()
+    assert flask.get_json()['status'] == 'RECEBIDO'
+
+    for caminho, query in ((f"/api/notificacao/status/{uuid4()}", ""), ("/api/notificacao/status/abc", ""),
+                           (f"/api/notificacao/status/{resposta['traceId']}", "campos=nada")):
+        status, _, corpo = chamar("GET", caminho, query=query)
+        flask = app_flask.test_client().get(f"{caminho}?{query}")
+        assert (status, json.loads(corpo)) == (flask.status_code, flask.get_json())
+
+def test_notificar_invalido_responde_como_a_api_flask(broker):
+    for dados in ({'conteudoMensagem': 'Oi'}, {'conteudoMensagem': 'Oi', 'tipoNotificacao': 'FAX'},
+                  {'conteudoMensagem': 'Oi', 'tipoNotificacao': 'SMS', 'prioridade': 300}):
+        status, _, corpo = chamar("POST", "/api/notificar", dados)
+        flask = app_flask.test_client().post('/api/notificar', json=dados)
+        assert (status, json.loads(corpo)) == (flask.status_code, flask.get_json())
+    assert broker.profundidade(config.FILA_ENTRADA) == 0
+
+def test_demais_rotas_passam_para_o_app_flask(broker):
+    status, headers, corpo = chamar("GET", "/health")
+    assert status == 200
+    assert headers['content-type'] == 'application/json'
+    assert json.loads(corpo)['status'] == 'healthy'
+
+    status, _, _ = chamar("GET", "/api/notificar")
+    assert status == 405
+
+def test_publicador_assincrono_mantem_publicacoes_em_voo(broker):
+    """Os Futures resolvem com o ack de cada publicação; broker fora do ar resolve com erro"""
+    publicador = PublicadorAssincrono(nome="publisher-teste")
+    futuros = [
+        publicador.publicar("fila.teste", f"{indice}".encode(), None, aguardar_confirmacao=True)
+        for indice in range(500)
+    ]
+    assert [futuro.result(timeout=5) for futuro in futuros] == [True] * 500
+    assert broker.profundidade("fila.teste") == 500
+
+    broker.derrubar()
+    with pytest.raises(Exception):
+        publicador.publicar("fila.teste", b"x", None).result(timeout=5)
+    publicador.fechar()
+
+def test_store_sqlite_e_consultado_fora_do_event_loop(broker):
+    """Com o status em SQLite, idempotência e consulta de status não bloqueiam o event loop"""
+    threads = []
+
+    def registrando(funcao):
+        def chamada(*args):
+            threads.append(threading.current_thread())
+            return funcao(*args)
+        return chamada
+
+    with patch.object(config, 'STATUS_BACKEND', 'sqlite'), \
+         patch('app.asgi.preparar_notificacao', registrando(preparar_notificacao)), \
+         patch('app.asgi.resposta_status', registrando(resposta_status)):
+        status, _, corpo = chamar("POST", "/api/notificar", {'conteudoMensagem': 'Oi', 'tipoNotificacao': 'SMS'})
+        assert status == 202
+        status, _, _ = chamar("GET", f"/api/notificacao/status/{json.loads(corpo)['traceId']}")
+        assert status == 200
+
+    assert len(threads) == 2
+    assert all(thread is not threading.main_thread() for thread in threads)
+
+def test_long_poll_nao_ocupa_o_pool_padrao(broker):
+    """Clientes em long-poll esperam no pool próprio; as rotas do Flask seguem atendidas"""
+    _, _, corpo = chamar("POST", "/api/notificar", {'conteudoMensagem': 'Oi', 'tipoNotificacao': 'SMS'})
+    trace_id = json.loads(corpo)['traceId']
+
+    async def cenario():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        esperas = [
+            asyncio.create_task(requisicao("GET", f"/api/notificacao/status/{trace_id}", query="wait=1&versao=1"))
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0.1)
+        inicio = time.monotonic()
+        status, _, _ = await asyncio.wait_for(requisicao("GET", "/metrics"), timeout=0.9)
+        decorrido = time.monotonic() - inicio
+        return status, decorrido, [(await espera)[0] for espera in esperas]
+
+    status, decorrido, esperas = asyncio.run(cenario())
+    assert status == 200 and decorrido < 0.9
+    assert esperas == [200] * 4
@@ -0,0 +1,136 @@
+import time
+import pika
+import pytest
+from app.broker_memoria import BrokerMemoria
+
+@pytest.fixture
+def broker():
+    return BrokerMemoria()
+
+def _consumir(conexao, canal, fila, quantidade, timeout=2):
+    """Processa eventos até receber a quantidade de entregas esperada"""
+    recebidas = []
+    canal.basic_consume(queue=fila, on_message_callback=lambda ch, method, props, body: recebidas.append((method, props, body)))
+    limite = time.monotonic() + timeout
+    while len(recebidas) < quantidade and time.monotonic() < limite:
+        conexao.process_data_events(time_limit=0.05)
+    return recebidas
+
+def test_publica_consome_e_confirma(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila', durable=True)
+    canal.basic_publish(exchange='', routing_key='fila', body='{"a": 1}')
+
+    recebidas = _consumir(conexao, canal, 'fila', 1)
+    assert recebidas[0][2] == b'{"a": 1}'
+
+    canal.basic_ack(delivery_tag=recebidas[0][0].delivery_tag)
+    estatisticas = broker.estatisticas['fila']
+    assert estatisticas.confirmadas == 1
+    assert len(estatisticas.espera) == len(estatisticas.processamento) == 1
+
+def test_publicacao_recusa_headers_que_o_amqp_nao_codifica(broker):
+    """Como no pika real, um header float não sai do cliente"""
+    canal = broker.conectar().channel()
+    canal.queue_declare(queue='fila')
+    with pytest.raises(pika.exceptions.UnsupportedAMQPFieldException):
+        canal.basic_publish(exchange='', routing_key='fila', body='x',
+                            properties=pika.BasicProperties(headers={'x-instante': 1.5}))
+    assert broker.profundidade('fila') == 0
+
+def test_prefetch_limita_entregas_nao_confirmadas(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila')
+    canal.basic_qos(prefetch_count=2)
+    for indice in range(5):
+        canal.basic_publish(exchange='', routing_key='fila', body=str(indice))
+
+    recebidas = _consumir(conexao, canal, 'fila', 5, timeout=0.2)
+    assert len(recebidas) == 2
+    assert broker.profundidade('fila') == 3
+
+    canal.basic_ack(delivery_tag=recebidas[1][0].delivery_tag, multiple=True)
+    conexao.process_data_events(time_limit=0.05)
+    assert len(recebidas) == 4
+
+def test_nack_com_requeue_reentrega_marcada(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila')
+    canal.basic_publish(exchange='', routing_key='fila', body='x')
+
+    recebidas = _consumir(conexao, canal, 'fila', 1)
+    canal.basic_nack(delivery_tag=recebidas[0][0].delivery_tag, requeue=True)
+    conexao.process_data_events(time_limit=0.05)
+
+    assert len(recebidas) == 2
+    assert recebidas[1][0].redelivered is True
+
+def test_ttl_e_dead_letter(broker):
+    """Mensagem expirada na fila de atraso é desviada para a fila de destino"""
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='destino')
+    canal.queue_declare(queue='atraso', arguments={
+        'x-message-ttl': 50,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': 'destino'
+    })
+    canal.basic_publish(exchange='', routing_key='atraso', body='x',
+                        properties=pika.BasicProperties(headers={'x-tentativa': 2}))
+    inicio = time.monotonic()
+
+    recebidas = _consumir(conexao, canal, 'destino', 1)
+
+    assert time.monotonic() - inicio >= 0.05
+    headers = recebidas[0][1].headers
+    assert headers['x-tentativa'] == 2
+    assert headers['x-death'][0]['reason'] == 'expired'
+    assert headers['x-death'][0]['queue'] == 'atraso'
+
+def test_nack_sem_requeue_vai_para_dead_letter(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='dlq')
+    canal.queue_declare(queue='fila', arguments={'x-dead-letter-exchange': '', 'x-dead-letter-routing-key': 'dlq'})
+    canal.basic_publish(exchange='', routing_key='fila', body='x')
+
+    recebidas = _consumir(conexao, canal, 'fila', 1)
+    canal.basic_nack(delivery_tag=recebidas[0][0].delivery_tag, requeue=False)
+
+    assert broker.profundidade('dlq') == 1
+
+def test_declaracao_com_argumentos_diferentes_fecha_canal(broker):
+    canal = broker.conectar().channel()
+    canal.queue_declare(queue='fila', arguments={'x-message-ttl': 10})
+
+    with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+        canal.queue_declare(queue='fila')
+    assert canal.is_closed
+
+def test_confirmacoes_entregues_na_thread_da_conexao(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila')
+    confirmacoes = []
+    canal.confirm_delivery(ack_nack_callback=lambda frame: confirmacoes.append(frame.method.delivery_tag))
+
+    canal.basic_publish(exchange='', routing_key='fila', body='a')
+    canal.basic_publish(exchange='', routing_key='fila', body='b')
+    assert confirmacoes == []
+
+    conexao.process_data_events(time_limit=0)
+    assert confirmacoes == [1, 2]
+
+def test_fechar_conexao_devolve_nao_confirmadas(broker):
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila')
+    canal.basic_publish(exchange='', routing_key='fila', body='x')
+    _consumir(conexao, canal, 'fila', 1)
+
+    conexao.close()
+
+    assert broker.profundidade('fila') == 1
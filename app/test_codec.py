@@ -0,0 +1,27 @@
+import json
+from uuid import uuid4
+import pytest
+from app import codec
+
+DADOS = {'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+         'conteudoMensagem': 'Olá, mundo', 'tipoNotificacao': 'EMAIL'}
+
+def test_json_e_compativel_com_a_biblioteca_padrao():
+    corpo = codec.codificar(DADOS)
+    assert isinstance(corpo, bytes)
+    assert json.loads(corpo) == DADOS
+    assert codec.decodificar(json.dumps(DADOS).encode(), codec.JSON) == DADOS
+
+def test_sem_content_type_decodifica_como_json():
+    """Mensagens publicadas antes do codec não têm content_type"""
+    assert codec.decodificar(json.dumps(DADOS).encode(), None) == DADOS
+
+def test_content_type_desconhecido_e_erro():
+    with pytest.raises(ValueError):
+        codec.decodificar(b'', 'text/plain')
+
+def test_msgpack_quando_disponivel():
+    pytest.importorskip('msgpack')
+    corpo = codec.codificar(DADOS, codec.MSGPACK)
+    assert len(corpo) < len(codec.codificar(DADOS))
+    assert codec.decodificar(corpo, codec.MSGPACK) == DADOS
@@ -0,0 +1,174 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from uuid import UUID, uuid4
+import json
+import pika
+from app.consumers import (
+    EncaminhadorEstagio, Estagio, Decisao, processar_entrega,
+    decidir_entrada, decidir_retry, fila_atraso, ARGUMENTOS_FILAS
+)
+from app.config import FILA_DLQ, FILA_RETRY, FILA_VALIDACAO, RETRY_MAX_TENTATIVAS
+from app.rabbitmq import RastreadorConfirmacoes
+
+def test_encaminhador_declara_destinos_uma_vez():
+    """Filas de destino são declaradas na criação e não a cada mensagem"""
+    channel = MagicMock()
+    encaminhador = EncaminhadorEstagio(channel, [FILA_DLQ, FILA_RETRY])
+
+    for _ in range(3):
+        encaminhador.encaminhar(FILA_RETRY, b'{"traceId":"abc"}', content_type='application/json')
+
+    assert channel.queue_declare.call_count == 2
+    assert channel.basic_publish.call_count == 3
+    call_args = channel.basic_publish.call_args
+    assert call_args[1]['routing_key'] == FILA_RETRY
+    assert call_args[1]['body'] == b'{"traceId":"abc"}'
+    assert call_args[1]['properties'].delivery_mode == 2
+    assert call_args[1]['properties'].content_type == 'application/json'
+
+def test_encaminhador_rejeita_fila_nao_declarada():
+    """Encaminhar para uma fila fora dos destinos do estágio é erro"""
+    encaminhador = EncaminhadorEstagio(MagicMock(), [FILA_DLQ])
+
+    with pytest.raises(ValueError):
+        encaminhador.encaminhar(FILA_VALIDACAO, b'{}')
+
+@pytest.fixture
+def mock_connection():
+    """Conexão cujo add_callback_threadsafe executa o callback imediatamente"""
+    connection = MagicMock()
+    connection.add_callback_threadsafe.side_effect = lambda callback: callback()
+    return connection
+
+def test_processar_entrega_encaminha_e_confirma_na_thread_da_conexao(mock_connection):
+    """Worker atualiza o status e agenda encaminhamento e ack na conexão"""
+    estagio = Estagio("teste", "fila.teste", [FILA_VALIDACAO],
+                      lambda dados, headers: Decisao(0, "PROCESSADO_INTERMEDIARIO", FILA_VALIDACAO))
+    channel = MagicMock()
+    encaminhador = MagicMock()
+    encaminhador.encaminhar.side_effect = lambda fila, corpo, ao_confirmar, **opcoes: ao_confirmar(True)
+    dados = {'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+             'conteudoMensagem': 'x', 'tipoNotificacao': 'SMS'}
+
+    corpo = json.dumps(dados).encode()
+
+    with patch('app.consumers.atualizar_status') as mock_atualizar:
+        processar_entrega(estagio, mock_connection, channel, encaminhador, 7, pika.BasicProperties(), corpo)
+
+    mock_atualizar.assert_called_once()
+    assert mock_atualizar.call_args[0][1] == "PROCESSADO_INTERMEDIARIO"
+    encaminhador.encaminhar.assert_called_once()
+    # O corpo original é repassado sem recodificação
+    assert encaminhador.encaminhar.call_args[0] == (FILA_VALIDACAO, corpo)
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    mock_connection.add_callback_threadsafe.assert_called_once()
+
+def test_processar_entrega_rejeita_mensagem_invalida(mock_connection):
+    """Corpo inválido gera nack sem requeue, agendado na thread da conexão"""
+    estagio = Estagio("teste", "fila.teste", [], lambda dados, headers: Decisao())
+    channel = MagicMock()
+
+    processar_entrega(estagio, mock_connection, channel, MagicMock(), 3, pika.BasicProperties(), b'nao-json')
+
+    channel.basic_nack.assert_called_once_with(delivery_tag=3, requeue=False)
+    channel.basic_ack.assert_not_called()
+
+def test_encaminhador_confirma_apos_ack_do_broker():
+    """Com confirmações, o callback só roda quando o broker confirma"""
+    rastreador = RastreadorConfirmacoes()
+    encaminhador = EncaminhadorEstagio(MagicMock(), [FILA_DLQ], rastreador)
+    confirmacoes = []
+
+    encaminhador.encaminhar(FILA_DLQ, b'{}', ao_confirmar=confirmacoes.append)
+    assert confirmacoes == []
+
+    rastreador.ao_confirmar(pika.frame.Method(1, pika.spec.Basic.Nack(delivery_tag=1)))
+    assert confirmacoes == [False]
+
+def test_processar_entrega_devolve_a_fila_quando_broker_recusa(mock_connection):
+    """Nack do broker no encaminhamento devolve a entrega original à fila"""
+    estagio = Estagio("teste", "fila.teste", [FILA_DLQ], lambda dados, headers: Decisao(destino=FILA_DLQ))
+    channel = MagicMock()
+    encaminhador = MagicMock()
+    encaminhador.encaminhar.side_effect = lambda fila, corpo, ao_confirmar, **opcoes: ao_confirmar(False)
+    dados = {'traceId': str(uuid4())}
+
+    processar_entrega(estagio, mock_connection, channel, encaminhador, 9, pika.BasicProperties(), json.dumps(dados).encode())
+
+    channel.basic_nack.assert_called_once_with(delivery_tag=9, requeue=True)
+    channel.basic_ack.assert_not_called()
+
+def test_filas_de_atraso_com_backoff_exponencial():
+    """Cada tentativa tem uma fila com TTL crescente que devolve a mensagem ao retry"""
+    primeira = ARGUMENTOS_FILAS[fila_atraso(1)]
+    segunda = ARGUMENTOS_FILAS[fila_atraso(2)]
+
+    assert segunda["x-message-ttl"] == 2 * primeira["x-message-ttl"]
+    assert primeira["x-dead-letter-exchange"] == ""
+    assert primeira["x-dead-letter-routing-key"] == FILA_RETRY
+
+def test_falha_na_entrada_agenda_primeira_tentativa():
+    with patch('app.consumers.random.random', return_value=0):
+        decisao = decidir_entrada({}, {})
+
+    assert decisao.destino == fila_atraso(1)
+    assert decisao.headers == {"x-tentativa": 1}
+    assert decisao.atraso == 0
+
+def test_retry_reagenda_ate_esgotar_tentativas():
+    """Falhas no retry vão para a próxima fila de atraso e, no limite, para a DLQ"""
+    with patch('app.consumers.random.random', return_value=0):
+        decisao = decidir_retry({}, {"x-tentativa": 1})
+        assert decisao.status == "REPROCESSAMENTO_AGENDADO"
+        assert decisao.destino == fila_atraso(2)
+        assert decisao.headers == {"x-tentativa": 2}
+
+        decisao = decidir_retry({}, {"x-tentativa": RETRY_MAX_TENTATIVAS})
+        assert decisao.status == "FALHA_FINAL_REPROCESSAMENTO"
+        assert decisao.destino == FILA_DLQ
+
+    with patch('app.consumers.random.random', return_value=0.99):
+        decisao = decidir_retry({}, {})
+        assert decisao.destino == FILA_VALIDACAO
+        assert decisao.atraso == 0
+
+def test_reentrega_de_passo_concluido_e_so_confirmada(mock_connection):
+    """Uma reentrega depois do ack perdido não reprocessa nem reencaminha"""
+    from app.consumers import atualizar_status, notificacoes_status
+    decidir = MagicMock(return_value=Decisao(0, "PROCESSADO_INTERMEDIARIO", FILA_VALIDACAO))
+    estagio = Estagio("teste", "fila.teste", [FILA_VALIDACAO], decidir, passo=1)
+    channel = MagicMock()
+    encaminhador = MagicMock()
+    encaminhador.encaminhar.side_effect = lambda fila, corpo, ao_confirmar, **opcoes: ao_confirmar(True)
+    dados = {'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+             'conteudoMensagem': 'x', 'tipoNotificacao': 'SMS'}
+    atualizar_status(UUID(dados['traceId']), "RECEBIDO", dados)
+    corpo = json.dumps(dados).encode()
+
+    processar_entrega(estagio, mock_connection, channel, encaminhador, 1, pika.BasicProperties(), corpo)
+    processar_entrega(estagio, mock_connection, channel, encaminhador, 2, pika.BasicProperties(), corpo)
+
+    assert decidir.call_count == 1
+    assert encaminhador.encaminhar.call_count == 1
+    assert [chamada.kwargs['delivery_tag'] for chamada in channel.basic_ack.call_args_list] == [1, 2]
+    notificacoes_status.clear()
+
+def test_retry_usa_um_passo_por_tentativa():
+    from app.consumers import ESTAGIO_RETRY
+    assert ESTAGIO_RETRY.passo_da_entrega({"x-tentativa": 1}) != ESTAGIO_RETRY.passo_da_entrega({"x-tentativa": 2})
+
+def test_validacao_roteada_por_tipo_na_exchange_direct():
+    """Encaminhar para a validação publica na exchange com o tipo como chave"""
+    from app.config import EXCHANGE_VALIDACAO, FILAS_VALIDACAO
+    channel = MagicMock()
+    encaminhador = EncaminhadorEstagio(channel, [FILA_VALIDACAO])
+
+    encaminhador.encaminhar(FILA_VALIDACAO, b'{}', chave='PUSH', prioridade=5)
+
+    channel.exchange_declare.assert_called_once_with(exchange=EXCHANGE_VALIDACAO, exchange_type='direct', durable=True)
+    vinculos = {chamada.kwargs['routing_key']: chamada.kwargs['queue'] for chamada in channel.queue_bind.call_args_list}
+    assert vinculos == FILAS_VALIDACAO
+    call_args = channel.basic_publish.call_args
+    assert call_args[1]['exchange'] == EXCHANGE_VALIDACAO
+    assert call_args[1]['routing_key'] == 'PUSH'
+    assert call_args[1]['properties'].priority == 5
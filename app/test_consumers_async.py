@@ -0,0 +1,44 @@
+import asyncio
+import json
+import pika
+import time
+from unittest.mock import patch, MagicMock
+from uuid import uuid4
+from app.consumers import Estagio, Decisao
+from app.consumers_async import processar_entrega
+from app.config import FILA_VALIDACAO
+
+def _corpo():
+    return json.dumps({'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+                       'conteudoMensagem': 'x', 'tipoNotificacao': 'PUSH'}).encode()
+
+def test_processar_entrega_assincrona_concorrente():
+    """Milhares de entregas com espera simulada não ocupam uma thread cada"""
+    estagio = Estagio("teste", "fila.teste", [FILA_VALIDACAO],
+                      lambda dados, headers: Decisao(0.2, "PROCESSADO_INTERMEDIARIO", FILA_VALIDACAO))
+    channel = MagicMock()
+    encaminhador = MagicMock()
+    encaminhador.encaminhar.side_effect = lambda fila, corpo, ao_confirmar, **opcoes: ao_confirmar(True)
+
+    async def executar():
+        await asyncio.gather(*(
+            processar_entrega(estagio, channel, encaminhador, tag, pika.BasicProperties(), _corpo())
+            for tag in range(2000)
+        ))
+
+    inicio = time.monotonic()
+    with patch('app.consumers_async.atualizar_status'):
+        asyncio.run(executar())
+
+    assert time.monotonic() - inicio < 2
+    assert channel.basic_ack.call_count == 2000
+    assert encaminhador.encaminhar.call_count == 2000
+
+def test_processar_entrega_assincrona_rejeita_mensagem_invalida():
+    """Corpo inválido gera nack sem requeue"""
+    estagio = Estagio("teste", "fila.teste", [], lambda dados, headers: Decisao())
+    channel = MagicMock()
+
+    asyncio.run(processar_entrega(estagio, channel, MagicMock(), 5, pika.BasicProperties(), b'nao-json'))
+
+    channel.basic_nack.assert_called_once_with(delivery_tag=5, requeue=False)
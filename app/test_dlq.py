@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from unittest.mock import patch
+from uuid import UUID, uuid4
+import pytest
+from app import config, metricas
+from app.app import app, reenviador_dlq
+from app.arquivo_dlq import ArquivoDLQ
+from app.broker_memoria import BrokerMemoria
+from app.consumers import ARGUMENTOS_FILAS, ESTAGIO_DLQ, consultar_status, executar_estagio, notificacoes_status
+from app.rabbitmq import PoolPublicacao, RabbitMQConnection
+from app.reenvio_dlq import ReenviadorDLQ
+from app.status_store import StatusStore
+from app.test_pipeline import pipeline_memoria  # noqa: F401
+
+def _dados(tipo="EMAIL"):
+    return {'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+            'conteudoMensagem': 'Seu pedido foi enviado', 'tipoNotificacao': tipo}
+
+@pytest.fixture
+def arquivo():
+    arquivo = ArquivoDLQ(":memory:")
+    with patch('app.consumers.arquivo_dlq', arquivo), patch('app.app.arquivo_dlq', arquivo), \
+         patch.object(reenviador_dlq, 'arquivo', arquivo):
+        yield arquivo
+    arquivo.fechar()
+
+def test_arquivo_filtra_agrupa_e_conta_novas_falhas(arquivo):
+    email, sms = _dados("EMAIL"), _dados("SMS")
+    arquivo.arquivar(email, "FALHA_ENVIO_FINAL", "validacao_email", 1)
+    arquivo.arquivar(sms, "FALHA_FINAL_REPROCESSAMENTO", "retry", 3)
+    arquivo.arquivar(email, "FALHA_ENVIO_FINAL", "validacao_email", 1)
+
+    assert arquivo.contar() == 2
+    assert arquivo.obter(UUID(email['traceId']))['falhas'] == 2
+    [registro] = arquivo.consultar(motivo="FALHA_FINAL_REPROCESSAMENTO")
+    assert (registro['tipo'], registro['estagio'], registro['tentativas']) == ("SMS", "retry", 3)
+    assert registro['dados'] == sms
+    assert arquivo.consultar(tipo="PUSH") == []
+    assert arquivo.consultar(trace_ids=[email['traceId']])[0]['mensagem_id'] == email['mensagemId']
+
+    arquivo.marcar_reenviadas([email['traceId']])
+    assert [r['trace_id'] for r in arquivo.consultar(pendentes=True)] == [sms['traceId']]
+    assert arquivo.resumo() == [
+        {'tipo': 'SMS', 'motivo': 'FALHA_FINAL_REPROCESSAMENTO', 'estagio': 'retry', 'quantidade': 1}
+    ]
+    # Uma nova falha depois do reenvio volta a ficar pendente
+    arquivo.arquivar(email, "FALHA_ENVIO_FINAL", "validacao_email", 1)
+    assert arquivo.obter(email['traceId'])['reenviado_em'] is None
+    assert arquivo.obter(email['traceId'])['reenvios'] == 1
+
+def test_filtro_por_trace_ids_aceita_listas_grandes_e_api_limita(arquivo):
+    dados = _dados()
+    arquivo.arquivar(dados, "FALHA_ENVIO_FINAL", "validacao_email", 1)
+    # Mais traceIds que o limite de variáveis de uma consulta SQLite
+    trace_ids = [str(uuid4()) for _ in range(40000)] + [dados['traceId']]
+    assert [registro['trace_id'] for registro in arquivo.consultar(trace_ids=trace_ids)] == [dados['traceId']]
+
+    with patch.object(config, 'DLQ_REENVIO_MAX_ITENS', 2):
+        response = app.test_client().post('/api/dlq/reenvio', json={'traceIds': trace_ids[:3]})
+    assert response.status_code == 400
+
+def test_store_reabre_notificacao_final_e_libera_passos():
+    store = StatusStore(fragmentos=1)
+    trace_id, dados = uuid4(), _dados()
+    store.atualizar(trace_id, "RECEBIDO", dados)
+    store.atualizar(trace_id, "FALHA_ENVIO_FINAL", dados)
+    store.marcar_passo(trace_id, 1)
+    store.marcar_passo(trace_id, 2)
+    assert store.em_andamento() == 0
+
+    store.desmarcar_passos(trace_id, (1, 2))
+    store.atualizar(trace_id, "REPROCESSAMENTO_AGENDADO", dados)
+    assert not store.passo_concluido(trace_id, 1) and not store.passo_concluido(trace_id, 2)
+    assert store.em_andamento() == 1
+
+class EntregadorControlado:
+    def __init__(self):
+        self.sucesso = False
+
+    def submeter(self, dados):
+        envio = Future()
+        envio.set_result(self.sucesso)
+        return envio
+
+def test_falha_de_envio_e_arquivada_e_reenviada_pela_api(pipeline_memoria, arquivo):
+    client = app.test_client()
+    entregador = EntregadorControlado()
+    with patch('app.consumers.random.random', return_value=0.5), \
+         patch('app.consumers.obter_entregador', return_value=entregador):
+        trace_ids = []
+        for tipo in ('EMAIL', 'SMS', 'PUSH'):
+            response = client.post('/api/notificar', json={'conteudoMensagem': 'Oi', 'tipoNotificacao': tipo})
+            trace_ids.append(UUID(response.get_json()['traceId']))
+
+        limite = time.monotonic() + 10
+        while arquivo.contar() < 3 and time.monotonic() < limite:
+            time.sleep(0.02)
+
+        listagem = client.get('/api/dlq?tipoNotificacao=SMS&pendentes=true').get_json()
+        assert listagem['total'] == 1
+        assert listagem['itens'][0]['motivo'] == 'FALHA_ENVIO_FINAL'
+        assert listagem['itens'][0]['estagio'] == 'validacao_sms'
+        assert client.get(f'/api/dlq/{trace_ids[0]}').get_json()['tipoNotificacao'] == 'EMAIL'
+
+        entregador.sucesso = True
+        response = client.post('/api/dlq/reenvio', json={'motivo': 'FALHA_ENVIO_FINAL', 'taxa': 100})
+        assert response.status_code == 202
+        reenvio_id = response.get_json()['id']
+
+        while time.monotonic() < limite:
+            if all(consultar_status(trace_id)['status'] == 'ENVIADO_SUCESSO' for trace_id in trace_ids):
+                break
+            time.sleep(0.02)
+
+    assert client.get(f'/api/dlq/reenvio/{reenvio_id}').get_json()['reenviadas'] == 3
+    for trace_id in trace_ids:
+        assert consultar_status(trace_id)['historico'] == [
+            'RECEBIDO', 'PROCESSADO_INTERMEDIARIO', 'FALHA_ENVIO_FINAL', 'REPROCESSAMENTO_AGENDADO',
+            'ENVIADO_SUCESSO'
+        ]
+    assert arquivo.contar(pendentes=True) == 0
+    assert client.get('/api/dlq/resumo').get_json() == {'grupos': []}
+
+def test_reenvio_respeita_a_taxa(arquivo):
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    pool = PoolPublicacao(tamanho=1, prefixo="reenvio-teste")
+    for _ in range(10):
+        arquivo.arquivar(_dados("PUSH"), "FALHA_ENVIO_FINAL", "validacao_push", 1)
+    reenviador = ReenviadorDLQ(pool, arquivo, taxa_maxima=20)
+    serie_reenvio = metricas.PUBLICACAO_DURACAO.labels("reenvio_dlq")
+    publicadas_antes = sum(serie_reenvio.contagens)
+    try:
+        reenvio = reenviador.agendar(taxa=1000)
+        inicio = time.monotonic()
+        while reenvio.estado in ("agendado", "executando") and time.monotonic() - inicio < 5:
+            time.sleep(0.01)
+        duracao = time.monotonic() - inicio
+    finally:
+        pool.fechar()
+        RabbitMQConnection.configurar_transporte(transporte_original)
+        notificacoes_status.clear()
+
+    assert reenvio.taxa == 20
+    assert sum(serie_reenvio.contagens) == publicadas_antes + 10
+    assert (reenvio.estado, reenvio.reenviadas, reenvio.falhas) == ("concluido", 10, 0)
+    # Rajada de um lote (2) e o resto a 20/s
+    assert duracao >= 0.35
+    assert broker.profundidade(config.FILAS_VALIDACAO['PUSH']) == 10
+
+def test_falha_ao_arquivar_volta_pela_fila_de_atraso_e_depois_estaciona(arquivo):
+    """Com o arquivo indisponível a DLQ não reentrega em laço: espera na fila de atraso e, no limite, estaciona"""
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    notificacoes_status.clear()
+    arquivar = arquivo.arquivar
+    falhas = {'restantes': 2}
+
+    def arquivar_instavel(*args):
+        if falhas['restantes']:
+            falhas['restantes'] -= 1
+            raise Exception("database is locked")
+        arquivar(*args)
+
+    atraso = {"x-message-ttl": 20, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": config.FILA_DLQ}
+    parar = threading.Event()
+    thread = threading.Thread(target=executar_estagio, args=(ESTAGIO_DLQ, parar), daemon=True)
+    try:
+        with patch.dict(ARGUMENTOS_FILAS, {config.FILA_DLQ_ATRASO: atraso}), \
+             patch.object(config, 'DLQ_ARQUIVO_MAX_TENTATIVAS', 3), \
+             patch.object(arquivo, 'arquivar', side_effect=arquivar_instavel) as mock_arquivar:
+            thread.start()
+            conexao = broker.conectar()
+            canal = conexao.channel()
+            canal.queue_declare(queue=config.FILA_DLQ, durable=True)
+            recuperada, estacionada = _dados(), _dados()
+            canal.basic_publish(exchange='', routing_key=config.FILA_DLQ, body=json.dumps(recuperada))
+
+            limite = time.monotonic() + 5
+            while arquivo.contar() < 1 and time.monotonic() < limite:
+                time.sleep(0.01)
+            assert arquivo.obter(recuperada['traceId']) is not None
+            assert mock_arquivar.call_count == 3
+
+            falhas['restantes'] = 3
+            canal.basic_publish(exchange='', routing_key=config.FILA_DLQ, body=json.dumps(estacionada))
+            while broker.profundidade(config.FILA_DLQ_ESTACIONAMENTO) < 1 and time.monotonic() < limite:
+                time.sleep(0.01)
+            assert broker.profundidade(config.FILA_DLQ_ESTACIONAMENTO) == 1
+            assert mock_arquivar.call_count == 6
+            conexao.close()
+    finally:
+        parar.set()
+        broker.derrubar()
+        thread.join(timeout=5)
+        RabbitMQConnection.configurar_transporte(transporte_original)
+        notificacoes_status.clear()
@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+from uuid import uuid4
+import json
+import pika
+import pytest
+from app.config import FILA_DLQ
+from app.consumers import ESTAGIOS_VALIDACAO, processar_entrega
+from app.entrega import AdaptadorEntrega, AdaptadorHttp, AdaptadorSmtp, AgrupadorEntregas
+from app.provedores_locais import HttpLocal, SmtpLocal
+
+def _mensagem(tipo="EMAIL", destinatario="cliente@exemplo.com"):
+    dados = {'traceId': str(uuid4()), 'mensagemId': str(uuid4()),
+             'conteudoMensagem': 'Seu pedido foi enviado', 'tipoNotificacao': tipo}
+    if destinatario:
+        dados['destinatario'] = destinatario
+    return dados
+
+@pytest.fixture
+def smtp():
+    with SmtpLocal(recusar={'recusado@exemplo.com'}) as servidor:
+        yield servidor
+
+@pytest.fixture
+def gateway():
+    with HttpLocal(recusar={'+5500000000'}) as servidor:
+        yield servidor
+
+def test_smtp_envia_lote_em_uma_sessao_persistente(smtp):
+    adaptador = AdaptadorSmtp('127.0.0.1', smtp.porta, conexoes=1)
+    try:
+        lote = [_mensagem(), _mensagem(destinatario='recusado@exemplo.com'), _mensagem(destinatario=None),
+                _mensagem(destinatario='outro@exemplo.com')]
+        assert adaptador.enviar_lote(lote) == [True, False, False, True]
+        assert adaptador.enviar_lote([_mensagem()]) == [True]
+    finally:
+        adaptador.fechar()
+
+    assert smtp.conexoes == 1
+    assert [destinatarios for _, destinatarios, _ in smtp.mensagens] == [
+        ['cliente@exemplo.com'], ['outro@exemplo.com'], ['cliente@exemplo.com']
+    ]
+    assert f"{lote[0]['mensagemId']}@notificacoes".encode() in smtp.mensagens[0][2]
+
+def test_smtp_reabre_sessao_encerrada_pelo_servidor(smtp):
+    adaptador = AdaptadorSmtp('127.0.0.1', smtp.porta, conexoes=1)
+    try:
+        assert adaptador.enviar_lote([_mensagem()]) == [True]
+        sessao = adaptador.pool._livres.queue[-1]
+        sessao.close()
+        assert adaptador.enviar_lote([_mensagem(), _mensagem()]) == [True, True]
+    finally:
+        adaptador.fechar()
+
+    assert smtp.conexoes == 2
+    assert len(smtp.mensagens) == 3
+
+def test_gateway_http_recebe_lote_em_um_post_keep_alive(gateway):
+    adaptador = AdaptadorHttp(gateway.url, conexoes=1, nome='http-sms')
+    try:
+        lote = [_mensagem('SMS', '+5511999999999'), _mensagem('SMS', '+5500000000'), _mensagem('SMS', None)]
+        assert adaptador.enviar_lote(lote) == [True, False, False]
+        assert adaptador.enviar_lote([_mensagem('SMS', '+5511888888888')]) == [True]
+    finally:
+        adaptador.fechar()
+
+    assert gateway.conexoes == 1
+    assert [len(lote) for lote in gateway.lotes] == [2, 1]
+    assert gateway.lotes[0][0]['id'] == lote[0]['mensagemId']
+
+def test_gateway_http_com_resultados_incompletos_falha_so_o_restante():
+    adaptador = AdaptadorHttp('http://127.0.0.1:9/mensagens', conexoes=1)
+    resposta = json.dumps({"resultados": [{"sucesso": True}, {"sucesso": False}]}).encode()
+    lote = [_mensagem('SMS', '+5511999999999'), _mensagem('SMS', None),
+            _mensagem('SMS', '+5511888888888'), _mensagem('SMS', '+5511777777777')]
+    with patch.object(adaptador, '_postar', return_value=(200, resposta)):
+        assert adaptador.enviar_lote(lote) == [True, False, False, False]
+
+def test_gateway_http_com_erro_do_provedor_falha_o_lote(gateway):
+    gateway.status = 503
+    agrupador = AgrupadorEntregas(AdaptadorHttp(gateway.url, conexoes=1), janela=0.01)
+    try:
+        assert agrupador.submeter(_mensagem('PUSH', 'dispositivo-1')).result(timeout=5) is False
+    finally:
+        agrupador.fechar()
+
+class AdaptadorContador(AdaptadorEntrega):
+    nome = "contador"
+
+    def __init__(self, atraso):
+        self.atraso = atraso
+        self.lotes = []
+        self.simultaneos = 0
+        self.maximo_simultaneos = 0
+        self._lock = threading.Lock()
+
+    def enviar_lote(self, mensagens):
+        with self._lock:
+            self.lotes.append(len(mensagens))
+            self.simultaneos += 1
+            self.maximo_simultaneos = max(self.maximo_simultaneos, self.simultaneos)
+        time.sleep(self.atraso)
+        with self._lock:
+            self.simultaneos -= 1
+        return [True] * len(mensagens)
+
+def test_agrupador_junta_mensagens_e_respeita_concorrencia():
+    adaptador = AdaptadorContador(atraso=0.05)
+    agrupador = AgrupadorEntregas(adaptador, janela=0.005, tamanho_lote=10, concorrencia=2)
+    try:
+        with ThreadPoolExecutor(max_workers=40) as executor:
+            resultados = list(executor.map(lambda _: agrupador.submeter(_mensagem()).result(timeout=5), range(40)))
+    finally:
+        agrupador.fechar()
+
+    assert all(resultados)
+    assert sum(adaptador.lotes) == 40
+    assert max(adaptador.lotes) <= 10
+    assert len(adaptador.lotes) < 40
+    assert adaptador.maximo_simultaneos <= 2
+
+def test_validacao_envia_pelo_provedor_e_falha_vai_para_dlq(gateway):
+    agrupador = AgrupadorEntregas(AdaptadorHttp(gateway.url), janela=0.001)
+    connection = MagicMock()
+    connection.add_callback_threadsafe.side_effect = lambda callback: callback()
+    encaminhador = MagicMock()
+    encaminhador.encaminhar.side_effect = lambda fila, corpo, ao_confirmar, **opcoes: ao_confirmar(True)
+    estagio = ESTAGIOS_VALIDACAO['SMS']
+    entregue, recusado = _mensagem('SMS', '+5511999999999'), _mensagem('SMS', '+5500000000')
+
+    try:
+        with patch('app.consumers.obter_entregador', return_value=agrupador), \
+             patch('app.consumers.atualizar_status') as mock_atualizar:
+            for tag, dados in enumerate((entregue, recusado), start=1):
+                processar_entrega(estagio, connection, MagicMock(), encaminhador, tag,
+                                  pika.BasicProperties(), json.dumps(dados).encode())
+            # O restante do processamento roda quando o provedor responde
+            limite = time.monotonic() + 5
+            while mock_atualizar.call_count < 2 and time.monotonic() < limite:
+                time.sleep(0.01)
+    finally:
+        agrupador.fechar()
+
+    status = {chamada[0][2]['traceId']: chamada[0][1] for chamada in mock_atualizar.call_args_list}
+    assert status == {entregue['traceId']: "ENVIADO_SUCESSO", recusado['traceId']: "FALHA_ENVIO_FINAL"}
+    encaminhador.encaminhar.assert_called_once()
+    assert encaminhador.encaminhar.call_args[0][0] == FILA_DLQ
+
+def test_worker_nao_espera_o_provedor_e_o_lote_passa_dos_workers():
+    """Um único worker entrega várias mensagens ao agrupador, que as envia num só lote"""
+    adaptador = AdaptadorContador(atraso=0.05)
+    agrupador = AgrupadorEntregas(adaptador, janela=0.2, tamanho_lote=50, concorrencia=1)
+    connection = MagicMock()
+    channel = MagicMock()
+    connection.add_callback_threadsafe.side_effect = lambda callback: callback()
+
+    try:
+        with patch('app.consumers.obter_entregador', return_value=agrupador), patch('app.consumers.atualizar_status'):
+            for tag in range(1, 21):
+                processar_entrega(ESTAGIOS_VALIDACAO['SMS'], connection, channel, MagicMock(), tag,
+                                  pika.BasicProperties(), json.dumps(_mensagem('SMS', '+5511999999999')).encode())
+            limite = time.monotonic() + 5
+            while channel.basic_ack.call_count < 20 and time.monotonic() < limite:
+                time.sleep(0.01)
+    finally:
+        agrupador.fechar()
+
+    assert channel.basic_ack.call_count == 20
+    assert sum(adaptador.lotes) == 20 and len(adaptador.lotes) <= 2
@@ -0,0 +1,110 @@
+from uuid import uuid4
+import pytest
+from app import metricas
+from app.app import app
+from app.broker_memoria import BrokerMemoria
+from app.consumers import atualizar_status, atualizar_status_lote, notificacoes_status
+
+def test_contador_exporta_formato_texto_do_prometheus():
+    contador = metricas.Contador("teste_total", "Contador de teste", ("tipo",))
+    contador.labels("EMAIL").inc()
+    contador.labels("EMAIL").inc(2)
+    contador.labels('S"MS').inc()
+
+    linhas = contador.exportar()
+    assert linhas[:2] == ["# HELP teste_total Contador de teste", "# TYPE teste_total counter"]
+    assert 'teste_total{tipo="EMAIL"} 3.0' in linhas
+    assert 'teste_total{tipo="S\\"MS"} 1.0' in linhas
+
+def test_histograma_acumula_buckets_soma_e_contagem():
+    histograma = metricas.Histograma("duracao_segundos", "Duração", ("estagio",), buckets=(0.1, 1))
+    serie = histograma.labels("entrada")
+    for valor in (0.05, 0.1, 0.5, 3):
+        serie.observe(valor)
+
+    linhas = histograma.exportar()
+    assert 'duracao_segundos_bucket{estagio="entrada",le="0.1"} 2' in linhas
+    assert 'duracao_segundos_bucket{estagio="entrada",le="1.0"} 3' in linhas
+    assert 'duracao_segundos_bucket{estagio="entrada",le="+Inf"} 4' in linhas
+    assert 'duracao_segundos_sum{estagio="entrada"} 3.65' in linhas
+    assert 'duracao_segundos_count{estagio="entrada"} 4' in linhas
+
+def test_janela_de_latencias_calcula_percentis_por_estagio():
+    janela = metricas.JanelaLatencias(tamanho=100)
+    for indice in range(1, 201):
+        janela.registrar("entrada", indice / 100, indice / 1000)
+    janela.registrar("dlq", None, 0.5)
+
+    resumo = janela.resumo()
+    assert resumo["entrada"]["amostras"] == 100
+    # Só as últimas 100 amostras (101..200) ficam na janela
+    assert resumo["entrada"]["esperaFila"] == {"p50": 1.5, "p90": 1.9, "p99": 1.99, "max": 2.0}
+    assert resumo["entrada"]["processamento"]["p50"] == 0.15
+    assert resumo["dlq"]["esperaFila"] is None
+
+def test_transicoes_de_status_sao_contadas():
+    serie = metricas.STATUS_TRANSICOES.labels("RECEBIDO")
+    antes = serie.valor
+    dados = {"mensagemId": str(uuid4()), "conteudoMensagem": "x", "tipoNotificacao": "EMAIL"}
+    atualizar_status(uuid4(), "RECEBIDO", dados)
+    atualizar_status_lote([(uuid4(), "RECEBIDO", dados) for _ in range(3)])
+    assert serie.valor == antes + 4
+    notificacoes_status.clear()
+
+def test_registro_nao_repete_metricas():
+    nomes = [metrica.nome for metrica in metricas.registro._metricas]
+    assert len(nomes) == len(set(nomes))
+    assert metricas.CONEXOES.nomes_labels == ("conexao", "resultado")
+
+def test_amostrador_le_profundidade_com_declare_passivo():
+    broker = BrokerMemoria()
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue='fila.metricas', durable=True)
+    for indice in range(3):
+        canal.basic_publish(exchange='', routing_key='fila.metricas', body=str(indice))
+
+    amostrador = metricas.AmostradorFilas(conexao.channel, ['fila.metricas'])
+    amostrador.amostrar()
+
+    assert amostrador.profundidades == {'fila.metricas': 3}
+    assert metricas.FILA_MENSAGENS.labels('fila.metricas').valor == 3
+    assert amostrador.amostrado_em is not None
+    broker.derrubar()
+
+def test_amostrador_pula_fila_nao_declarada_e_amostra_as_demais():
+    broker = BrokerMemoria()
+    conexao = broker.conectar()
+    canal = conexao.channel()
+    for fila in ('fila.antes', 'fila.depois'):
+        canal.queue_declare(queue=fila)
+        canal.basic_publish(exchange='', routing_key=fila, body='x')
+
+    amostrador = metricas.AmostradorFilas(conexao.channel, ['fila.antes', 'fila.inexistente', 'fila.depois'])
+    amostrador.amostrar()
+
+    assert amostrador.profundidades == {'fila.antes': 1, 'fila.depois': 1}
+    broker.derrubar()
+
+def test_endpoint_metrics_expoe_metricas_da_api():
+    client = app.test_client()
+    client.post('/api/notificar', json={'conteudoMensagem': 'x'})
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    corpo = response.get_data(as_text=True)
+    assert '# TYPE notificacoes_api_duracao_segundos histogram' in corpo
+    assert 'notificacoes_api_duracao_segundos_count{endpoint="notificar",codigo="400"}' in corpo
+
+def test_endpoint_metrics_expoe_estatisticas_do_store_de_status():
+    notificacoes_status.clear()
+    dados = {"mensagemId": str(uuid4()), "conteudoMensagem": "x", "tipoNotificacao": "EMAIL"}
+    atualizar_status(uuid4(), "RECEBIDO", dados)
+
+    corpo = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'notificacoes_status_store_entradas 1.0' in corpo
+    assert '# TYPE notificacoes_status_store_despejos_total counter' in corpo
+    assert 'notificacoes_status_store_despejos_total{motivo="capacidade"}' in corpo
+    assert metricas.STATUS_STORE_BYTES.labels().valor > 0
+    notificacoes_status.clear()
@@ -0,0 +1,145 @@
+import threading
+import time
+from unittest.mock import patch
+from uuid import uuid4
+import pika
+import pytest
+from app import config
+from app.broker_memoria import TransporteNosMemoria
+from app.consumers import ESTAGIO_DLQ, executar_estagio
+from app.metricas import AmostradorFilas
+from app.nos_broker import AnelConsistente, DistribuidorNos
+from app.rabbitmq import RabbitMQConnection, PoolPublicacao, PublicadorAssincrono
+
+NOS = [("no-a", 5672), ("no-b", 5672), ("no-c", 5672)]
+
+@pytest.fixture
+def nos_memoria():
+    """Três nós de broker em memória, cada um com as suas filas"""
+    transporte_original = RabbitMQConnection._transporte
+    transporte = TransporteNosMemoria(NOS)
+    RabbitMQConnection.configurar_transporte(transporte)
+    with patch.object(config, 'BROKER_NOS', NOS):
+        yield transporte
+    for broker in transporte.brokers.values():
+        broker.derrubar()
+    RabbitMQConnection.configurar_transporte(transporte_original)
+
+def _dono(chave, nos=NOS):
+    return nos[next(AnelConsistente(nos).preferencias(chave))]
+
+def test_anel_estavel_e_remover_no_move_so_as_chaves_dele():
+    chaves = [str(uuid4()) for _ in range(3000)]
+    antes = {chave: _dono(chave) for chave in chaves}
+
+    assert antes == {chave: _dono(chave) for chave in chaves}
+    por_no = {no: sum(1 for dono in antes.values() if dono == no) for no in NOS}
+    assert all(contagem > 600 for contagem in por_no.values())
+
+    restantes = [no for no in NOS if no != NOS[1]]
+    depois = {chave: _dono(chave, restantes) for chave in chaves}
+    movidas = [chave for chave in chaves if antes[chave] != depois[chave]]
+    assert movidas and all(antes[chave] == NOS[1] for chave in movidas)
+
+def test_distribuidor_pula_no_que_falhou_ate_a_espera_passar():
+    distribuidor = DistribuidorNos(NOS, espera_falha=0.05)
+    chave = "trace-1"
+    dono = distribuidor.escolher(chave)
+
+    distribuidor.falhou(dono)
+    assert distribuidor.escolher(chave) != dono
+    assert distribuidor.candidatos(chave)[-1] == dono
+
+    time.sleep(0.06)
+    assert distribuidor.escolher(chave) == dono
+
+def test_pool_publica_no_no_do_trace_id(nos_memoria):
+    pool = PoolPublicacao(tamanho=1, distribuidor=DistribuidorNos(NOS))
+    chaves = [str(uuid4()) for _ in range(30)]
+    try:
+        for chave in chaves:
+            assert pool.publicar('fila', chave, pika.BasicProperties(), aguardar_confirmacao=True, chave=chave)
+    finally:
+        pool.fechar()
+
+    for no, broker in nos_memoria.brokers.items():
+        assert broker.profundidade('fila') == sum(1 for chave in chaves if _dono(chave) == no)
+
+def test_pool_publica_no_proximo_no_quando_o_dono_cai(nos_memoria):
+    distribuidor = DistribuidorNos(NOS)
+    pool = PoolPublicacao(tamanho=1, distribuidor=distribuidor)
+    chaves = [str(uuid4()) for _ in range(30)]
+    caido = NOS[0]
+    nos_memoria.brokers[caido].derrubar()
+    try:
+        for chave in chaves:
+            assert pool.publicar('fila', chave, pika.BasicProperties(), aguardar_confirmacao=True, chave=chave)
+        confirmacoes = pool.publicar_lote('lote', chaves, pika.BasicProperties(), chaves=chaves)
+    finally:
+        pool.fechar()
+
+    assert confirmacoes == [True] * len(chaves)
+    assert not distribuidor.disponivel(0)
+    assert nos_memoria.brokers[caido].profundidade('fila') == 0
+    assert sum(broker.profundidade('fila') for broker in nos_memoria.brokers.values()) == len(chaves)
+    assert sum(broker.profundidade('lote') for broker in nos_memoria.brokers.values()) == len(chaves)
+
+def test_publicador_assincrono_redireciona_para_o_proximo_no(nos_memoria):
+    publicador = PublicadorAssincrono(distribuidor=DistribuidorNos(NOS))
+    chaves = [chave for chave in (str(uuid4()) for _ in range(200)) if _dono(chave) == NOS[2]][:5]
+    nos_memoria.brokers[NOS[2]].derrubar()
+    try:
+        futuros = [
+            publicador.publicar('fila', chave, pika.BasicProperties(), aguardar_confirmacao=True, chave=chave)
+            for chave in chaves
+        ]
+        assert [futuro.result(timeout=5) for futuro in futuros] == [True] * len(chaves)
+    finally:
+        publicador.fechar()
+
+    assert nos_memoria.brokers[NOS[2]].profundidade('fila') == 0
+    assert sum(broker.profundidade('fila') for broker in nos_memoria.brokers.values()) == len(chaves)
+
+def test_consumidores_e_amostrador_cobrem_todos_os_nos(nos_memoria):
+    pool = PoolPublicacao(tamanho=1, distribuidor=DistribuidorNos(NOS))
+    for _ in range(9):
+        chave = str(uuid4())
+        pool.publicar(config.FILA_DLQ, '{}', pika.BasicProperties(), aguardar_confirmacao=True, chave=chave)
+    pool.fechar()
+
+    amostrador = AmostradorFilas(
+        lambda no=0: RabbitMQConnection.get_connection("metricas", no).channel(), [config.FILA_DLQ], nos=len(NOS)
+    )
+    amostrador.amostrar()
+    assert amostrador.profundidades[config.FILA_DLQ] == 9
+
+    parar = threading.Event()
+    threads = [
+        threading.Thread(target=executar_estagio, args=(ESTAGIO_DLQ, parar, None, no), daemon=True)
+        for no in range(len(NOS))
+    ]
+    for thread in threads:
+        thread.start()
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        amostrador.amostrar()
+        if amostrador.profundidades[config.FILA_DLQ] == 0:
+            break
+        time.sleep(0.02)
+    parar.set()
+    for broker in nos_memoria.brokers.values():
+        broker.derrubar()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert amostrador.profundidades[config.FILA_DLQ] == 0
+
+def test_close_all_fecha_as_conexoes_de_todos_os_nos(nos_memoria):
+    conexoes = [RabbitMQConnection.get_connection("fechar", no) for no in range(len(NOS))]
+    thread = threading.Thread(target=RabbitMQConnection.close_all, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert all(conexao.is_closed for conexao in conexoes)
+    assert not any(nome == "fechar" for nome, _ in RabbitMQConnection._connections)
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+from uuid import UUID, uuid4
+import pika
+import pytest
+from app import config, rastreio
+from app.app import app, pool_publicacao
+from app.broker_memoria import BrokerMemoria
+from app.consumers import (
+    atualizar_status, executar_estagio, notificacoes_status, consultar_status, ESTAGIOS
+)
+from app.rabbitmq import RabbitMQConnection
+
+@pytest.fixture
+def pipeline_memoria():
+    """Pipeline completo rodando sobre o broker em memória, sem rede"""
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    pool_publicacao.fechar()
+    notificacoes_status.clear()
+    parar = threading.Event()
+
+    with patch.object(config, 'ESCALA_ATRASO_SIMULADO', 0.001):
+        threads = [
+            threading.Thread(target=executar_estagio, args=(estagio, parar), daemon=True)
+            for estagio in ESTAGIOS
+        ]
+        for thread in threads:
+            thread.start()
+
+        yield broker
+
+        parar.set()
+        broker.derrubar()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    pool_publicacao.fechar()
+    RabbitMQConnection.configurar_transporte(transporte_original)
+    notificacoes_status.clear()
+
+def test_pipeline_ponta_a_ponta_no_broker_em_memoria(pipeline_memoria):
+    """Notificações publicadas pela API atravessam entrada e validação até o envio"""
+    client = app.test_client()
+    trace_ids = []
+    with patch('app.consumers.random.random', return_value=0.5):
+        for indice in range(20):
+            response = client.post('/api/notificar', json={
+                'conteudoMensagem': f'Mensagem {indice}',
+                'tipoNotificacao': ['EMAIL', 'SMS', 'PUSH'][indice % 3]
+            })
+            assert response.status_code == 202
+            trace_ids.append(UUID(response.get_json()['traceId']))
+
+        limite = time.monotonic() + 10
+        while time.monotonic() < limite:
+            if all(consultar_status(trace_id)['status'] == 'ENVIADO_SUCESSO' for trace_id in trace_ids):
+                break
+            time.sleep(0.02)
+
+    for trace_id in trace_ids:
+        assert consultar_status(trace_id)['historico'] == [
+            'RECEBIDO', 'PROCESSADO_INTERMEDIARIO', 'ENVIADO_SUCESSO'
+        ]
+    assert pipeline_memoria.estatisticas[config.FILA_ENTRADA].confirmadas == 20
+    # Cada tipo passa pela sua própria fila de validação
+    for tipo, quantidade in (('EMAIL', 7), ('SMS', 7), ('PUSH', 6)):
+        assert pipeline_memoria.estatisticas[config.FILAS_VALIDACAO[tipo]].confirmadas == quantidade
+    assert pipeline_memoria.profundidade(config.FILA_DLQ) == 0
+
+def test_carimbo_de_rastreio_e_codificavel_no_amqp():
+    """Os headers carimbados passam pela codificação do pika, como num broker real"""
+    headers = rastreio.carimbar({'x-reenvio': 1}, rastreio.novo_span())
+    pika.BasicProperties(delivery_mode=2, headers=headers).encode()
+
+    assert isinstance(headers[rastreio.HEADER_ENFILEIRADO_EM], int)
+    espera = rastreio.espera_na_fila(headers, time.time() + 0.5)
+    assert 0.4 < espera < 0.6
+
+def test_etapas_encadeiam_spans_e_alimentam_percentis(pipeline_memoria):
+    """Cada estágio registra espera e processamento num span filho do que publicou"""
+    client = app.test_client()
+    with patch('app.consumers.random.random', return_value=0.5):
+        response = client.post('/api/notificar', json={'conteudoMensagem': 'Oi', 'tipoNotificacao': 'SMS'})
+        trace_id = response.get_json()['traceId']
+
+        limite = time.monotonic() + 10
+        while consultar_status(UUID(trace_id))['status'] != 'ENVIADO_SUCESSO' and time.monotonic() < limite:
+            time.sleep(0.02)
+
+    etapas = client.get(f'/api/notificacao/status/{trace_id}').get_json()['etapas']
+    assert [etapa['estagio'] for etapa in etapas] == ['entrada', 'validacao_sms']
+    entrada, validacao = etapas
+    assert entrada['spanPai'] is not None
+    assert validacao['spanPai'] == entrada['span']
+    assert validacao['inicio'] >= entrada['inicio']
+    assert all(etapa['esperaFila'] >= 0 and etapa['processamento'] > 0 for etapa in etapas)
+
+    latencias = client.get('/api/metricas/estagios').get_json()
+    assert latencias['estagios']['validacao_sms']['amostras'] >= 1
+    assert latencias['gargalo'] in latencias['estagios']
+
+def test_fila_de_validacao_antiga_e_drenada_para_as_vias(pipeline_memoria):
+    """Mensagens deixadas na fila única de validação seguem para a via do seu tipo"""
+    trace_id = uuid4()
+    dados = {'traceId': str(trace_id), 'mensagemId': str(uuid4()), 'conteudoMensagem': 'x', 'tipoNotificacao': 'PUSH'}
+    atualizar_status(trace_id, 'PROCESSADO_INTERMEDIARIO', dados)
+    # A entrada já marcou o seu passo antes do deploy das vias por tipo
+    notificacoes_status.marcar_passo(trace_id, 0)
+    conexao = pipeline_memoria.conectar()
+    canal = conexao.channel()
+    canal.queue_declare(queue=config.FILA_VALIDACAO, durable=True)
+    with patch('app.consumers.random.random', return_value=0.5):
+        canal.basic_publish(exchange='', routing_key=config.FILA_VALIDACAO, body=json.dumps(dados))
+
+        limite = time.monotonic() + 10
+        while consultar_status(trace_id)['status'] != 'ENVIADO_SUCESSO' and time.monotonic() < limite:
+            time.sleep(0.02)
+
+    assert consultar_status(trace_id)['status'] == 'ENVIADO_SUCESSO'
+    assert pipeline_memoria.estatisticas[config.FILAS_VALIDACAO['PUSH']].confirmadas == 1
+    assert pipeline_memoria.profundidade(config.FILA_VALIDACAO) == 0
+    conexao.close()
@@ -2,15 +2,17 @@ import pytest
 from unittest.mock import patch, MagicMock
 from uuid import UUID, uuid4
 import json
-from app.app import app
+import pika
+from app.app import app, pool_publicacao
 from app.consumers import notificacoes_status, atualizar_status
+from app.rabbitmq import PoolPublicacao, RastreadorConfirmacoes
 
 @pytest.fixture(autouse=True)
-def mock_consumers():
-    """Mock completo dos consumidores RabbitMQ para evitar interferência nos testes"""
-    with patch('app.app.iniciar_consumidores'), \
-         patch('app.app.start_consumers'):
-        yield
+def reset_pool_publicacao():
+    """Descarta os canais do pool para que cada teste use o seu mock de conexão"""
+    pool_publicacao.fechar()
+    yield
+    pool_publicacao.fechar()
 
 @pytest.fixture
 def client():
@@ -30,6 +32,28 @@ def mock_rabbitmq_connection():
         
         yield mock_channel
 
+@pytest.fixture
+def mock_rabbitmq_confirmacoes():
+    """Mock de canal em modo confirm: o broker confirma cada publicação em seguida"""
+    with patch('app.app.RabbitMQConnection.get_connection') as mock_get_connection:
+        mock_channel = MagicMock()
+        estado = {'tag': 0, 'recusar': set()}
+
+        def confirm_delivery(ack_nack_callback, callback=None):
+            estado['ao_confirmar'] = ack_nack_callback
+
+        def basic_publish(**kwargs):
+            estado['tag'] += 1
+            metodo = pika.spec.Basic.Nack if estado['tag'] in estado['recusar'] else pika.spec.Basic.Ack
+            estado['ao_confirmar'](pika.frame.Method(1, metodo(delivery_tag=estado['tag'])))
+
+        mock_channel._impl.confirm_delivery.side_effect = confirm_delivery
+        mock_channel.basic_publish.side_effect = basic_publish
+        mock_get_connection.return_value.channel.return_value = mock_channel
+        mock_channel.estado = estado
+
+        yield mock_channel
+
 @pytest.fixture
 def mock_consumers_import():
     """Mock da importação dentro da função enviar_notificacao"""
@@ -189,6 +213,37 @@ def test_consultar_status_traceid_invalido(client):
     assert response.status_code == 400
     assert 'error' in response.get_json()
 
+def test_consultar_status_em_lote_com_projecao(client):
+    """traceIds e mensagemIds resolvidos numa requisição, só com os campos pedidos"""
+    mensagem_id = uuid4()
+    trace_ids = [uuid4() for _ in range(3)]
+    for indice, trace_id in enumerate(trace_ids):
+        atualizar_status(trace_id, "RECEBIDO", {
+            "mensagemId": str(mensagem_id if indice < 2 else uuid4()),
+            "conteudoMensagem": "Mensagem de teste",
+            "tipoNotificacao": "SMS"
+        })
+    inexistente = str(uuid4())
+
+    response = client.post('/api/notificacao/status/lote', json={
+        'traceIds': [str(trace_ids[2]), inexistente, 'nao-e-uuid'],
+        'mensagemIds': [str(mensagem_id)],
+        'campos': ['traceId', 'status']
+    })
+
+    assert response.status_code == 200
+    corpo = response.get_json()
+    assert sorted(resultado['traceId'] for resultado in corpo['resultados']) == sorted(map(str, trace_ids))
+    assert all(set(resultado) == {'traceId', 'status'} for resultado in corpo['resultados'])
+    assert corpo['naoEncontrados'] == [inexistente]
+    assert corpo['invalidos'] == ['nao-e-uuid']
+
+    response = client.get(f'/api/notificacao/status?mensagemId={mensagem_id}&campos=traceId,historico')
+    assert sorted(resultado['traceId'] for resultado in response.get_json()['resultados']) == \
+        sorted(map(str, trace_ids[:2]))
+    assert client.get(f'/api/notificacao/status?mensagemId={uuid4()}').status_code == 404
+    assert client.get(f'/api/notificacao/status/{trace_ids[0]}?campos=conteudo').status_code == 400
+
 def test_health_check(client):
     """Teste do endpoint health check"""
 
@@ -228,4 +283,153 @@ def test_rabbitmq_publication_parameters(mock_rabbitmq_connection, mock_consumer
         assert body_data['conteudoMensagem'] == 'Teste de parâmetros'
         assert body_data['tipoNotificacao'] == 'EMAIL'
         assert body_data['traceId'] == response_data.get('traceId')
-        assert mock_consumers_import.called
\ No newline at end of file
+        assert mock_consumers_import.called
+
+def test_pool_reutiliza_conexao_e_declaracao(client, mock_rabbitmq_connection, mock_consumers_import):
+    """Requisições seguidas reutilizam o canal e declaram a fila uma única vez"""
+    for _ in range(3):
+        response = client.post(
+            '/api/notificar',
+            json={'conteudoMensagem': 'Teste', 'tipoNotificacao': 'SMS'},
+            content_type='application/json'
+        )
+        assert response.status_code == 202
+
+    assert mock_rabbitmq_connection.queue_declare.call_count == 1
+    assert mock_rabbitmq_connection.basic_publish.call_count == 3
+
+def test_pool_reconecta_canal_fechado():
+    """Canal morto é descartado e reaberto no próximo empréstimo"""
+    pool = PoolPublicacao(tamanho=1)
+    with patch('app.rabbitmq.RabbitMQConnection.get_connection') as mock_get_connection:
+        canal_morto = MagicMock()
+        canal_novo = MagicMock()
+        mock_get_connection.return_value.channel.side_effect = [canal_morto, canal_novo]
+
+        pool.publicar('fila.teste', '{}', None)
+        canal_morto.is_open = False
+        pool.publicar('fila.teste', '{}', None)
+
+    canal_morto.basic_publish.assert_called_once()
+    canal_novo.basic_publish.assert_called_once()
+    canal_novo.queue_declare.assert_called_once_with(queue='fila.teste', durable=True)
+
+def test_enviar_lote_sucesso(client, mock_rabbitmq_confirmacoes):
+    """Lote válido é registrado de uma vez e publicado em um único canal confirmado"""
+    lote = [
+        {'conteudoMensagem': f'Mensagem {indice}', 'tipoNotificacao': tipo}
+        for indice, tipo in enumerate(['EMAIL', 'SMS', 'PUSH'])
+    ]
+
+    with patch('app.consumers.atualizar_status_lote') as mock_atualizar_lote:
+        response = client.post('/api/notificar/lote', json=lote)
+
+    assert response.status_code == 202
+    resultados = response.get_json()['resultados']
+    assert len(resultados) == 3
+    assert all(isinstance(UUID(resultado['traceId']), UUID) for resultado in resultados)
+
+    mock_atualizar_lote.assert_called_once()
+    assert len(mock_atualizar_lote.call_args[0][0]) == 3
+    assert mock_rabbitmq_confirmacoes.basic_publish.call_count == 3
+    mock_rabbitmq_confirmacoes._impl.confirm_delivery.assert_called_once()
+
+    corpo = json.loads(mock_rabbitmq_confirmacoes.basic_publish.call_args_list[1][1]['body'])
+    assert corpo['traceId'] == resultados[1]['traceId']
+    assert corpo['tipoNotificacao'] == 'SMS'
+
+def test_enviar_lote_erros_por_item(client, mock_rabbitmq_confirmacoes, mock_consumers_import):
+    """Itens inválidos e recusados pelo broker retornam erro sem afetar os demais"""
+    mock_rabbitmq_confirmacoes.estado['recusar'].add(2)
+    custom_id = '123e4567-e89b-12d3-a456-426614174000'
+    lote = [
+        {'conteudoMensagem': 'ok', 'tipoNotificacao': 'EMAIL', 'mensagemId': custom_id},
+        {'conteudoMensagem': 'tipo ruim', 'tipoNotificacao': 'FAX'},
+        {'conteudoMensagem': 'recusada', 'tipoNotificacao': 'SMS'},
+        'nao-e-objeto'
+    ]
+
+    with patch('app.consumers.atualizar_status_lote'):
+        response = client.post('/api/notificar/lote', json=lote)
+
+    assert response.status_code == 202
+    resultados = response.get_json()['resultados']
+    assert resultados[0]['mensagemId'] == custom_id
+    assert 'tipoNotificacao' in resultados[1]['error']
+    assert resultados[2]['error'] == 'Notificação recusada pelo broker'
+    assert resultados[3]['indice'] == 3 and 'error' in resultados[3]
+
+def test_enviar_lote_invalido(client):
+    """Corpo que não é lista ou lote só com itens inválidos retornam 400"""
+    assert client.post('/api/notificar/lote', json={'a': 1}).status_code == 400
+
+    response = client.post('/api/notificar/lote', json=[{'conteudoMensagem': 'x'}])
+    assert response.status_code == 400
+    assert 'error' in response.get_json()['resultados'][0]
+
+def test_enviar_notificacao_aguardando_confirmacao(client, mock_rabbitmq_confirmacoes, mock_consumers_import):
+    """Com aguardarConfirmacao a resposta só sai após o ack do broker"""
+    mock_rabbitmq_confirmacoes.estado['recusar'].add(2)
+    dados = {'conteudoMensagem': 'Teste', 'tipoNotificacao': 'EMAIL'}
+
+    response = client.post('/api/notificar?aguardarConfirmacao=true', json=dados)
+    assert response.status_code == 202
+
+    response = client.post('/api/notificar?aguardarConfirmacao=true', json=dados)
+    assert response.status_code == 503
+    assert 'error' in response.get_json()
+
+def test_rastreador_resolve_confirmacoes_multiplas():
+    """Um ack com multiple=True resolve todas as tags pendentes até ele"""
+    rastreador = RastreadorConfirmacoes()
+    resultados = {}
+    for indice in range(4):
+        rastreador.registrar(lambda confirmado, indice=indice: resultados.__setitem__(indice, confirmado))
+
+    rastreador.ao_confirmar(pika.frame.Method(1, pika.spec.Basic.Ack(delivery_tag=3, multiple=True)))
+    assert resultados == {0: True, 1: True, 2: True}
+    assert rastreador.pendentes == 1
+
+    rastreador.ao_confirmar(pika.frame.Method(1, pika.spec.Basic.Nack(delivery_tag=4)))
+    assert resultados[3] is False
+    assert rastreador.pendentes == 0
+
+def test_reenvio_com_mesmo_mensagem_id_nao_publica_de_novo(client, mock_rabbitmq_connection):
+    """Retry do cliente com o mesmo mensagemId devolve o traceId original"""
+    dados = {'conteudoMensagem': 'Teste', 'tipoNotificacao': 'SMS', 'mensagemId': str(uuid4())}
+
+    primeira = client.post('/api/notificar', json=dados)
+    segunda = client.post('/api/notificar', json=dados)
+
+    assert primeira.status_code == segunda.status_code == 202
+    assert primeira.get_json()['traceId'] == segunda.get_json()['traceId']
+    mock_rabbitmq_connection.basic_publish.assert_called_once()
+
+def test_reenvio_apos_falha_de_publicacao_publica_novamente(client, mock_rabbitmq_confirmacoes):
+    """Se o broker recusou, a reserva é desfeita e o reenvio segue normalmente"""
+    mock_rabbitmq_confirmacoes.estado['recusar'].add(1)
+    dados = {'conteudoMensagem': 'Teste', 'tipoNotificacao': 'PUSH', 'mensagemId': str(uuid4())}
+
+    assert client.post('/api/notificar?aguardarConfirmacao=true', json=dados).status_code == 503
+    assert client.post('/api/notificar?aguardarConfirmacao=true', json=dados).status_code == 202
+    assert mock_rabbitmq_confirmacoes.basic_publish.call_count == 2
+
+def test_lote_descarta_mensagem_id_repetido(client, mock_rabbitmq_confirmacoes):
+    mensagem_id = str(uuid4())
+    item = {'conteudoMensagem': 'x', 'tipoNotificacao': 'EMAIL', 'mensagemId': mensagem_id}
+
+    response = client.post('/api/notificar/lote', json=[item, item])
+
+    resultados = response.get_json()['resultados']
+    assert response.status_code == 202
+    assert resultados[0]['traceId'] == resultados[1]['traceId']
+    assert mock_rabbitmq_confirmacoes.basic_publish.call_count == 1
+
+def test_lote_sem_mensagem_id_nao_reserva(client, mock_rabbitmq_confirmacoes):
+    itens = [{'conteudoMensagem': 'x', 'tipoNotificacao': 'EMAIL'} for _ in range(3)]
+
+    with patch('app.app.reservar_mensagem') as reservar:
+        response = client.post('/api/notificar/lote', json=itens)
+
+    assert response.status_code == 202
+    reservar.assert_not_called()
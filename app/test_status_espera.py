@@ -0,0 +1,83 @@
+import threading
+import time
+from uuid import uuid4
+import pytest
+from app.app import app
+from app.consumers import atualizar_status, assinaturas_status, notificacoes_status
+
+DADOS = {"mensagemId": str(uuid4()), "conteudoMensagem": "Olá", "tipoNotificacao": "SMS"}
+
+@pytest.fixture
+def client():
+    notificacoes_status.clear()
+    yield app.test_client()
+    notificacoes_status.clear()
+
+def _atualizar_depois(atraso, trace_id, *status):
+    def atualizar():
+        for item in status:
+            time.sleep(atraso)
+            atualizar_status(trace_id, item, DADOS)
+    thread = threading.Thread(target=atualizar)
+    thread.start()
+    return thread
+
+def test_long_poll_responde_na_mudanca_de_status(client):
+    trace_id = uuid4()
+    atualizar_status(trace_id, "RECEBIDO", DADOS)
+    thread = _atualizar_depois(0.1, trace_id, "PROCESSADO_INTERMEDIARIO")
+
+    inicio = time.monotonic()
+    response = client.get(f'/api/notificacao/status/{trace_id}?wait=5')
+    thread.join()
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'PROCESSADO_INTERMEDIARIO'
+    assert time.monotonic() - inicio < 2
+    assert len(assinaturas_status) == 0
+
+def test_long_poll_devolve_status_atual_no_prazo(client):
+    trace_id = uuid4()
+    atualizar_status(trace_id, "RECEBIDO", DADOS)
+
+    response = client.get(f'/api/notificacao/status/{trace_id}?wait=0.1')
+
+    assert response.get_json()['status'] == 'RECEBIDO'
+
+def test_long_poll_com_versao_antiga_responde_imediatamente(client):
+    trace_id = uuid4()
+    atualizar_status(trace_id, "RECEBIDO", DADOS)
+    atualizar_status(trace_id, "PROCESSADO_INTERMEDIARIO", DADOS)
+
+    inicio = time.monotonic()
+    response = client.get(f'/api/notificacao/status/{trace_id}?wait=5&versao=1')
+
+    assert response.get_json()['historico'] == ['RECEBIDO', 'PROCESSADO_INTERMEDIARIO']
+    assert time.monotonic() - inicio < 1
+
+def test_stream_envia_cada_transicao_ate_status_final(client):
+    trace_id = uuid4()
+    atualizar_status(trace_id, "RECEBIDO", DADOS)
+    thread = _atualizar_depois(0.05, trace_id, "PROCESSADO_INTERMEDIARIO", "ENVIADO_SUCESSO")
+
+    response = client.get(f'/api/notificacao/status/{trace_id}/stream')
+    corpo = response.get_data(as_text=True)
+    thread.join()
+
+    assert response.mimetype == 'text/event-stream'
+    eventos = [bloco for bloco in corpo.split('\n\n') if bloco.startswith('id:')]
+    assert [evento.split('\n')[0] for evento in eventos] == ['id: 1', 'id: 2', 'id: 3']
+    assert '"status": "ENVIADO_SUCESSO", "final": true' in eventos[-1]
+
+def test_stream_retoma_a_partir_do_last_event_id(client):
+    trace_id = uuid4()
+    for status in ("RECEBIDO", "PROCESSADO_INTERMEDIARIO", "ENVIADO_SUCESSO"):
+        atualizar_status(trace_id, status, DADOS)
+
+    response = client.get(f'/api/notificacao/status/{trace_id}/stream', headers={'Last-Event-ID': '2'})
+
+    eventos = [bloco for bloco in response.get_data(as_text=True).split('\n\n') if bloco]
+    assert len(eventos) == 1 and eventos[0].startswith('id: 3')
+
+def test_stream_de_trace_inexistente_retorna_404(client):
+    assert client.get(f'/api/notificacao/status/{uuid4()}/stream').status_code == 404
@@ -0,0 +1,310 @@
+import threading
+from uuid import UUID, uuid4
+import time
+import pytest
+from app.status_store import StatusStore, SQLiteStatusStore, criar_status_store
+
+def _dados():
+    return {
+        "mensagemId": str(uuid4()),
+        "conteudoMensagem": "Mensagem de teste",
+        "tipoNotificacao": "EMAIL"
+    }
+
+class RelogioFalso:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+def test_historico_e_status_atual():
+    """Histórico guardado como códigos é devolvido como nomes de status"""
+    store = StatusStore()
+    trace_id = uuid4()
+    dados = _dados()
+
+    store.atualizar(trace_id, "RECEBIDO", dados)
+    store.atualizar(trace_id, "PROCESSADO_INTERMEDIARIO", dados)
+    store.atualizar(trace_id, "ENVIADO_SUCESSO", dados)
+
+    resultado = store.obter(trace_id)
+    assert resultado["status"] == "ENVIADO_SUCESSO"
+    assert resultado["historico"] == ["RECEBIDO", "PROCESSADO_INTERMEDIARIO", "ENVIADO_SUCESSO"]
+    assert str(resultado["mensagemId"]) == dados["mensagemId"]
+    assert resultado["tipoNotificacao"] == "EMAIL"
+
+def test_ttl_despeja_apenas_estados_finais():
+    """Entradas finais expiram após o TTL; entradas em andamento permanecem"""
+    relogio = RelogioFalso()
+    store = StatusStore(ttl_final=10, relogio=relogio)
+    finalizada, em_andamento = uuid4(), uuid4()
+
+    store.atualizar(finalizada, "RECEBIDO", _dados())
+    store.atualizar(finalizada, "FALHA_ENVIO_FINAL", _dados())
+    store.atualizar(em_andamento, "RECEBIDO", _dados())
+
+    relogio.agora = 11
+    store.atualizar(uuid4(), "RECEBIDO", _dados())
+
+    assert finalizada not in store
+    assert em_andamento in store
+    assert store.estatisticas()["despejosTtl"] == 1
+
+def test_capacidade_maxima_despeja_mais_antigas():
+    """Ao exceder o limite, as entradas atualizadas há mais tempo saem primeiro"""
+    store = StatusStore(max_entradas=2, fragmentos=1)
+    primeira, segunda, terceira = uuid4(), uuid4(), uuid4()
+
+    store.atualizar(primeira, "RECEBIDO", _dados())
+    store.atualizar(segunda, "RECEBIDO", _dados())
+    store.atualizar(primeira, "PROCESSADO_INTERMEDIARIO", _dados())
+    store.atualizar(terceira, "RECEBIDO", _dados())
+
+    assert segunda not in store
+    assert primeira in store and terceira in store
+    estatisticas = store.estatisticas()
+    assert estatisticas["despejosCapacidade"] == 1
+    assert estatisticas["entradas"] == 2
+
+def test_clear_zera_memoria_estimada():
+    store = StatusStore()
+    store.atualizar(uuid4(), "RECEBIDO", _dados())
+    assert store.estatisticas()["bytesEstimados"] > 0
+
+    store.clear()
+    assert store.estatisticas()["bytesEstimados"] == 0
+    assert len(store) == 0
+
+def test_fragmentos_dividem_capacidade_e_somam_estatisticas():
+    """Cada fragmento respeita a sua parte do limite e as estatísticas são agregadas"""
+    store = StatusStore(max_entradas=8, fragmentos=4)
+    for _ in range(100):
+        store.atualizar(uuid4(), "RECEBIDO", _dados())
+
+    estatisticas = store.estatisticas()
+    assert estatisticas["fragmentos"] == 4
+    assert estatisticas["entradas"] == len(store) <= 8
+    assert estatisticas["despejosCapacidade"] == 100 - estatisticas["entradas"]
+
+def test_atualizacoes_concorrentes_preservam_historico():
+    """Escritores concorrentes não perdem transições de status"""
+    store = StatusStore()
+    trace_ids = [uuid4() for _ in range(50)]
+    dados = _dados()
+    for trace_id in trace_ids:
+        store.atualizar(trace_id, "RECEBIDO", dados)
+
+    def escrever():
+        for trace_id in trace_ids:
+            store.atualizar(trace_id, "PROCESSADO_INTERMEDIARIO", dados)
+
+    threads = [threading.Thread(target=escrever) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for trace_id in trace_ids:
+        assert len(store.obter(trace_id)["historico"]) == 9
+
+@pytest.fixture
+def caminho_sqlite(tmp_path):
+    return str(tmp_path / "status.db")
+
+def test_sqlite_compartilhado_entre_instancias(caminho_sqlite):
+    """Dois stores no mesmo arquivo (como dois workers) enxergam o mesmo estado"""
+    api = SQLiteStatusStore(caminho_sqlite)
+    consumidor = SQLiteStatusStore(caminho_sqlite)
+    trace_id = uuid4()
+    dados = _dados()
+
+    try:
+        api.atualizar(trace_id, "RECEBIDO", dados)
+        assert api.obter(trace_id)["status"] == "RECEBIDO"
+
+        consumidor.atualizar(trace_id, "PROCESSADO_INTERMEDIARIO", dados)
+        consumidor.atualizar(trace_id, "ENVIADO_SUCESSO", dados)
+        consumidor.descarregar()
+
+        resultado = api.obter(trace_id)
+        assert resultado["status"] == "ENVIADO_SUCESSO"
+        assert resultado["historico"] == ["RECEBIDO", "PROCESSADO_INTERMEDIARIO", "ENVIADO_SUCESSO"]
+        assert str(resultado["mensagemId"]) == dados["mensagemId"]
+    finally:
+        api.fechar()
+        consumidor.fechar()
+
+def test_sqlite_recebido_gravado_antes_da_transicao_de_outro_processo(caminho_sqlite):
+    """O consumidor pode gravar o lote dele antes do próximo lote da API: o RECEBIDO já está no arquivo"""
+    api = SQLiteStatusStore(caminho_sqlite, intervalo=60)
+    consumidor = SQLiteStatusStore(caminho_sqlite, intervalo=60)
+    trace_id = uuid4()
+    dados = _dados()
+
+    try:
+        api.atualizar(trace_id, "RECEBIDO", dados)
+        consumidor.atualizar(trace_id, "FALHA_PROCESSAMENTO_INICIAL", dados)
+        consumidor.marcar_passo(trace_id, 0)
+        consumidor.descarregar()
+
+        resultado = api.obter(trace_id)
+        assert resultado["historico"] == ["RECEBIDO", "FALHA_PROCESSAMENTO_INICIAL"]
+        assert resultado["status"] == "FALHA_PROCESSAMENTO_INICIAL"
+        assert api.passo_concluido(trace_id, 0)
+    finally:
+        api.fechar()
+        consumidor.fechar()
+
+def test_sqlite_grava_em_lote_e_poda_finalizadas(caminho_sqlite):
+    """Atualizações pendentes vão em uma transação; finais expiradas são podadas"""
+    store = SQLiteStatusStore(caminho_sqlite, ttl_final=0, intervalo=60)
+    finalizada, em_andamento = uuid4(), uuid4()
+
+    try:
+        store.atualizar(finalizada, "RECEBIDO", _dados())
+        store.atualizar(finalizada, "ENVIADO_SUCESSO", _dados())
+        store.atualizar(em_andamento, "RECEBIDO", _dados())
+        store.descarregar()
+        assert store.estatisticas()["lotesGravados"] == 1
+
+        time.sleep(0.01)
+        store.podar()
+        assert finalizada not in store
+        assert em_andamento in store
+        assert store.estatisticas()["removidosPoda"] == 1
+    finally:
+        store.fechar()
+
+def test_criar_status_store_backend_invalido():
+    with pytest.raises(ValueError):
+        criar_status_store("redis", max_entradas=1, ttl_final=1)
+
+def test_atualizar_lote_distribui_entre_fragmentos():
+    """Um lote de atualizações é aplicado por fragmento, preservando a ordem por traceId"""
+    store = StatusStore(fragmentos=4)
+    trace_ids = [uuid4() for _ in range(20)]
+    dados = _dados()
+
+    store.atualizar_lote(
+        [(trace_id, "RECEBIDO", dados) for trace_id in trace_ids]
+        + [(trace_id, "PROCESSADO_INTERMEDIARIO", dados) for trace_id in trace_ids]
+    )
+
+    assert len(store) == 20
+    for trace_id in trace_ids:
+        assert store.obter(trace_id)["historico"] == ["RECEBIDO", "PROCESSADO_INTERMEDIARIO"]
+
+def test_idempotencia_devolve_trace_original_ate_o_ttl():
+    relogio = RelogioFalso()
+    store = StatusStore(relogio=relogio, ttl_idempotencia=60)
+    mensagem_id, original, repetido = uuid4(), uuid4(), uuid4()
+
+    assert store.reservar_mensagem(mensagem_id, original) is None
+    assert store.reservar_mensagem(mensagem_id, repetido) == original
+
+    relogio.agora = 61
+    assert store.reservar_mensagem(mensagem_id, repetido) is None
+
+def test_idempotencia_liberada_e_limitada_por_lru():
+    store = StatusStore(max_entradas=2, fragmentos=1)
+    primeira, segunda, terceira = uuid4(), uuid4(), uuid4()
+    trace_id = uuid4()
+
+    store.reservar_mensagem(primeira, trace_id)
+    store.liberar_mensagem(primeira, uuid4())  # outro traceId não desfaz a reserva
+    assert store.reservar_mensagem(primeira, uuid4()) == trace_id
+    store.liberar_mensagem(primeira, trace_id)
+    assert store.reservar_mensagem(primeira, trace_id) is None
+
+    store.reservar_mensagem(segunda, uuid4())
+    store.reservar_mensagem(primeira, uuid4())  # acesso renova a primeira
+    store.reservar_mensagem(terceira, uuid4())
+    assert store.reservar_mensagem(primeira, uuid4()) == trace_id
+    assert store.reservar_mensagem(segunda, uuid4()) is None
+
+def test_passos_concluidos_por_trace():
+    store = StatusStore()
+    trace_id = uuid4()
+    store.atualizar(trace_id, "RECEBIDO", _dados())
+
+    store.marcar_passo(trace_id, 3)
+    assert store.passo_concluido(trace_id, 3)
+    assert not store.passo_concluido(trace_id, 0)
+    assert not store.passo_concluido(uuid4(), 3)
+
+def test_sqlite_idempotencia_e_passos_entre_instancias(caminho_sqlite):
+    api = SQLiteStatusStore(caminho_sqlite)
+    consumidor = SQLiteStatusStore(caminho_sqlite)
+    mensagem_id, trace_id = uuid4(), uuid4()
+
+    try:
+        assert api.reservar_mensagem(mensagem_id, trace_id) is None
+        assert consumidor.reservar_mensagem(mensagem_id, uuid4()) == trace_id
+
+        api.atualizar(trace_id, "RECEBIDO", _dados())
+        api.descarregar()
+        consumidor.marcar_passo(trace_id, 1)
+        consumidor.descarregar()
+        assert api.passo_concluido(trace_id, 1)
+        assert not api.passo_concluido(trace_id, 0)
+    finally:
+        api.fechar()
+        consumidor.fechar()
+
+def test_sqlite_passo_concluido_nao_forca_gravacao(caminho_sqlite):
+    """Os passos marcados no processo são consultados em memória até o lote ser gravado"""
+    store = SQLiteStatusStore(caminho_sqlite, intervalo=60)
+    trace_id = uuid4()
+
+    try:
+        store.atualizar(trace_id, "RECEBIDO", _dados())
+        store.marcar_passo(trace_id, 0)
+        store.marcar_passo(trace_id, 2)
+        assert store.passo_concluido(trace_id, 0) and store.passo_concluido(trace_id, 2)
+        assert not store.passo_concluido(trace_id, 1)
+        assert store.lotes_gravados == 0
+
+        store.descarregar()
+        assert store.passo_concluido(trace_id, 2)
+        assert not store.passo_concluido(trace_id, 1)
+    finally:
+        store.fechar()
+
+def test_etapas_registradas_nos_dois_backends(caminho_sqlite):
+    memoria = StatusStore()
+    sqlite = SQLiteStatusStore(caminho_sqlite)
+    trace_id = uuid4()
+    try:
+        for store in (memoria, sqlite):
+            store.atualizar(trace_id, "RECEBIDO", _dados())
+            store.registrar_etapa(trace_id, "entrada", "a1", "f0", 1000.0, 0.25, 0.5)
+            store.registrar_etapa(trace_id, "validacao_email", "b2", "a1", 1001.0, None, 0.125)
+            etapas = store.obter(trace_id)["etapas"]
+            assert [etapa["estagio"] for etapa in etapas] == ["entrada", "validacao_email"]
+            assert etapas[0] == {"estagio": "entrada", "span": "a1", "spanPai": "f0", "inicio": 1000.0,
+                                 "esperaFila": 0.25, "processamento": 0.5}
+            assert etapas[1]["spanPai"] == "a1" and etapas[1]["esperaFila"] is None
+    finally:
+        sqlite.fechar()
+
+def test_indice_por_mensagem_acompanha_despejos(caminho_sqlite):
+    relogio = RelogioFalso()
+    memoria = StatusStore(ttl_final=10, fragmentos=4, relogio=relogio)
+    sqlite = SQLiteStatusStore(caminho_sqlite)
+    dados = _dados()
+    primeiro, segundo, outro = uuid4(), uuid4(), uuid4()
+    try:
+        for store in (memoria, sqlite):
+            store.atualizar(primeiro, "ENVIADO_SUCESSO", dados)
+            store.atualizar(segundo, "RECEBIDO", dados)
+            store.atualizar(outro, "RECEBIDO", _dados())
+            mensagem_id = dados["mensagemId"]
+            assert {item["traceId"] for item in store.buscar_por_mensagem(UUID(mensagem_id))} == {primeiro, segundo}
+            assert {item["traceId"] for item in store.obter_lote([primeiro, outro, uuid4()])} == {primeiro, outro}
+
+        # A notificação finalizada expira e sai do índice; a outra continua encontrável
+        relogio.agora = 11
+        assert [item["traceId"] for item in memoria.buscar_por_mensagem(UUID(dados["mensagemId"]))] == [segundo]
+    finally:
+        sqlite.fechar()
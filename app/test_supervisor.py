@@ -0,0 +1,90 @@
+import time
+from unittest.mock import patch
+import pytest
+from app import config
+from app.app import app
+from app.broker_memoria import BrokerMemoria
+from app.consumers import atraso_reinicio, ESTAGIOS
+from app.rabbitmq import RabbitMQConnection
+from app.supervisor import SupervisorConsumidores
+
+def _esperar(condicao, timeout=5):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def broker():
+    transporte_original = RabbitMQConnection._transporte
+    broker = BrokerMemoria()
+    RabbitMQConnection.configurar_transporte(broker)
+    with patch.object(config, 'SUPERVISOR_BACKOFF_BASE', 0.01), \
+         patch.object(config, 'SUPERVISOR_BACKOFF_MAX', 0.05):
+        yield broker
+    broker.derrubar()
+    RabbitMQConnection.configurar_transporte(transporte_original)
+
+def test_backoff_com_jitter_limitado_pelo_teto():
+    for tentativa in range(1, 12):
+        teto = min(config.SUPERVISOR_BACKOFF_MAX, config.SUPERVISOR_BACKOFF_BASE * 2 ** (tentativa - 1))
+        assert teto / 2 <= atraso_reinicio(tentativa) <= teto
+
+def test_supervisor_sobe_estagios_em_paralelo_e_fica_pronto(broker):
+    supervisor = SupervisorConsumidores(intervalo=0.05)
+    inicio = time.monotonic()
+    supervisor.iniciar()
+    try:
+        assert _esperar(lambda: supervisor.pronto)
+        assert time.monotonic() - inicio < 2
+        assert set(supervisor.saude()) == {estagio.nome for estagio in ESTAGIOS}
+    finally:
+        supervisor.parar()
+
+def test_supervisor_reconecta_apos_queda_do_broker(broker):
+    supervisor = SupervisorConsumidores(intervalo=0.05)
+    supervisor.iniciar()
+    try:
+        assert _esperar(lambda: supervisor.pronto)
+        broker.derrubar()
+        assert _esperar(lambda: not supervisor.pronto)
+
+        broker.disponivel = True
+        assert _esperar(lambda: supervisor.pronto)
+        assert all(estado['reinicios'] >= 1 for estado in supervisor.saude().values())
+    finally:
+        supervisor.parar()
+
+def test_supervisor_recria_thread_encerrada(broker):
+    chamadas = []
+
+    def executar_estagio_falso(estagio, parar, estado, no=0):
+        chamadas.append(estagio.nome)
+        if chamadas.count(estagio.nome) > 1:
+            estado.conectado()
+            parar.wait()
+
+    with patch('app.supervisor.executar_estagio', side_effect=executar_estagio_falso):
+        supervisor = SupervisorConsumidores(estagios=ESTAGIOS[:1], intervalo=0.01)
+        supervisor.iniciar()
+        try:
+            assert _esperar(lambda: supervisor.pronto)
+            assert chamadas == [ESTAGIOS[0].nome] * 2
+            assert supervisor.saude()[ESTAGIOS[0].nome]['reinicios'] == 1
+        finally:
+            supervisor.parar()
+
+def test_health_expoe_prontidao_por_estagio():
+    supervisor = SupervisorConsumidores(estagios=ESTAGIOS[:1])
+    supervisor.iniciado = True
+    with patch('app.app.supervisor', supervisor):
+        response = app.test_client().get('/health')
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'starting'
+
+        supervisor.estados[ESTAGIOS[0].nome].conectado()
+        response = app.test_client().get('/health')
+        assert response.status_code == 200
+        assert response.get_json()['estagios'][ESTAGIOS[0].nome]['estado'] == 'conectado'
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from app import config
+from app.worker import SupervisorProcessos, main, resolver_estagios
+
+def sair_logo():
+    sys.exit(3)
+
+def dormir():
+    time.sleep(60)
+
+def test_resolver_estagios_expande_validacao():
+    assert resolver_estagios("entrada, validacao,dlq") == [
+        "entrada", "validacao_email", "validacao_sms", "validacao_push", "validacao_legado", "dlq"
+    ]
+    assert resolver_estagios("validacao_sms,validacao") == [
+        "validacao_sms", "validacao_email", "validacao_push", "validacao_legado"
+    ]
+    with pytest.raises(ValueError):
+        resolver_estagios("entrada,envio")
+
+def test_main_exige_backend_de_status_compartilhado():
+    with patch.dict(os.environ, {"STATUS_BACKEND": "memoria"}), pytest.raises(SystemExit):
+        main(["--stages", "entrada", "--processes", "1"])
+
+def test_supervisor_recria_processos_que_morrem():
+    supervisor = SupervisorProcessos(2, sair_logo, intervalo=0.05)
+    parar = threading.Event()
+    thread = threading.Thread(target=supervisor.executar, args=(parar,))
+    with patch.object(config, 'SUPERVISOR_BACKOFF_BASE', 0.01), patch.object(config, 'SUPERVISOR_BACKOFF_MAX', 0.02):
+        thread.start()
+        limite = time.monotonic() + 20
+        while supervisor.reinicios < 2 and time.monotonic() < limite:
+            time.sleep(0.05)
+        parar.set()
+        thread.join(timeout=20)
+
+    assert supervisor.reinicios >= 2
+    assert all(not processo.is_alive() for processo in supervisor._filhos)
+
+def test_parar_encerra_os_filhos_com_sigterm():
+    supervisor = SupervisorProcessos(2, dormir)
+    supervisor.iniciar()
+    filhos = list(supervisor._filhos)
+    supervisor.parar(timeout=10)
+
+    assert all(not processo.is_alive() for processo in filhos)
+    assert all(processo.exitcode == -15 for processo in filhos)
+
+def test_processo_pai_nao_importa_os_consumidores(tmp_path):
+    """Importar app.worker não cria o store de status nem o arquivo da DLQ no diretório atual"""
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    codigo = "import sys, app.worker; print('app.consumers' in sys.modules)"
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=tmp_path, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": raiz}, timeout=30
+    )
+
+    assert resultado.stdout.strip() == "False", resultado.stderr
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,169 @@
+"""Consumidores fora do processo da API: python -m app.worker.
+
+Cada processo do pool roda os estágios escolhidos sob o seu próprio
+SupervisorConsumidores, com GIL, conexões e workers próprios; o broker divide
+as mensagens entre os consumidores concorrentes de cada fila. Este processo
+pai só supervisiona os filhos, recriando com backoff e jitter os que morrerem.
+
+O status precisa ser visível para a API, então os workers usam o backend
+sqlite (STATUS_BACKEND=sqlite e o mesmo STATUS_SQLITE_CAMINHO na API, que deve
+subir com API_CONSUMIDORES=0).
+
+Uso: python -m app.worker [--stages entrada,retry,validacao,dlq] [--processes N] [--motor threads]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from . import config
+from .reinicio import atraso_reinicio
+
+logger = logging.getLogger(__name__)
+
+ESTAGIOS_DISPONIVEIS = tuple(config.ESTAGIO_WORKERS)
+
+
+def resolver_estagios(texto):
+    """Nomes de estágio separados por vírgula; "validacao" inclui todas as vias por tipo"""
+    nomes = []
+    for nome in (parte.strip() for parte in texto.split(",")):
+        if not nome:
+            continue
+        if nome == "validacao":
+            encontrados = [estagio for estagio in ESTAGIOS_DISPONIVEIS if estagio.startswith("validacao_")]
+        elif nome in ESTAGIOS_DISPONIVEIS:
+            encontrados = [nome]
+        else:
+            raise ValueError(f"Estágio desconhecido: {nome} (disponíveis: {', '.join(ESTAGIOS_DISPONIVEIS)})")
+        nomes.extend(encontrado for encontrado in encontrados if encontrado not in nomes)
+    if not nomes:
+        raise ValueError("Nenhum estágio informado")
+    return nomes
+
+
+def executar_processo(nomes, motor):
+    """Corpo de cada processo do pool: sobe os estágios e espera o SIGTERM do pai"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    from .consumers import ESTAGIOS, notificacoes_status
+    from .entrega import fechar_entregadores
+    from .supervisor import SupervisorConsumidores
+
+    supervisor = SupervisorConsumidores([estagio for estagio in ESTAGIOS if estagio.nome in nomes], motor=motor)
+    signal.signal(signal.SIGTERM, lambda sinal, quadro: supervisor.parar())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    supervisor.iniciar()
+    supervisor.aguardar()
+
+    fechar_entregadores()
+    # Grava as atualizações de status ainda pendentes antes de sair
+    if hasattr(notificacoes_status, "fechar"):
+        notificacoes_status.fechar()
+
+
+class SupervisorProcessos:
+    """Mantém processos filhos rodando alvo(*argumentos), recriando os que morrem.
+
+    Usa o contexto spawn: cada filho começa num interpretador limpo, sem herdar
+    conexões nem threads do pai.
+    """
+
+    def __init__(self, processos, alvo, argumentos=(), intervalo=1, contexto="spawn"):
+        self.processos = processos
+        self.alvo = alvo
+        self.argumentos = argumentos
+        self.intervalo = intervalo
+        self.reinicios = 0
+        self._contexto = multiprocessing.get_context(contexto)
+        self._filhos = [None] * processos
+        self._mortes = [0] * processos
+        self._proxima_tentativa = {}
+        self._parando = False
+
+    def _iniciar(self, indice):
+        processo = self._contexto.Process(
+            target=self.alvo, args=self.argumentos, name=f"worker-{indice}", daemon=False
+        )
+        processo.start()
+        self._filhos[indice] = processo
+        logger.info(f"Processo worker-{indice} iniciado (pid {processo.pid})")
+
+    def iniciar(self):
+        for indice in range(self.processos):
+            self._iniciar(indice)
+
+    def verificar(self):
+        """Agenda a recriação dos filhos que morreram e recria os que já esperaram o backoff"""
+        agora = time.monotonic()
+        for indice, processo in enumerate(self._filhos):
+            if self._parando or processo.is_alive():
+                continue
+            if indice not in self._proxima_tentativa:
+                self._mortes[indice] += 1
+                espera = atraso_reinicio(self._mortes[indice])
+                self._proxima_tentativa[indice] = agora + espera
+                logger.error(
+                    f"Processo worker-{indice} (pid {processo.pid}) saiu com código {processo.exitcode}; "
+                    f"recriando em {espera:.1f}s"
+                )
+            elif agora >= self._proxima_tentativa[indice]:
+                del self._proxima_tentativa[indice]
+                self.reinicios += 1
+                self._iniciar(indice)
+
+    def executar(self, parar=None):
+        """Supervisiona até parar (threading.Event) ser sinalizado, ou até SIGTERM/SIGINT"""
+        self.iniciar()
+        try:
+            while not self._parando and not (parar is not None and parar.is_set()):
+                self.verificar()
+                time.sleep(self.intervalo)
+        finally:
+            self.parar()
+
+    def parar(self, timeout=10):
+        """SIGTERM a todos os filhos; quem não sair no prazo é morto"""
+        self._parando = True
+        for processo in self._filhos:
+            if processo is not None and processo.is_alive():
+                processo.terminate()
+        limite = time.monotonic() + timeout
+        for processo in self._filhos:
+            if processo is not None:
+                processo.join(max(0, limite - time.monotonic()))
+                if processo.is_alive():
+                    logger.warning(f"Processo {processo.name} não encerrou em {timeout}s, matando")
+                    processo.kill()
+                    processo.join()
+
+    def sinalizar_parada(self, sinal=None, quadro=None):
+        self._parando = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default=",".join(ESTAGIOS_DISPONIVEIS),
+                        help="estágios separados por vírgula (entrada, retry, validacao, validacao_<tipo>, dlq)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="processos no pool")
+    parser.add_argument("--motor", choices=("threads", "asyncio"), default=config.MOTOR_CONSUMIDORES)
+    args = parser.parse_args(argv)
+    try:
+        nomes = resolver_estagios(args.stages)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.processes < 1:
+        parser.error("--processes deve ser ao menos 1")
+    if os.environ.setdefault("STATUS_BACKEND", "sqlite") != "sqlite":
+        parser.error("os workers precisam de STATUS_BACKEND=sqlite para que a API enxergue o status")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    logger.info(f"Iniciando {args.processes} processos com os estágios {', '.join(nomes)} (motor {args.motor})")
+    supervisor = SupervisorProcessos(args.processes, executar_processo, (nomes, args.motor))
+    signal.signal(signal.SIGTERM, supervisor.sinalizar_parada)
+    signal.signal(signal.SIGINT, supervisor.sinalizar_parada)
+    supervisor.executar()
+
+
+if __name__ == "__main__":
+    main()
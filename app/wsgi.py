@@ -0,0 +1,7 @@
+"""Ponto de entrada WSGI (ex.: gunicorn app.wsgi:app).
+
+Os consumidores sobem no boot do processo, e não na primeira requisição.
+"""
+from .app import app, iniciar_supervisor
+
+iniciar_supervisor()
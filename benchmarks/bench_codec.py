@@ -0,0 +1,76 @@
+"""Microbenchmark do formato das mensagens: bytes no fio e CPU por mensagem.
+
+Compara json (biblioteca padrão) com os codecs de app.codec em dois cenários
+por mensagem que atravessa o pipeline (API, entrada, validação):
+  - recodificando: cada estágio decodifica e volta a codificar para encaminhar
+  - repassando: cada estágio decodifica uma vez e encaminha os bytes originais
+
+Uso: python -m benchmarks.bench_codec [--mensagens N] [--estagios 3]
+"""
+import argparse
+import json
+import time
+from uuid import UUID, uuid4
+from app import codec
+
+
+class CodecJsonPadrao:
+    content_type = "json (stdlib)"
+
+    @staticmethod
+    def codificar(dados):
+        return json.dumps(dados).encode()
+
+    @staticmethod
+    def decodificar(corpo):
+        return json.loads(corpo.decode())
+
+
+def gerar_mensagens(quantidade):
+    return [
+        {
+            "traceId": str(uuid4()),
+            "mensagemId": str(uuid4()),
+            "conteudoMensagem": f"Seu pedido {indice} foi enviado e chega amanhã",
+            "tipoNotificacao": ("EMAIL", "SMS", "PUSH")[indice % 3]
+        }
+        for indice in range(quantidade)
+    ]
+
+
+def medir(codec_mensagem, mensagens, estagios, repassar):
+    inicio = time.perf_counter()
+    for dados in mensagens:
+        corpo = codec_mensagem.codificar(dados)
+        for _ in range(estagios):
+            recebido = codec_mensagem.decodificar(corpo)
+            UUID(recebido["traceId"])
+            if not repassar:
+                corpo = codec_mensagem.codificar(recebido)
+    return (time.perf_counter() - inicio) / len(mensagens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mensagens", type=int, default=50000)
+    parser.add_argument("--estagios", type=int, default=3, help="saltos consumidos por mensagem")
+    args = parser.parse_args()
+
+    mensagens = gerar_mensagens(args.mensagens)
+    codecs = [CodecJsonPadrao] + list(codec.CODECS.values())
+    if codec.orjson is None:
+        print("orjson não instalado: application/json usa o módulo json")
+    if codec.msgpack is None:
+        print("msgpack não instalado: application/msgpack fora da comparação")
+
+    print(f"{'codec':<22} {'bytes/msg':>10} {'recodificando (µs)':>20} {'repassando (µs)':>17}")
+    for codec_mensagem in codecs:
+        tamanho = sum(len(codec_mensagem.codificar(dados)) for dados in mensagens) / len(mensagens)
+        recodificando = medir(codec_mensagem, mensagens, args.estagios, repassar=False)
+        repassando = medir(codec_mensagem, mensagens, args.estagios, repassar=True)
+        print(f"{codec_mensagem.content_type:<22} {tamanho:>10.1f} "
+              f"{recodificando * 1e6:>20.2f} {repassando * 1e6:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
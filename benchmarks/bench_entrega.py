@@ -0,0 +1,124 @@
+"""Vazão dos adaptadores de entrega contra provedores locais (SMTP e gateway HTTP).
+
+Workers concorrentes, como os de um estágio de validação, entregam as
+mensagens de três formas:
+  - conexão por mensagem: abre e fecha uma conexão com o provedor a cada envio
+  - pool: conexões persistentes do adaptador, uma mensagem por envio
+  - pool + lotes: AgrupadorEntregas juntando mensagens dentro da janela
+
+O atraso simula a latência do provedor: por mensagem no SMTP (o DATA de cada
+mensagem espera) e por requisição no gateway HTTP (um lote custa um atraso).
+
+Uso: python -m benchmarks.bench_entrega [--mensagens 2000] [--workers 32] [--atraso-ms 2]
+"""
+import argparse
+import http.client
+import json
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from app.entrega import AdaptadorHttp, AdaptadorSmtp, AgrupadorEntregas
+from app.provedores_locais import HttpLocal, SmtpLocal
+
+
+def gerar_mensagens(quantidade, tipo, destinatario):
+    return [
+        {
+            "traceId": str(uuid4()),
+            "mensagemId": str(uuid4()),
+            "conteudoMensagem": f"Seu pedido {indice} foi enviado e chega amanhã",
+            "tipoNotificacao": tipo,
+            "destinatario": destinatario
+        }
+        for indice in range(quantidade)
+    ]
+
+
+def smtp_por_mensagem(porta):
+    adaptador = AdaptadorSmtp("127.0.0.1", porta)
+
+    def enviar(dados):
+        with smtplib.SMTP("127.0.0.1", porta) as sessao:
+            return not sessao.send_message(adaptador._mensagem(dados))
+    return enviar
+
+
+def http_por_mensagem(gateway):
+    adaptador = AdaptadorHttp(gateway.url)
+
+    def enviar(dados):
+        conexao = http.client.HTTPConnection("127.0.0.1", gateway.porta)
+        try:
+            conexao.request("POST", adaptador.caminho, body=adaptador._corpo([dados]),
+                            headers={"Content-Type": "application/json"})
+            resposta = conexao.getresponse()
+            return json.loads(resposta.read())["resultados"][0]["sucesso"]
+        finally:
+            conexao.close()
+    return enviar
+
+
+def medir(enviar, mensagens, workers):
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        resultados = list(executor.map(enviar, mensagens))
+    duracao = time.perf_counter() - inicio
+    assert all(resultados), "provedor local recusou mensagens"
+    return len(mensagens) / duracao
+
+
+def comparar(nome, provedor, por_mensagem, criar_adaptador, mensagens, args):
+    print(f"\n{nome} (atraso {args.atraso_ms} ms, {args.workers} workers, {args.conexoes} conexões)")
+    print(f"{'modo':<24} {'msgs/s':>10} {'conexões':>10} {'lotes':>8}")
+
+    def relatar(modo, vazao, lotes="-"):
+        print(f"{modo:<24} {vazao:>10.0f} {provedor.conexoes:>10} {lotes:>8}")
+        provedor.conexoes = 0
+
+    relatar("conexão por mensagem", medir(por_mensagem, mensagens, args.workers))
+
+    adaptador = criar_adaptador()
+    try:
+        relatar("pool", medir(lambda dados: adaptador.enviar_lote([dados])[0], mensagens, args.workers))
+    finally:
+        adaptador.fechar()
+
+    agrupador = AgrupadorEntregas(criar_adaptador(), janela=args.janela_ms / 1000,
+                                  tamanho_lote=args.lote, concorrencia=args.conexoes)
+    lotes_antes = sum(agrupador._tamanhos.contagens)
+    try:
+        vazao = medir(lambda dados: agrupador.submeter(dados).result(), mensagens, args.workers)
+    finally:
+        agrupador.fechar()
+    relatar("pool + lotes", vazao, sum(agrupador._tamanhos.contagens) - lotes_antes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mensagens", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32, help="threads enviando, como os workers do estágio")
+    parser.add_argument("--conexoes", type=int, default=4, help="conexões (e lotes simultâneos) por provedor")
+    parser.add_argument("--lote", type=int, default=50)
+    parser.add_argument("--janela-ms", type=float, default=5)
+    parser.add_argument("--atraso-ms", type=float, default=2, help="latência simulada do provedor")
+    args = parser.parse_args()
+    atraso = args.atraso_ms / 1000
+
+    with SmtpLocal(atraso=atraso) as smtp:
+        comparar(
+            "SMTP (EMAIL)", smtp, smtp_por_mensagem(smtp.porta),
+            lambda: AdaptadorSmtp("127.0.0.1", smtp.porta, conexoes=args.conexoes),
+            gerar_mensagens(args.mensagens, "EMAIL", "cliente@exemplo.com"), args
+        )
+
+    with HttpLocal(atraso=atraso) as gateway:
+        comparar(
+            "Gateway HTTP (SMS)", gateway, http_por_mensagem(gateway),
+            lambda: AdaptadorHttp(gateway.url, conexoes=args.conexoes, nome="http-sms"),
+            gerar_mensagens(args.mensagens, "SMS", "+5511999999999"), args
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Carga HTTP na API Flask (WSGI) e no front end ASGI, com os mesmos núcleos.
+
+Cada servidor roda em --nucleos processos presos (sched_setaffinity) aos mesmos
+núcleos e escutando na mesma porta (SO_REUSEPORT), sobre o broker em memória
+com --latencia-broker-ms de ida e volta até o ack de cada publicação (com
+mais de um processo, o status fica no backend sqlite):
+  - flask: servidor WSGI do werkzeug, uma thread por requisição, publicando
+    pelo PoolPublicacao
+  - asgi: app.asgi no uvicorn (requer uvicorn), publicando pelo
+    PublicadorAssincrono
+
+O gerador de carga (asyncio, conexões keep-alive, nos núcleos restantes)
+mantém --conexoes requisições em andamento: primeiro POST /api/notificar
+(?aguardarConfirmacao=true por padrão), depois GET /api/notificacao/status/<id>
+com os traceIds aceitos. Reporta requisições/s, p50/p99/p99.9 e erros.
+
+Uso: python -m benchmarks.bench_http [--nucleos 1] [--conexoes 64] [--duracao 5] [--servidores flask,asgi]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from uuid import uuid4
+
+SERVIDORES = ("flask", "asgi")
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def em_ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def abrir_socket(porta):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("127.0.0.1", porta))
+    sock.listen(1024)
+    return sock
+
+
+def servir(servidor, porta, nucleos, latencia_broker, status_sqlite):
+    """Corpo de cada processo servidor (contexto spawn: o ambiente vale antes do import do app)"""
+    os.sched_setaffinity(0, nucleos)
+    os.environ.update(TRANSPORTE="memoria", API_CONSUMIDORES="0")
+    if status_sqlite:
+        os.environ.update(STATUS_BACKEND="sqlite", STATUS_SQLITE_CAMINHO=status_sqlite)
+    else:
+        os.environ["STATUS_BACKEND"] = "memoria"
+    from app.broker_memoria import BrokerMemoria
+    from app.rabbitmq import RabbitMQConnection
+    RabbitMQConnection.configurar_transporte(BrokerMemoria(registrar_latencias=False,
+                                                           atraso_confirmacao=latencia_broker))
+    sock = abrir_socket(porta)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    if servidor == "flask":
+        from werkzeug.serving import make_server
+        from app.app import app
+        make_server("127.0.0.1", porta, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        import uvicorn
+        from app.asgi import app
+        uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False)).run(sockets=[sock])
+
+
+async def ler_resposta(reader):
+    cabecalho = await reader.readuntil(b"\r\n\r\n")
+    linhas = cabecalho.decode("latin-1").split("\r\n")
+    status = int(linhas[0].split(" ", 2)[1])
+    headers = {}
+    for linha in linhas[1:]:
+        if ":" in linha:
+            nome, valor = linha.split(":", 1)
+            headers[nome.strip().lower()] = valor.strip()
+    corpo = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, corpo
+
+
+async def gerar_carga(porta, conexoes, duracao, proxima_requisicao):
+    """Mantém conexoes requisições em andamento por duracao segundos; devolve (latências, erros, respostas)"""
+    latencias = []
+    erros = [0]
+    respostas = []
+    fim = time.monotonic() + duracao
+
+    async def conexao():
+        reader = writer = None
+        while time.monotonic() < fim:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+            metodo, caminho, corpo = proxima_requisicao()
+            requisicao = (
+                f"{metodo} {caminho} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(corpo)}\r\n\r\n"
+            ).encode() + corpo
+            inicio = time.perf_counter()
+            try:
+                writer.write(requisicao)
+                status, headers, resposta = await ler_resposta(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                erros[0] += 1
+                writer = None
+                continue
+            latencias.append(time.perf_counter() - inicio)
+            if status >= 400:
+                erros[0] += 1
+            else:
+                respostas.append(resposta)
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(conexao() for _ in range(conexoes)))
+    return latencias, erros[0], respostas
+
+
+def resumir(latencias, erros, duracao):
+    return {
+        "requisicoes_s": round(len(latencias) / duracao),
+        "p50_ms": em_ms(percentil(latencias, 0.5)),
+        "p99_ms": em_ms(percentil(latencias, 0.99)),
+        "p999_ms": em_ms(percentil(latencias, 0.999)),
+        "erros": erros
+    }
+
+
+def aguardar_servidor(porta, timeout=30):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection(("127.0.0.1", porta), timeout=1) as sock:
+                sock.sendall(b"GET /health HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+                if sock.recv(64).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Servidor não respondeu em {timeout}s")
+
+
+def medir(servidor, args, nucleos_servidor):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        porta = sock.getsockname()[1]
+    # Com vários processos o status precisa ser compartilhado, como em produção
+    status_sqlite = os.path.join(tempfile.mkdtemp(), "status.db") if args.nucleos > 1 else None
+    contexto = multiprocessing.get_context("spawn")
+    processos = [
+        contexto.Process(target=servir, daemon=True, args=(
+            servidor, porta, nucleos_servidor, args.latencia_broker_ms / 1000, status_sqlite
+        ))
+        for _ in range(args.nucleos)
+    ]
+    for processo in processos:
+        processo.start()
+    try:
+        aguardar_servidor(porta)
+        query = "?aguardarConfirmacao=true" if args.aguardar_confirmacao else ""
+        tipos = ("EMAIL", "SMS", "PUSH")
+
+        def notificacao():
+            corpo = {"conteudoMensagem": "bench", "tipoNotificacao": tipos[int(time.monotonic() * 1000) % 3]}
+            return "POST", f"/api/notificar{query}", json.dumps(corpo).encode()
+
+        latencias, erros, respostas = asyncio.run(gerar_carga(porta, args.conexoes, args.duracao, notificacao))
+        resultado = {"notificar": resumir(latencias, erros, args.duracao)}
+
+        trace_ids = [json.loads(resposta)["traceId"] for resposta in respostas] or [str(uuid4())]
+        indice = [0]
+
+        def consulta():
+            indice[0] += 1
+            return "GET", f"/api/notificacao/status/{trace_ids[indice[0] % len(trace_ids)]}", b""
+
+        latencias, erros, _ = asyncio.run(gerar_carga(porta, args.conexoes, args.duracao, consulta))
+        resultado["status"] = resumir(latencias, erros, args.duracao)
+        return resultado
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nucleos", type=int, default=1, help="núcleos (e processos) de cada servidor")
+    parser.add_argument("--conexoes", type=int, default=64, help="requisições simultâneas")
+    parser.add_argument("--duracao", type=float, default=5, help="segundos de carga por endpoint")
+    parser.add_argument("--latencia-broker-ms", type=float, default=2, help="ida e volta até o ack do broker")
+    parser.add_argument("--aguardar-confirmacao", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--servidores", default=",".join(SERVIDORES))
+    parser.add_argument("--json", action="store_true", help="saída em JSON (para CI)")
+    args = parser.parse_args()
+
+    disponiveis = sorted(os.sched_getaffinity(0))
+    if args.nucleos > len(disponiveis):
+        parser.error(f"só há {len(disponiveis)} núcleos disponíveis")
+    nucleos_servidor = set(disponiveis[:args.nucleos])
+    # O gerador de carga fica nos núcleos restantes, quando houver
+    os.sched_setaffinity(0, set(disponiveis[args.nucleos:]) or set(disponiveis))
+
+    resultados = {}
+    for servidor in args.servidores.split(","):
+        if servidor not in SERVIDORES:
+            parser.error(f"servidor desconhecido: {servidor}")
+        if servidor == "asgi":
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                parser.error("o servidor asgi requer uvicorn (pip install uvicorn)")
+        resultados[servidor] = medir(servidor, args, nucleos_servidor)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{args.nucleos} núcleo(s), {args.conexoes} conexões, {args.duracao}s por endpoint, "
+          f"broker a {args.latencia_broker_ms} ms")
+    for servidor, por_endpoint in resultados.items():
+        for endpoint, resumo in por_endpoint.items():
+            print(f"{servidor:6} {endpoint:9} {resumo['requisicoes_s']:7} req/s  p50 {resumo['p50_ms']} ms  "
+                  f"p99 {resumo['p99_ms']} ms  p99.9 {resumo['p999_ms']} ms  erros {resumo['erros']}")
+
+
+if __name__ == "__main__":
+    main()
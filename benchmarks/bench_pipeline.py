@@ -0,0 +1,173 @@
+"""Benchmark ponta a ponta do pipeline sobre o broker em memória.
+
+Envia notificações por POST /api/notificar a uma taxa fixa, roda os quatro
+estágios (processador_*) sobre o BrokerMemoria e reporta vazão, latência
+ponta a ponta (p50/p99) e, por fila, tempo de espera e de processamento.
+
+Uso: python -m benchmarks.bench_pipeline --taxa 200 --duracao 5 [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from uuid import UUID
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def em_ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def configurar_ambiente(args):
+    """Precisa rodar antes de importar o app: config.py lê o ambiente no import"""
+    os.environ["TRANSPORTE"] = "memoria"
+    os.environ["STATUS_BACKEND"] = "memoria"
+    os.environ["ESCALA_ATRASO_SIMULADO"] = str(args.escala_atraso)
+    os.environ["RETRY_ATRASO_BASE_MS"] = str(max(1, int(3000 * args.escala_atraso)))
+    if args.workers:
+        for estagio in ("ENTRADA", "RETRY", "VALIDACAO"):
+            os.environ[f"{estagio}_WORKERS"] = str(args.workers)
+
+
+def executar(args):
+    configurar_ambiente(args)
+    from app.app import app
+    from app.consumers import executar_estagio, consultar_status, ESTAGIOS
+    from app.rabbitmq import RabbitMQConnection
+    from app.status_store import STATUS_FINAIS, CODIGO_POR_STATUS
+
+    finais = {status for status, codigo in CODIGO_POR_STATUS.items() if codigo in STATUS_FINAIS}
+    broker = RabbitMQConnection._transporte
+    parar = threading.Event()
+    estagios = [
+        threading.Thread(target=executar_estagio, args=(estagio, parar), daemon=True)
+        for estagio in ESTAGIOS
+    ]
+    for thread in estagios:
+        thread.start()
+
+    enviados = {}
+    latencias_api = []
+    erros_api = [0]
+    lock = threading.Lock()
+    total = int(args.taxa * args.duracao)
+    por_cliente = total // args.clientes
+    intervalo = args.clientes / args.taxa
+    inicio = time.monotonic() + 0.5
+
+    def cliente(indice):
+        client = app.test_client()
+        for n in range(por_cliente):
+            alvo = inicio + n * intervalo + indice * intervalo / args.clientes
+            espera = alvo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            antes = time.monotonic()
+            response = client.post("/api/notificar", json={
+                "conteudoMensagem": f"bench {indice}-{n}",
+                "tipoNotificacao": ("EMAIL", "SMS", "PUSH")[n % 3]
+            })
+            depois = time.monotonic()
+            with lock:
+                if response.status_code == 202:
+                    enviados[response.get_json()["traceId"]] = antes
+                    latencias_api.append(depois - antes)
+                else:
+                    erros_api[0] += 1
+
+    clientes = [threading.Thread(target=cliente, args=(indice,)) for indice in range(args.clientes)]
+    for thread in clientes:
+        thread.start()
+
+    concluidos = {}
+    status_finais = {}
+    limite = inicio + args.duracao + args.drenagem
+    while time.monotonic() < limite:
+        with lock:
+            pendentes = [(trace_id, t) for trace_id, t in enviados.items() if trace_id not in concluidos]
+        for trace_id, enviado_em in pendentes:
+            dados = consultar_status(UUID(trace_id))
+            if dados is not None and dados["status"] in finais:
+                concluidos[trace_id] = time.monotonic() - enviado_em
+                status_finais[dados["status"]] = status_finais.get(dados["status"], 0) + 1
+        if not any(thread.is_alive() for thread in clientes) and len(concluidos) == len(enviados):
+            break
+        time.sleep(0.005)
+    duracao = time.monotonic() - inicio
+
+    parar.set()
+    broker.derrubar()
+
+    filas = {}
+    for nome, estatisticas in sorted(broker.estatisticas.items()):
+        if not estatisticas.publicadas:
+            continue
+        filas[nome] = {
+            "publicadas": estatisticas.publicadas,
+            "confirmadas": estatisticas.confirmadas,
+            "expiradas": estatisticas.expiradas,
+            "esperaP50Ms": em_ms(percentil(estatisticas.espera, 0.5)),
+            "esperaP99Ms": em_ms(percentil(estatisticas.espera, 0.99)),
+            "processamentoP50Ms": em_ms(percentil(estatisticas.processamento, 0.5)),
+            "processamentoP99Ms": em_ms(percentil(estatisticas.processamento, 0.99)),
+        }
+
+    latencias = list(concluidos.values())
+    return {
+        "enviadas": len(enviados),
+        "errosApi": erros_api[0],
+        "concluidas": len(concluidos),
+        "statusFinais": status_finais,
+        "duracaoS": round(duracao, 2),
+        "mensagensPorSegundo": round(len(concluidos) / duracao, 1),
+        "apiP50Ms": em_ms(percentil(latencias_api, 0.5)),
+        "apiP99Ms": em_ms(percentil(latencias_api, 0.99)),
+        "pontaAPontaP50Ms": em_ms(percentil(latencias, 0.5)),
+        "pontaAPontaP99Ms": em_ms(percentil(latencias, 0.99)),
+        "filas": filas,
+    }
+
+
+def imprimir(resultado):
+    print(f"enviadas={resultado['enviadas']} concluídas={resultado['concluidas']} "
+          f"erros API={resultado['errosApi']} em {resultado['duracaoS']}s")
+    print(f"vazão: {resultado['mensagensPorSegundo']} msg/s  status finais: {resultado['statusFinais']}")
+    print(f"API: p50={resultado['apiP50Ms']}ms p99={resultado['apiP99Ms']}ms")
+    print(f"ponta a ponta: p50={resultado['pontaAPontaP50Ms']}ms p99={resultado['pontaAPontaP99Ms']}ms")
+    print(f"\n{'fila':<48} {'publ.':>6} {'espera p50/p99 (ms)':>22} {'proc. p50/p99 (ms)':>22}")
+    for nome, fila in resultado["filas"].items():
+        espera = f"{fila['esperaP50Ms']}/{fila['esperaP99Ms']}"
+        processamento = f"{fila['processamentoP50Ms']}/{fila['processamentoP99Ms']}"
+        print(f"{nome:<48} {fila['publicadas']:>6} {espera:>22} {processamento:>22}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taxa", type=float, default=200, help="notificações por segundo")
+    parser.add_argument("--duracao", type=float, default=5, help="segundos de envio")
+    parser.add_argument("--clientes", type=int, default=4, help="threads enviando para a API")
+    parser.add_argument("--escala-atraso", type=float, default=0.01,
+                        help="multiplicador dos atrasos simulados e do backoff de retry")
+    parser.add_argument("--workers", type=int, default=0, help="workers por estágio (0 = config)")
+    parser.add_argument("--drenagem", type=float, default=30, help="segundos extras para concluir")
+    parser.add_argument("--json", action="store_true", help="saída em JSON (para CI)")
+    args = parser.parse_args()
+
+    resultado = executar(args)
+    if args.json:
+        json.dump(resultado, sys.stdout, indent=2)
+        print()
+    else:
+        imprimir(resultado)
+
+
+if __name__ == "__main__":
+    main()
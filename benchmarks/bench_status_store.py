@@ -0,0 +1,55 @@
+"""Microbenchmark de atualizações concorrentes no StatusStore.
+
+Uso: python -m benchmarks.bench_status_store [--atualizacoes N] [--fragmentos 1,16]
+"""
+import argparse
+import threading
+import time
+from uuid import uuid4
+from app.status_store import StatusStore
+
+SEQUENCIA = ["RECEBIDO", "PROCESSADO_INTERMEDIARIO", "ENVIADO_SUCESSO"]
+
+
+def medir(fragmentos, escritores, atualizacoes):
+    store = StatusStore(max_entradas=10 ** 7, fragmentos=fragmentos)
+    dados = {"mensagemId": str(uuid4()), "conteudoMensagem": "x", "tipoNotificacao": "SMS"}
+    por_escritor = atualizacoes // escritores
+    trace_ids = [[uuid4() for _ in range(por_escritor // len(SEQUENCIA))] for _ in range(escritores)]
+    barreira = threading.Barrier(escritores + 1)
+
+    def escrever(ids):
+        barreira.wait()
+        for trace_id in ids:
+            for status in SEQUENCIA:
+                store.atualizar(trace_id, status, dados)
+
+    threads = [threading.Thread(target=escrever, args=(ids,)) for ids in trace_ids]
+    for thread in threads:
+        thread.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    total = sum(len(ids) for ids in trace_ids) * len(SEQUENCIA)
+    return total / duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--atualizacoes", type=int, default=300000)
+    parser.add_argument("--escritores", default="1,2,4,8,16")
+    parser.add_argument("--fragmentos", default="1,16")
+    args = parser.parse_args()
+
+    print(f"{'fragmentos':>10} {'escritores':>10} {'atualizações/s':>16}")
+    for fragmentos in map(int, args.fragmentos.split(",")):
+        for escritores in map(int, args.escritores.split(",")):
+            taxa = medir(fragmentos, escritores, args.atualizacoes)
+            print(f"{fragmentos:>10} {escritores:>10} {taxa:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()